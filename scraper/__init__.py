@@ -1,5 +1,7 @@
 # import scraper.apis
 import scraper.parsing
+import scraper.endpoints
+import scraper.cassettes
 from enum import Enum
 
 from ._version import get_versions
@@ -8,3 +10,4 @@ del get_versions
 
 class Constants(Enum):
     DOWNLOAD_DIR = '/home/user/Downloads'
+    CACHE_DIR = '/home/user/.cache/citation-scraper'
@@ -1,29 +1,80 @@
 import bs4
+import logging
 import requests
-import re
+from scraper.base_classes.identifiers import dedupe_by_doi
+from scraper.parsing import iter_hrefs
 
-def scrape_url_for_refs(url, outfile=None):
+logger = logging.getLogger()
+
+CHUNK_SIZE = 64 * 1024
+
+def iter_ref_links(url, streaming=True):
+    """iter_ref_links.
+    Yields the hrefs in the passed URL's page which contain DOI or ArXiv IDs, in page order
+
+    :param url: URL to scrape for DOIs and ArXiv IDs
+    :param streaming: (Optional) Parse the page as it downloads with `scraper.parsing.iter_hrefs`, without building a tree (default).  If False, the page is parsed into a BeautifulSoup tree.
+    """
+    if streaming:
+        with requests.get(url, stream=True) as page:
+            yield from iter_hrefs(page.iter_content(CHUNK_SIZE))
+        return
+    page = requests.get(url)
+    parsed_page = bs4.BeautifulSoup(page.content, features="lxml")
+    for link in parsed_page.find_all('a', href=True):
+        href = link['href']
+        if 'arxiv' in href or 'doi' in href:
+            yield href
+
+def scrape_url_for_refs(url, outfile=None, sink=None, dedupe=False, seen=None):
     """scrape_url_for_refs.
     Gets a list of hrefs from the passed URL containing DOI or ArXiv IDs
 
     :param url: URL to scrape for DOIs and ArXiv IDs
-    :param outfile: File to write results to.  If none is provided, results are printed to stdout
+    :param outfile: File to write results to.  If none is provided, results are returned
+    :param sink: (Optional) `scraper.logger.JsonLinesSink` (or anything with a `write` method) to stream results to, one {'source_url', 'href'} record per reference as it is found.  Returns the number of references written.
+    :param dedupe: (Optional) Keep only the first link to each DOI (see `scraper.base_classes.identifiers.dedupe_by_doi`).  Records written to `sink` then include the canonical 'doi'.
+    :param seen: (Optional) Set of DOIs already seen, to dedupe across pages
 
     >>> sorted(scrape_url_for_refs('https://en.wikipedia.org/wiki/Orchestrated_objective_reduction'))
     ['//arxiv.org/abs/quant-ph/0005025', '//arxiv.org/abs/quant-ph/9907009', '//citeseerx.ist.psu.edu/viewdoc/summary?doi=10.1.1.130.7027', 'https://doi.org/10.1002%2Fglia.440060207', 'https://doi.org/10.1007%2F3-540-36723-3', 'https://doi.org/10.1007%2Fbf02478259', 'https://doi.org/10.1007%2Fs10701-013-9770-0', 'https://doi.org/10.1007%2Fs10701-013-9770-0', 'https://doi.org/10.1007%2Fs10867-009-9148-x', 'https://doi.org/10.1016%2F0022-5193%2882%2990137-0', 'https://doi.org/10.1016%2FS0896-6273%2804%2900043-1', 'https://doi.org/10.1016%2Fj.cell.2006.12.009', 'https://doi.org/10.1016%2Fj.plrev.2012.07.001', 'https://doi.org/10.1016%2Fj.plrev.2013.08.002', 'https://doi.org/10.1016%2Fj.plrev.2013.08.002', 'https://doi.org/10.1016%2Fj.plrev.2013.11.003', 'https://doi.org/10.1016%2Fj.plrev.2013.11.013', 'https://doi.org/10.1016%2Fj.plrev.2013.11.014', 'https://doi.org/10.1017%2Fs0031819100024591', 'https://doi.org/10.1017%2Fs0140525x00080687', 'https://doi.org/10.1038%2F440611a', 'https://doi.org/10.1063%2F1.4752474', 'https://doi.org/10.1073%2Fpnas.0806273106', 'https://doi.org/10.1073%2Fpnas.89.23.11357', 'https://doi.org/10.1073%2Fpnas.96.13.7541', 'https://doi.org/10.1083%2Fjcb.127.6.1965', 'https://doi.org/10.1097%2F00000542-200608000-00024', 'https://doi.org/10.1098%2Frsta.1998.0254', 'https://doi.org/10.1103%2FPhysRevE.61.4194', 'https://doi.org/10.1103%2FPhysRevE.65.061901', 'https://doi.org/10.1103%2FPhysRevE.80.021912', 'https://doi.org/10.1113%2Fjphysiol.1952.sp004764', 'https://doi.org/10.11225%2Fjcss.5.2_95', 'https://doi.org/10.1142%2FS0129065796000300', 'https://doi.org/10.1207%2Fs15516709cog0000_59', 'https://doi.org/10.1207%2Fs15516709cog0000_59', 'https://doi.org/10.1523%2Fjneurosci.14-05-02818.1994', 'https://doi.org/10.1523%2Fjneurosci.14-05-02818.1994', 'https://doi.org/10.3389%2Ffnint.2012.00093']
     """
-    page = requests.get(url)
-    parsed_page = bs4.BeautifulSoup(page.content, features="lxml")
-    links = parsed_page.findAll('a', attrs={'href': re.compile('')})
-    doc_links = [href for link in links
-                 if 'arxiv' in (href := link.get('href'))
-                 or 'doi' in href]
+    links = iter_ref_links(url)
+    found = dedupe_by_doi(links, seen) if dedupe else ((href, None) for href in links)
+    if sink is not None:
+        count = 0
+        for href, doi in found:
+            sink.write({'source_url': url, 'href': href, **({'doi': doi} if dedupe else {})})
+            count += 1
+        return count
+    links = (href for href, _ in found)
     if outfile is not None:
         with open(outfile, "w+") as fout:
-            lines = ['source_url:{}\n'.format(url), *map(lambda l: l + '\n', doc_links)]
-            fout.writelines(lines)
+            fout.write('source_url:{}\n'.format(url))
+            fout.writelines(href + '\n' for href in links)
     else:
-        return doc_links
+        return list(links)
+
+def crawl_for_refs(urls, sink, dedupe=False):
+    """crawl_for_refs.
+    Streams the DOI and ArXiv links of many pages to a sink, one page at a time.  Pages which fail to load are logged and skipped.
+    Returns the number of references written.
+
+    :param urls: Iterable of URLs to scrape
+    :param sink: `scraper.logger.JsonLinesSink` to write {'source_url', 'href'} records to
+    :param dedupe: (Optional) Write only the first link to each DOI, across all pages
+
+    >>> with JsonLinesSink('refs.jsonl') as sink:  # doctest: +SKIP
+    ...     crawl_for_refs(open('urls.txt').read().split(), sink)
+    """
+    count = 0
+    seen = set()
+    for url in urls:
+        try:
+            count += scrape_url_for_refs(url, sink=sink, dedupe=dedupe, seen=seen)
+        except requests.RequestException as e:
+            logger.warning("Could not scrape %s for references: %s", url, e)
+    return count
 
 if __name__ == "__main__":
     import doctest
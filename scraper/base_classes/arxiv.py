@@ -6,12 +6,128 @@ For local development:
 """
 
 from __future__ import annotations
-from typing import Optional, Collection
+import logging
+import re
+import threading
+import time
+from typing import Optional, Collection, Iterable, Dict, List
+import arxiv2bib
+import papis.document
 from papis.arxiv import find_arxivid_in_text, validate_arxivid
 from papis.arxiv import Importer as ImportArxiv
 from papis.arxiv import Downloader as DownloadArxiv
 from scraper.base_classes.document import Document, DocumentType
-from scraper import Constants
+from scraper.base_classes import arxiv_snapshot
+from scraper import Constants, metrics, tracing
+
+logger = logging.getLogger()
+
+# arXiv's API terms ask for no more than one request every three seconds, on a single connection
+ARXIV_DELAY = 3.0
+ARXIV_BATCH_SIZE = 100
+
+
+class _Pacer:
+    """
+    Spaces out calls made from any thread by at least `delay` seconds
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._last = 0.0
+
+    def wait(self, delay: float) -> None:
+        with self._lock:
+            if (remaining := self._last + delay - time.monotonic()) > 0:
+                time.sleep(remaining)
+            self._last = time.monotonic()
+
+
+_pacer = _Pacer()
+
+
+def _unversioned(arxiv_id: str) -> str:
+    return re.sub(r"v\d+$", "", arxiv_id)
+
+
+def _author_list(authors: List[str]) -> List[dict]:
+    return [
+        {"family": family, "given": given}
+        for given, _, family in (author.rpartition(" ") for author in authors)
+    ]
+
+
+def reference_to_data(ref: arxiv2bib.Reference) -> dict:
+    """reference_to_data.
+    Converts an arxiv2bib reference to the metadata `papis.arxiv.Importer` produces for it (which goes through
+    the reference's BibTeX), without rendering and re-parsing the BibTeX
+    """
+    entry = {
+        "ID": ref.id,
+        "ENTRYTYPE": "article",
+        "author": ref.authors,
+        "title": ref.title,
+        "eprint": ref.id,
+        "doi": ref.doi,
+        "archiveprefix": "arXiv",
+        "primaryclass": ref.category,
+        "abstract": ref.summary,
+        "year": ref.year,
+        "month": ref.month,
+        "note": ref.note,
+        "url": ref.url,
+    }
+    _k = papis.document.KeyConversionPair
+    return papis.document.keyconversion_to_data(
+        [
+            _k("ID", [{"key": "ref", "action": None}]),
+            _k("ENTRYTYPE", [{"key": "type", "action": None}]),
+            _k("author", [{"key": "author_list", "action": _author_list}]),
+        ],
+        {k: v for k, v in entry.items() if v},
+        keep_unknown_keys=True,
+    )
+
+
+def _from_snapshot(arxiv_id: str) -> Optional[dict]:
+    snapshot = arxiv_snapshot.get_active()
+    if snapshot is None:
+        return None
+    with tracing.span("arxiv.snapshot", arxiv_id=arxiv_id):
+        data = snapshot.get(arxiv_id)
+    metrics.lookups.inc(source="arxiv_snapshot", result="hit" if data else "miss")
+    return data
+
+
+def fetch_arxiv_metadata(
+    arxiv_ids: Iterable[str], batch_size: int = ARXIV_BATCH_SIZE, delay: float = ARXIV_DELAY
+) -> Dict[str, dict]:
+    """fetch_arxiv_metadata.
+    Fetches the metadata of many arXiv papers, `batch_size` IDs per API request (an `id_list` query), waiting
+    `delay` seconds between requests.  Returns the metadata by ID; IDs arXiv does not know are left out.
+
+    :param arxiv_ids: arXiv IDs, with or without versions
+    :param batch_size: (Optional) IDs per request (default = 100)
+    :param delay: (Optional) Seconds between requests (default = 3, as arXiv asks)
+
+    >>> fetch_arxiv_metadata(['1006.3140', '1701.00660'])['1006.3140']['title']  # doctest: +SKIP
+    'A convenient differential category'
+    """
+    ids = list(dict.fromkeys(arxiv_ids))
+    found = {}
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start : start + batch_size]
+        _pacer.wait(delay)
+        with tracing.span("arxiv.fetch_batch", size=len(batch)):
+            references = arxiv2bib.arxiv2bib(batch)
+        for arxiv_id, ref in zip(batch, references):
+            if isinstance(ref, arxiv2bib.ReferenceErrorInfo):
+                logger.warning("arXiv metadata not found for %s: %s", arxiv_id, ref.message)
+                metrics.lookups.inc(source="arxiv", result="miss")
+                continue
+            found[arxiv_id] = reference_to_data(ref)
+            metrics.lookups.inc(source="arxiv", result="hit")
+    return found
 
 
 class Arxiv(DocumentType):
@@ -46,9 +162,68 @@ class Arxiv(DocumentType):
         >>> arxiv_id = '1701.00660'
         >>> doc = Document(arxiv_id)
         """
-        downloader = DownloadArxiv.match(doc.doc_id)
+        # Validated IDs are bare (e.g. '1006.3140'), which the downloader only recognizes in an arXiv URL
+        downloader = DownloadArxiv.match(doc.doc_id) or DownloadArxiv.match("https://arxiv.org/abs/" + doc.doc_id)
         if downloader is None:
             raise TypeError('This document does not appear to be associated with a properly-formatted Arxiv ID')
+        prefetched = _unversioned(doc.info.get("eprint", "")) == _unversioned(downloader.arxivid)
+        if not prefetched and (data := _from_snapshot(downloader.arxivid)):
+            doc.update(data)
+            prefetched = True
+        if prefetched:
+            # Metadata was already fetched (by `Arxiv.fetch_info` or from a snapshot), so only the PDF is needed
+            with tracing.span("arxiv.fetch_files", arxiv_id=downloader.arxivid):
+                downloader.fetch_files()
+            return downloader.ctx.files
         importer = ImportArxiv(downloader.arxivid)
-        importer.fetch()
+        with tracing.span("arxiv.fetch", arxiv_id=downloader.arxivid):
+            importer.fetch()
         doc.update(importer.ctx.data)
+        return importer.ctx.files
+
+    @classmethod
+    def fetch_info(cls: Arxiv, docs: Iterable[Document], **kwargs) -> List[Document]:
+        """
+        Fills the info of many arXiv documents with batched API requests, as `Arxiv.download` would one at a time.
+        Papers in the arXiv snapshot in use (if any) are taken from it instead.
+        Documents whose metadata is fetched this way only have their PDFs downloaded by `Arxiv.download`.
+        Returns the documents arXiv had no metadata for.
+
+        :param docs: Documents of type Arxiv
+        :param kwargs: Passed to `fetch_arxiv_metadata` (batch_size, delay)
+
+        >>> docs = [Document(i) for i in arxiv_ids]  # doctest: +SKIP
+        >>> Arxiv.fetch_info(docs)
+        []
+        """
+        docs = list(docs)
+        found = {}
+        for doc in docs:
+            if data := _from_snapshot(doc.doc_id):
+                found[doc.doc_id] = data
+        with metrics.track("scrape", cls):
+            found |= fetch_arxiv_metadata([doc.doc_id for doc in docs if doc.doc_id not in found], **kwargs)
+        missing = []
+        for doc in docs:
+            if doc.doc_id in found:
+                doc.update(found[doc.doc_id])
+            else:
+                missing.append(doc)
+        return missing
+
+
+def prefetch_info(docs: Collection[Document]) -> bool:
+    """prefetch_info.
+    Fills the info of arXiv documents ahead of downloading them, with `Arxiv.fetch_info`.  Failures are logged rather
+    than raised, since downloading falls back to fetching each paper's metadata.  Returns whether the fetch succeeded.
+
+    :param docs: Documents of type Arxiv
+    """
+    if not docs:
+        return False
+    try:
+        Arxiv.fetch_info(docs)
+    except Exception as e:
+        logger.warning("Failed to fetch arXiv metadata for %d documents.  Exception: %s", len(docs), e)
+        return False
+    return True
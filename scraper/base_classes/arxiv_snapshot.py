@@ -0,0 +1,232 @@
+"""Offline arXiv metadata, served from a bulk snapshot
+
+arXiv publishes its metadata as one JSON Lines file (the Kaggle "arxiv-metadata-oai-snapshot.json", several GB), one
+paper per line.  `ArxivSnapshot` indexes it once into a sorted table of (ID, offset) records, saved next to the
+snapshot as <snapshot>.idx, and memory-maps both files: a lookup is a binary search of the index, one seek into
+the snapshot and one JSON decode.  The index is rebuilt when the snapshot changes.
+
+While a snapshot is in use (`use_snapshot`, or SCRAPER_ARXIV_SNAPSHOT in the environment), `Arxiv.download` and
+`Arxiv.fetch_info` take metadata from it and only query the arXiv API for papers newer than the snapshot.
+
+    $ python -m scraper.base_classes.arxiv_snapshot arxiv-metadata-oai-snapshot.json   # build the index
+"""
+
+from __future__ import annotations
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+from typing import Optional, Iterator, Tuple
+import papis.document
+
+logger = logging.getLogger()
+
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# Index layout: header (magic, record count, snapshot size, snapshot mtime), then fixed-width records sorted by ID
+_MAGIC = b"ARXIDX01"
+_HEADER = struct.Struct("<8sQQQ")
+_ID_WIDTH = 24
+_RECORD = struct.Struct("<{}sQ".format(_ID_WIDTH))
+
+_id_field = re.compile(rb'"id"\s*:\s*"([^"]+)"')
+_version = re.compile(r"v\d+$")
+# e.g. 'Mon, 2 Apr 2007 19:18:42 GMT'
+_created = re.compile(r"\d+ (\w{3}) (\d{4})")
+
+_active = None
+
+
+def record_to_data(record: dict, arxiv_id: Optional[str] = None) -> dict:
+    """record_to_data.
+    Converts a snapshot record to the metadata `papis.arxiv.Importer` produces for the same paper
+
+    :param record: One line of the snapshot, decoded
+    :param arxiv_id: (Optional) ID the paper was looked up by.  If it has a version, so does `eprint`; otherwise
+        `eprint` has the latest version, as from the arXiv API
+
+    >>> record_to_data({'id': '1006.3140', 'title': 'A\\n  convenient category', 'authors_parsed': [['Blute', 'R. F.', '']],
+    ...     'categories': 'math.CT cs.LO', 'versions': [{'version': 'v1', 'created': 'Wed, 16 Jun 2010 06:55:21 GMT'}]})
+    ... # doctest: +NORMALIZE_WHITESPACE
+    {'ref': '1006.3140v1', 'type': 'article', 'author_list': [{'family': 'Blute', 'given': 'R. F.'}],
+     'title': 'A convenient category', 'eprint': '1006.3140v1', 'archiveprefix': 'arXiv', 'primaryclass': 'math.CT',
+     'year': '2010', 'month': 'Jun', 'url': 'http://arxiv.org/abs/1006.3140v1', 'author': 'Blute, R. F.'}
+    """
+    versions = record.get("versions") or [{}]
+    versioned = arxiv_id if arxiv_id and _version.search(arxiv_id) else record["id"] + versions[-1].get("version", "")
+    published = _created.search(versions[0].get("created", ""))
+    data = {
+        "ref": versioned,
+        "type": "article",
+        "author_list": [
+            {"family": " ".join(filter(None, (family, suffix))), "given": given}
+            for family, given, suffix, *_ in record.get("authors_parsed") or []
+        ],
+        "title": " ".join((record.get("title") or "").split()),
+        "eprint": versioned,
+        "doi": record.get("doi"),
+        "archiveprefix": "arXiv",
+        "primaryclass": (record.get("categories") or "").split(" ")[0],
+        "abstract": (record.get("abstract") or "").strip(),
+        "year": published.group(2) if published else None,
+        "month": published.group(1) if published and published.group(1) in MONTHS else None,
+        "note": record.get("journal-ref"),
+        "url": "http://arxiv.org/abs/" + versioned,
+    }
+    data = {k: v for k, v in data.items() if v}
+    if "author_list" in data:
+        data["author"] = papis.document.author_list_to_author(data)
+    return data
+
+
+def _scan(path: str) -> Iterator[Tuple[bytes, int]]:
+    with open(path, "rb") as fptr:
+        offset = 0
+        for line in fptr:
+            found = _id_field.search(line)
+            if found:
+                yield found.group(1), offset
+            elif line.strip():
+                yield json.loads(line)["id"].encode("utf-8"), offset
+            offset += len(line)
+
+
+def build_index(snapshot_path: str, index_path: Optional[str] = None) -> str:
+    """build_index.
+    Indexes a snapshot by ID.  Returns the path of the index.
+
+    :param snapshot_path: Path of the JSON Lines snapshot
+    :param index_path: (Optional) Path of the index (default = snapshot_path + ".idx")
+    """
+    index_path = index_path or snapshot_path + ".idx"
+    stat = os.stat(snapshot_path)
+    records = []
+    for arxiv_id, offset in _scan(snapshot_path):
+        if len(arxiv_id) > _ID_WIDTH:
+            logger.warning("Skipping arXiv ID longer than %d bytes: %s", _ID_WIDTH, arxiv_id)
+            continue
+        records.append((arxiv_id, offset))
+    records.sort()
+    tmp = index_path + ".tmp"
+    with open(tmp, "wb") as fptr:
+        fptr.write(_HEADER.pack(_MAGIC, len(records), stat.st_size, stat.st_mtime_ns))
+        for arxiv_id, offset in records:
+            fptr.write(_RECORD.pack(arxiv_id, offset))
+    os.replace(tmp, index_path)
+    logger.info("Indexed %d arXiv records from %s", len(records), snapshot_path)
+    return index_path
+
+
+def _index_is_current(snapshot_path: str, index_path: str) -> bool:
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path, "rb") as fptr:
+        header = fptr.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return False
+    magic, _, size, mtime = _HEADER.unpack(header)
+    stat = os.stat(snapshot_path)
+    return magic == _MAGIC and (size, mtime) == (stat.st_size, stat.st_mtime_ns)
+
+
+class ArxivSnapshot:
+    """
+    Read-only, memory-mapped view of an arXiv metadata snapshot and its ID index
+
+    Methods
+    =======
+    :get:
+        Returns the metadata of a paper (as `papis.arxiv.Importer` would), or None if it is not in the snapshot
+
+    :record:
+        Returns a paper's raw snapshot record, or None
+    """
+
+    def __init__(self, path: str, index_path: Optional[str] = None) -> None:
+        """
+        :param path: Path of the JSON Lines snapshot
+        :param index_path: (Optional) Path of the index (default = path + ".idx"), built if missing or out of date
+        """
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        if not _index_is_current(path, self.index_path):
+            build_index(path, self.index_path)
+        self._files = [open(path, "rb"), open(self.index_path, "rb")]
+        self._data, self._index = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) for f in self._files)
+        self._count = _HEADER.unpack_from(self._index)[1]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, arxiv_id: str) -> bool:
+        return self._offset(arxiv_id) is not None
+
+    def close(self) -> None:
+        for view in (self._data, self._index):
+            view.close()
+        for fptr in self._files:
+            fptr.close()
+
+    def __enter__(self) -> ArxivSnapshot:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _offset(self, arxiv_id: str) -> Optional[int]:
+        key = _version.sub("", arxiv_id).encode("utf-8")
+        if len(key) > _ID_WIDTH:
+            return None
+        key = key.ljust(_ID_WIDTH, b"\0")
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            start = _HEADER.size + mid * _RECORD.size
+            found = self._index[start : start + _ID_WIDTH]
+            if found < key:
+                low = mid + 1
+            elif found > key:
+                high = mid
+            else:
+                return _RECORD.unpack_from(self._index, start)[1]
+        return None
+
+    def record(self, arxiv_id: str) -> Optional[dict]:
+        offset = self._offset(arxiv_id)
+        if offset is None:
+            return None
+        end = self._data.find(b"\n", offset)
+        return json.loads(self._data[offset : end if end >= 0 else len(self._data)])
+
+    def get(self, arxiv_id: str) -> Optional[dict]:
+        record = self.record(arxiv_id)
+        return None if record is None else record_to_data(record, arxiv_id)
+
+
+def use_snapshot(path: Optional[str]) -> Optional[ArxivSnapshot]:
+    """use_snapshot.
+    Makes `Arxiv` lookups use a snapshot (or, given None, the arXiv API only again).  Returns the snapshot.
+
+    :param path: Path of the JSON Lines snapshot, or None
+    """
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = ArxivSnapshot(path) if path else None
+    return _active
+
+
+def get_active() -> Optional[ArxivSnapshot]:
+    return _active
+
+
+if os.environ.get("SCRAPER_ARXIV_SNAPSHOT") and __name__ != "__main__":
+    use_snapshot(os.environ["SCRAPER_ARXIV_SNAPSHOT"])
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print(build_index(path))
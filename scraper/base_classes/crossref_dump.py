@@ -0,0 +1,262 @@
+"""Offline Crossref metadata, served from a public data file dump
+
+Crossref's public data file is a directory of gzipped JSON Lines shards, one work (the `message` of the REST API's
+/works/DOI response) per line.  gzip streams can't be read from the middle, so `build_index` re-chunks each shard
+into independently zlib-compressed blocks of about BLOCK_SIZE bytes (<index>/<shard>.blocks) and records, for each
+DOI, the shard, the block's offset and length and the work's position in the block, in an SQLite table keyed by a
+64-bit hash of the DOI.  A lookup is one indexed SQLite read, one `pread` and the decompression of one small block.
+
+Shards are indexed in parallel, in a process pool.  Each finished shard is recorded (with its size and mtime), so an
+interrupted build resumes where it stopped and re-runs only index new or changed shards.  Malformed lines are skipped
+(and counted in the log); a shard which can't be read at all is logged and left unindexed, to be retried next build.
+
+While a dump is in use (`use_dump`, or SCRAPER_CROSSREF_DUMP in the environment), `DocumentType.scrape` takes
+Crossref records from it and only queries the Crossref API for DOIs the dump doesn't have.  Importing the module only
+opens an existing index; it is built by the command below, or by `use_dump(..., build=True)`.
+
+    $ python -m scraper.base_classes.crossref_dump DUMP_DIRECTORY [INDEX_DIRECTORY]   # build the index
+"""
+
+from __future__ import annotations
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, List, Tuple
+from scraper import Constants
+from scraper.logger import configure_worker, worker_initargs
+
+logger = logging.getLogger()
+
+BLOCK_SIZE = 64 * 1024
+DEFAULT_INDEX_DIR = "{}/crossref-index".format(Constants.CACHE_DIR.value)
+
+_active = None
+
+
+def doi_key(doi: str) -> int:
+    """doi_key.
+    Index key of a DOI: a signed 64-bit hash of the lowercased DOI (DOIs are case-insensitive)
+
+    >>> doi_key('10.1016/J.ENTCS.2012.08.017') == doi_key('10.1016/j.entcs.2012.08.017')
+    True
+    """
+    digest = hashlib.blake2b(doi.strip().lower().encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def find_shards(dump_dir: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(dump_dir, "*.jsonl.gz")))
+
+
+def _connect(index_dir: str) -> sqlite3.Connection:
+    os.makedirs(index_dir, exist_ok=True)
+    db = sqlite3.connect(os.path.join(index_dir, "index.sqlite"), check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS shards (
+            id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, size INTEGER, mtime INTEGER, done INTEGER DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS works (
+            key INTEGER PRIMARY KEY, shard INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, item INTEGER NOT NULL
+        );
+        """
+    )
+    return db
+
+
+def _index_shard(
+    shard_path: str, blocks_path: str, block_size: int = BLOCK_SIZE
+) -> Tuple[List[Tuple[int, int, int, int]], int]:
+    """
+    Re-chunks one shard into compressed blocks.  Returns a (key, offset, length, item) entry per work, and the number
+    of malformed lines skipped.
+    """
+    entries, pending, pending_keys, pending_size, offset, skipped = [], [], [], 0, 0, 0
+    with gzip.open(shard_path, "rb") as shard, open(blocks_path, "wb") as blocks:
+
+        def flush():
+            nonlocal pending, pending_keys, pending_size, offset
+            data = zlib.compress(b"\n".join(pending), 6)
+            blocks.write(data)
+            entries.extend((key, offset, len(data), item) for item, key in enumerate(pending_keys))
+            offset += len(data)
+            pending, pending_keys, pending_size = [], [], 0
+
+        for line in shard:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                key = doi_key(json.loads(line)["DOI"])
+            except (ValueError, KeyError, TypeError, AttributeError):
+                skipped += 1
+                continue
+            pending.append(line)
+            pending_keys.append(key)
+            pending_size += len(line)
+            if pending_size >= block_size:
+                flush()
+        if pending:
+            flush()
+    return entries, skipped
+
+
+def build_index(dump_dir: str, index_dir: str = DEFAULT_INDEX_DIR, workers: Optional[int] = None) -> int:
+    """build_index.
+    Indexes the shards of a dump which aren't indexed yet (or have changed since).  Returns the number of shards
+    indexed; shards which fail are logged and left for the next build.
+
+    :param dump_dir: Directory of gzipped JSON Lines shards
+    :param index_dir: (Optional) Directory for the index and the re-chunked shards (default = DEFAULT_INDEX_DIR)
+    :param workers: (Optional) Number of processes (default = number of CPUs)
+    """
+    indexed = 0
+    db = _connect(index_dir)
+    pending = {}
+    for path in find_shards(dump_dir):
+        stat = os.stat(path)
+        name = os.path.basename(path)
+        row = db.execute("SELECT id, size, mtime, done FROM shards WHERE name = ?", (name,)).fetchone()
+        if row and row[3] and (row[1], row[2]) == (stat.st_size, stat.st_mtime_ns):
+            continue
+        with db:
+            if row:
+                db.execute("DELETE FROM works WHERE shard = ?", (row[0],))
+                db.execute("UPDATE shards SET size = ?, mtime = ?, done = 0 WHERE id = ?", (stat.st_size, stat.st_mtime_ns, row[0]))
+                shard_id = row[0]
+            else:
+                shard_id = db.execute(
+                    "INSERT INTO shards (name, size, mtime) VALUES (?, ?, ?)", (name, stat.st_size, stat.st_mtime_ns)
+                ).lastrowid
+        pending[shard_id] = path
+    if not pending:
+        return 0
+    logger.info("Indexing %d Crossref shards from %s", len(pending), dump_dir)
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_worker, initargs=worker_initargs()) as pool:
+        futures = {
+            pool.submit(_index_shard, path, os.path.join(index_dir, "{}.blocks".format(shard_id))): shard_id
+            for shard_id, path in pending.items()
+        }
+        for future in as_completed(futures):
+            shard_id = futures[future]
+            try:
+                entries, skipped = future.result()
+            except Exception as e:
+                logger.warning("Failed to index %s; it will be retried.  Exception: %s", pending[shard_id], e)
+                continue
+            if skipped:
+                logger.warning("Skipped %d malformed lines in %s", skipped, pending[shard_id])
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO works (key, shard, offset, length, item) VALUES (?, ?, ?, ?, ?)",
+                    ((key, shard_id, offset, length, item) for key, offset, length, item in entries),
+                )
+                db.execute("UPDATE shards SET done = 1 WHERE id = ?", (shard_id,))
+            logger.debug("Indexed %d works from %s", len(entries), pending[shard_id])
+            indexed += 1
+    db.close()
+    return indexed
+
+
+class CrossrefDump:
+    """
+    Read-only lookups of Crossref works in an indexed dump
+
+    Methods
+    =======
+    :get:
+        Returns the Crossref record of a DOI (as `crossref.restful.Works.doi` would), or None if it isn't in the dump
+    """
+
+    def __init__(self, dump_dir: Optional[str] = None, index_dir: str = DEFAULT_INDEX_DIR, workers: Optional[int] = None) -> None:
+        """
+        :param dump_dir: (Optional) Directory of the dump's shards.  If given, shards not indexed yet are indexed first
+        :param index_dir: (Optional) Index directory (default = DEFAULT_INDEX_DIR)
+        :param workers: (Optional) Number of processes to index with
+        """
+        if dump_dir is not None:
+            build_index(dump_dir, index_dir, workers)
+        self.index_dir = index_dir
+        self._db = _connect(index_dir)
+        self._blocks = {}
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM works").fetchone()[0]
+
+    def close(self) -> None:
+        for fd in self._blocks.values():
+            os.close(fd)
+        self._blocks.clear()
+        self._db.close()
+
+    def __enter__(self) -> CrossrefDump:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _fd(self, shard: int) -> int:
+        if shard not in self._blocks:
+            self._blocks[shard] = os.open(os.path.join(self.index_dir, "{}.blocks".format(shard)), os.O_RDONLY)
+        return self._blocks[shard]
+
+    def get(self, doi: str) -> Optional[dict]:
+        row = self._db.execute("SELECT shard, offset, length, item FROM works WHERE key = ?", (doi_key(doi),)).fetchone()
+        if row is None:
+            return None
+        shard, offset, length, item = row
+        block = zlib.decompress(os.pread(self._fd(shard), length, offset))
+        work = json.loads(block.split(b"\n")[item])
+        # The key is a hash, so make sure this is the DOI asked for
+        return work if work.get("DOI", "").lower() == doi.strip().lower() else None
+
+
+def use_dump(
+    dump_dir: Optional[str], index_dir: str = DEFAULT_INDEX_DIR, build: bool = False
+) -> Optional[CrossrefDump]:
+    """use_dump.
+    Makes Crossref lookups use a dump (or, given None, the Crossref API only again).  Returns the dump, or None if it
+    has no index and `build` isn't set.
+
+    :param dump_dir: Directory of the dump's shards, or None
+    :param index_dir: (Optional) Index directory (default = DEFAULT_INDEX_DIR)
+    :param build: (Optional) Whether to index shards which aren't indexed yet (or have changed) first (default = False)
+    """
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = None
+    if dump_dir and not build and not os.path.exists(os.path.join(index_dir, "index.sqlite")):
+        logger.warning(
+            "Crossref dump %s has no index in %s; build it with `python -m scraper.base_classes.crossref_dump`",
+            dump_dir,
+            index_dir,
+        )
+    elif dump_dir:
+        _active = CrossrefDump(dump_dir if build else None, index_dir)
+    return _active
+
+
+def get_active() -> Optional[CrossrefDump]:
+    return _active
+
+
+if os.environ.get("SCRAPER_CROSSREF_DUMP") and __name__ != "__main__":
+    use_dump(os.environ["SCRAPER_CROSSREF_DUMP"], os.environ.get("SCRAPER_CROSSREF_INDEX", DEFAULT_INDEX_DIR))
+
+
+if __name__ == "__main__":
+    from scraper import profiling
+    from scraper.logger import configure_logging
+
+    profiling.from_argv()
+    configure_logging()
+    print("Indexed {} shards".format(build_index(*sys.argv[1:3])))
@@ -0,0 +1,249 @@
+"""Persistent crosswalk of the identifiers of each work (DOI, ArXiv ID, URLs, publisher IDs)
+
+The same work is referred to by an ArXiv ID, a DOI, a doi.org or arxiv.org URL, a publisher URL, ...  Every equivalence
+found while scraping (the DOI the ArXiv importer reports, Crossref's `URL` and `alternative-id`, the DOI or ArXiv ID
+inside a URL, the ID a string validated to) is recorded in an SQLite table, which maps each normalized identifier to
+a work.
+
+While a crosswalk is in use (`use_crosswalk`, or SCRAPER_CROSSWALK in the environment), `Document` consults it before
+validating an ID, so any known form of a work resolves locally, without the network calls validation makes, and
+`DocumentType.scrape` looks up the DOI of documents which don't have one in their metadata.
+
+>>> crosswalk = Crosswalk(':memory:')
+>>> crosswalk.link([('arxiv', '1006.3140v1'), ('doi', '10.1000/42')])
+>>> crosswalk.resolve('https://doi.org/10.1000/42')
+('doi', '10.1000/42')
+>>> crosswalk.equivalents('arXiv:1006.3140')
+{'arxiv': '1006.3140', 'doi': '10.1000/42'}
+"""
+
+from __future__ import annotations
+import logging
+import os
+import sqlite3
+import threading
+from typing import Optional, Mapping, Any, Iterable, List, Tuple, Dict
+from papis.arxiv import find_arxivid_in_text
+from scraper import Constants
+from scraper.base_classes.identifiers import normalize_doi, normalize_arxiv_id, normalize_url, find_doi, arxiv_id_regex
+
+logger = logging.getLogger()
+
+DEFAULT_CROSSWALK_PATH = "{}/crosswalk.sqlite".format(Constants.CACHE_DIR.value)
+
+DOI = "doi"
+ARXIV = "arxiv"
+URL = "url"
+ALTERNATIVE = "alt"
+
+_active = None
+
+
+def normalize(kind: str, value: Optional[str]) -> Optional[str]:
+    """normalize.
+    Normalizes an identifier of the given kind, or returns None if it isn't one
+
+    >>> normalize('doi', 'doi:10.1000/ABC'), normalize('arxiv', 'arXiv:1006.3140v2'), normalize('arxiv', 'hello')
+    ('10.1000/abc', '1006.3140', None)
+    """
+    if not value:
+        return None
+    if kind == DOI:
+        found = normalize_doi(value)
+        return found if found and found.startswith("10.") else None
+    if kind == ARXIV:
+        found = normalize_arxiv_id(value)
+        return found if found and arxiv_id_regex.fullmatch(found) else None
+    if kind == URL:
+        return normalize_url(value)
+    return value.strip().lower()
+
+
+def parse_reference(string: str) -> List[Tuple[str, str]]:
+    """parse_reference.
+    Returns the (kind, identifier) pairs a reference (an ID or URL, as passed to `Document`) could stand for,
+    without any network calls
+
+    >>> parse_reference('https://arxiv.org/abs/1006.3140v1')
+    [('arxiv', '1006.3140v1'), ('url', 'https://arxiv.org/abs/1006.3140v1')]
+    """
+    found = []
+    if (doi_found := find_doi(string)) and normalize(DOI, doi_found):
+        found.append((DOI, doi_found))
+    if (arxiv_found := find_arxivid_in_text(string) or string.strip()) and normalize(ARXIV, arxiv_found):
+        found.append((ARXIV, arxiv_found))
+    if normalize(URL, string):
+        found.append((URL, string.strip()))
+    return found
+
+
+def get_identifiers(info: Mapping[str, Any], doctype=None, doc_id: Optional[str] = None) -> List[Tuple[str, str]]:
+    """get_identifiers.
+    Returns the identifiers of a work found in its metadata: its document ID, DOI, ArXiv ID (e.g. the arXiv importer's
+    `eprint`), URLs and Crossref's publisher IDs (`alternative-id`)
+
+    :param info: Document metadata (`Document.info`, a Crossref record, ...)
+    :param doctype: (Optional) DocumentType of `doc_id`
+    :param doc_id: (Optional) Validated document ID
+
+    >>> get_identifiers({'doi': '10.1016/j.entcs.2012.08.017', 'alternative-id': ['S1571066112000473']})
+    [('doi', '10.1016/j.entcs.2012.08.017'), ('alt', '10.1016/S1571066112000473')]
+    """
+    found = []
+    kind = {"Doi": DOI, "Arxiv": ARXIV, "UrlDoc": URL}.get(getattr(doctype, "__name__", None))
+    if kind and doc_id:
+        found.append((kind, doc_id))
+    found += [(DOI, info[key]) for key in ("doi", "DOI") if isinstance(info.get(key), str)]
+    found += [(ARXIV, info[key]) for key in ("eprint", "arxivid") if isinstance(info.get(key), str)]
+    for key in ("url", "URL"):
+        if isinstance(info.get(key), str):
+            found += parse_reference(info[key])
+    work_doi = next((value for kind, value in found if kind == DOI and normalize(DOI, value)), None)
+    if work_doi:
+        prefix = normalize_doi(work_doi).split("/", 1)[0]
+        found += [(ALTERNATIVE, "{}/{}".format(prefix, alt)) for alt in info.get("alternative-id") or []]
+    seen, unique = set(), []
+    for kind, value in found:
+        if (key := (kind, normalize(kind, value))) not in seen and key[1]:
+            seen.add(key)
+            unique.append((kind, value))
+    return unique
+
+
+class Crosswalk:
+    """
+    Table of identifiers, grouped by the work they refer to
+
+    Methods
+    =======
+    :link:
+        Records that identifiers refer to the same work
+
+    :record:
+        Links the identifiers of a `scraper.base_classes.Document`
+
+    :equivalents:
+        Returns the known identifiers of the work a reference refers to, by kind
+
+    :resolve:
+        Returns the (kind, identifier) a reference is recognized as, if its work is known
+    """
+
+    def __init__(self, path: str = DEFAULT_CROSSWALK_PATH) -> None:
+        """
+        :param path: (Optional) Path of the SQLite database (":memory:" for a throwaway crosswalk)
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS identifiers (
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                original TEXT NOT NULL,
+                work INTEGER NOT NULL,
+                PRIMARY KEY (kind, value)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS identifiers_work ON identifiers (work);
+            """
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> Crosswalk:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(DISTINCT work) FROM identifiers").fetchone()[0]
+
+    def _work(self, kind: str, value: str) -> Optional[int]:
+        row = self._db.execute("SELECT work FROM identifiers WHERE kind = ? AND value = ?", (kind, value)).fetchone()
+        return row[0] if row else None
+
+    def link(self, identifiers: Iterable[Tuple[str, str]]) -> None:
+        """
+        :param identifiers: (kind, identifier) pairs of one work.  Works already known by any of them are merged.
+        """
+        keys = [(kind, key, value) for kind, value in identifiers if (key := normalize(kind, value))]
+        if not keys:
+            return
+        with self._lock, self._db:
+            works = {work for kind, key, _ in keys if (work := self._work(kind, key)) is not None}
+            if works:
+                work = min(works)
+                self._db.executemany(
+                    "UPDATE identifiers SET work = ? WHERE work = ?", [(work, other) for other in works - {work}]
+                )
+            else:
+                work = self._db.execute("SELECT COALESCE(MAX(work), 0) + 1 FROM identifiers").fetchone()[0]
+            self._db.executemany(
+                "INSERT OR IGNORE INTO identifiers (kind, value, original, work) VALUES (?, ?, ?, ?)",
+                [(kind, key, value, work) for kind, key, value in keys],
+            )
+
+    def record(self, document, reference: Optional[str] = None) -> None:
+        """
+        :param document: `scraper.base_classes.Document`
+        :param reference: (Optional) The string the document was created from
+        """
+        identifiers = get_identifiers(document.info, document.doctype, document.doc_id)
+        if reference:
+            identifiers += parse_reference(reference)
+        self.link(identifiers)
+
+    def _find(self, reference: str) -> Tuple[Optional[str], Optional[str], Optional[int]]:
+        for kind, value in parse_reference(reference):
+            row = self._db.execute(
+                "SELECT original, work FROM identifiers WHERE kind = ? AND value = ?", (kind, normalize(kind, value))
+            ).fetchone()
+            if row:
+                # As validated: URLs as recorded, DOIs and ArXiv IDs (which keep their version) as written
+                return kind, row[0] if kind == URL else value, row[1]
+        return None, None, None
+
+    def _originals(self, work: int) -> Dict[str, str]:
+        rows = self._db.execute("SELECT kind, original FROM identifiers WHERE work = ? ORDER BY kind, value", (work,))
+        found = {}
+        for kind, original in rows:
+            found.setdefault(kind, original)
+        return found
+
+    def equivalents(self, reference: str) -> Dict[str, str]:
+        kind, value, work = self._find(reference)
+        return {} if work is None else self._originals(work) | {kind: value}
+
+    def resolve(self, reference: str) -> Optional[Tuple[str, str]]:
+        """
+        Returns the identifier the reference was recognized as (e.g. the DOI in a doi.org URL) if the work is known,
+        else None
+        """
+        kind, value, work = self._find(reference)
+        return None if work is None else (kind, value)
+
+
+def use_crosswalk(path: Optional[str] = DEFAULT_CROSSWALK_PATH) -> Optional[Crosswalk]:
+    """use_crosswalk.
+    Makes documents record and consult a crosswalk (or, given None, stop).  Returns the crosswalk.
+
+    :param path: (Optional) Path of the SQLite database (default = DEFAULT_CROSSWALK_PATH), or None
+    """
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = Crosswalk(path) if path else None
+    return _active
+
+
+def get_active() -> Optional[Crosswalk]:
+    return _active
+
+
+if os.environ.get("SCRAPER_CROSSWALK"):
+    use_crosswalk(os.environ["SCRAPER_CROSSWALK"])
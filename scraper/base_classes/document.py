@@ -2,15 +2,30 @@
 
 from __future__ import annotations
 import logging
+import os
+import sys
 from abc import ABC, abstractmethod
 from typing import Optional, Collection, Collection, Mapping, Any
 from crossref.restful import Works
 from papis import api as Papis
 from papis.commands.add import run as PapisAdd
 from scraper.base_classes.taglist import TagList
+from scraper.base_classes.sidecar import LazyInfo, slim_info
+from scraper.base_classes.infostore import StoredInfo, get_default_store
+from scraper.base_classes import crossref_dump, crosswalk
 from scraper import Constants
+from scraper import metrics, tracing
 
 logger = logging.getLogger()
+
+
+def _as_files(files) -> list:
+    """
+    List of file paths from what a `DocumentType.download` returns: a collection of paths, one path, or None
+    """
+    return [files] if isinstance(files, str) else list(files or [])
+
+
 works = Works()
 
 
@@ -52,6 +67,12 @@ class Document:
     :tag_files:
         Tags associated files in TMSU, hypertag, and supertag virtual filesystems
 
+    :to_dict, from_dict:
+        Serialize and restore the document's state (e.g. for the job journal)
+
+    :compact:
+        Moves "info" to an off-heap `InfoStore` until it is next accessed (e.g. while the document waits in a large batch)
+
     {{{
     >>> string = '1006.3140'
     >>> doc = Document(string)
@@ -67,6 +88,8 @@ class Document:
     }}}
     }}}"""
 
+    __slots__ = ("_files", "_info", "_tags", "_doctype", "_id", "_stored")
+
     @property
     def files(self) -> Collection[str]:
         return self._files
@@ -81,10 +104,15 @@ class Document:
 
     @property
     def info(self) -> dict:
+        if isinstance(self._info, StoredInfo):
+            # The handle is kept, so compacting again without changes doesn't store another copy
+            self._stored, self._info = self._info, self._info.load()
         return self._info
 
     @property
     def tags(self) -> TagList:
+        if not isinstance(self._tags, TagList):
+            self._tags = TagList(self._tags)
         return self._tags
 
     @tags.setter
@@ -95,31 +123,178 @@ class Document:
         self._files = []
         self._info = opts
         self._tags = TagList(tags)
-        for doctype in DocumentType.__subclasses__():
-            if found := doctype.validate(doc_id):
-                self._doctype = doctype
-                self._id = found
-                break
+        self._doctype = self._id = self._stored = None
+        known = crosswalk.get_active()
+        if known is not None and (found := known.resolve(doc_id)):
+            # Already validated as (or linked to) this identifier
+            self._doctype = DocumentType.for_kind(found[0])
+            self._id = sys.intern(found[1])
+            metrics.lookups.inc(source="crosswalk", result="hit")
+            return
+        with metrics.track("validate"), tracing.span("Document.validate", doc_id=doc_id) as span:
+            for doctype in DocumentType.__subclasses__():
+                with tracing.span(doctype.__name__ + ".validate"):
+                    found = doctype.validate(doc_id)
+                if found:
+                    self._doctype = doctype
+                    self._id = sys.intern(found)
+                    span.set_attribute("doctype", doctype.__name__)
+                    break
+        if known is not None and self._doctype is not None:
+            known.record(self, doc_id)
 
     def update(self, info_dict: dict) -> None:
-        self._info.update(info_dict)
+        self.info.update(info_dict)
         return self
 
-    def download(self):
-        self._files = self.doctype.download(self)
+    def add_files(self, *paths: str):
+        """
+        Associates already-downloaded files with the document (e.g. when importing existing PDFs)
+        """
+        self._files = [*self._files, *paths]
         return self
 
-    def get_info(self):
-        self._info = self.doctype.scrape(self)
+    def to_dict(self) -> dict:
+        """
+        Returns the document's state as a JSON-serializable dict, from which `Document.from_dict` restores it without re-validating
+        """
+        return {
+            "doc_id": self.doc_id,
+            "doctype": self.doctype.__name__ if self.doctype else None,
+            "files": list(self.files),
+            "info": self.info,
+            "tags": list(self.tags),
+        }
+
+    @classmethod
+    def from_dict(cls, state: Mapping[str, Any], sidecar=None) -> Document:
+        """
+        :kw sidecar: (Optional) `scraper.base_classes.sidecar.Sidecar` holding the bulky fields of documents scraped in slim mode
+        """
+        doc = cls.__new__(cls)
+        doc._stored = None
+        doc._files = _as_files(state.get("files"))
+        doc._info = dict(state.get("info", {}))
+        if sidecar is not None:
+            doc._info = LazyInfo(doc._info, sidecar, state.get("doc_id"))
+        doc._tags = TagList(state.get("tags", []))
+        doc._id = sys.intern(state["doc_id"]) if state.get("doc_id") else None
+        doc._doctype = next(
+            (t for t in DocumentType.__subclasses__() if t.__name__ == state.get("doctype")),
+            None,
+        )
+        return doc
+
+    def compact(self, store=None):
+        """
+        Shrinks the document for holding in a large batch: "info" is moved to an `InfoStore` (the process-wide one by default) and materialized again when next accessed, tags are kept as a tuple of interned strings, and files as a tuple.
+        Slim (`LazyInfo`) info is left in place.
+
+        :param store: (Optional) `scraper.base_classes.infostore.InfoStore` to move "info" to
+        """
+        if type(self._info) is dict and self._info:
+            store = store if store is not None else get_default_store()
+            stored = self._stored if self._stored is not None and self._stored.store is store else None
+            self._info = StoredInfo(store, store.put(self._info, reuse=stored.handle if stored else None))
+        self._tags = tuple(sys.intern(tag) for tag in self._tags)
+        self._files = tuple(_as_files(self._files))
         return self
 
-    def add_to_library(self, confirm=True, link=False, **kwargs):
-        PapisAdd(
-            self.files,
-            self.info | {"tags": str(self.tags)} | kwargs,
-            confirm=confirm,
-            link=link,
+    def _span(self, method: str):
+        return tracing.span(
+            "Document." + method,
+            doc_id=self.doc_id,
+            doctype=getattr(self.doctype, "__name__", None),
         )
+
+    def _in_library(self, existing, action: str) -> bool:
+        if existing is not None and (found := existing.find(self)) is not None:
+            logger.info("Not %s %s: already in library as %s", action, self.doc_id, found)
+            return True
+        return False
+
+    def download(self, fulltext=None, existing=None):
+        """
+        Downloads associated files according to doctype
+
+        :kw fulltext: (Optional) `scraper.library.FullTextIndex` to add the downloaded files to
+        :kw existing: (Optional) `scraper.library.ExistenceIndex` of the library.  If passed, documents already in the library are not downloaded.
+        """
+        if self._in_library(existing, "downloading"):
+            return self
+        with metrics.track("download", self.doctype), self._span("download"):
+            self._files = _as_files(self.doctype.download(self))
+        if (known := crosswalk.get_active()) is not None:
+            known.record(self)
+        metrics.download_bytes.inc(
+            sum(os.path.getsize(f) for f in self._files if os.path.isfile(f)),
+            doctype=self.doctype.__name__,
+        )
+        if fulltext is not None:
+            fulltext.index_document(self)
+        return self
+
+    def get_info(self, existing=None, sidecar=None):
+        """
+        Gets document info from Crossref and Papis
+
+        :kw existing: (Optional) `scraper.library.ExistenceIndex` of the library.  If passed, documents already in the library are not scraped.
+        :kw sidecar: (Optional) `scraper.base_classes.sidecar.Sidecar`.  If passed, "info" is slimmed: duplicate reference lists are dropped and bulky fields are moved to the sidecar, from which they are loaded on access.
+        """
+        if self._in_library(existing, "scraping"):
+            return self
+        with metrics.track("scrape", self.doctype), self._span("get_info"):
+            self._info = self.doctype.scrape(self)
+        if (known := crosswalk.get_active()) is not None:
+            known.record(self)
+        if sidecar is not None:
+            slim, bulk = slim_info(self._info)
+            sidecar.put(self.doc_id, bulk)
+            self._info = LazyInfo(slim, sidecar, self.doc_id)
+        return self
+
+    def add_to_library(
+        self, confirm=True, link=False, duplicates=None, batch=None, existing=None, key=None, on_commit=None, **kwargs
+    ):
+        """
+        Adds to Papis library
+
+        :kw duplicates: (Optional) `scraper.library.LSHIndex` of the library.  If passed, documents resembling an indexed one are skipped rather than added, and added documents are indexed.
+        :kw batch: (Optional) `scraper.library.PapisBatch` to stage the document in, rather than adding it immediately.  `confirm` and `link` are ignored; the batch's settings apply.  The document is indexed in `duplicates` and `existing` once the batch has committed it.
+        :kw existing: (Optional) `scraper.library.ExistenceIndex` of the library.  If passed, documents already in the library are skipped, and added documents are indexed.
+        :kw key: (Optional) Key identifying the document in the batch's `failed` list (default = the document ID)
+        :kw on_commit: (Optional) Called once the document is in the library; not called if it was skipped
+        """
+        if self._in_library(existing, "adding"):
+            return self
+        if duplicates is not None:
+            if found := duplicates.query(self.info):
+                logger.warning(
+                    "Not adding %s: likely duplicate of %s (similarity %.2f)",
+                    self.doc_id,
+                    *found[0],
+                )
+                return self
+
+        def index():
+            if duplicates is not None:
+                duplicates.add(self.doc_id, self.info)
+            if existing is not None:
+                existing.add(self.doc_id, self.info, self.doc_id)
+            if on_commit is not None:
+                on_commit()
+
+        if batch is not None:
+            batch.add(self, key=key, on_commit=index, **kwargs)
+        else:
+            with metrics.track("add", self.doctype), self._span("add_to_library"):
+                PapisAdd(
+                    self.files,
+                    self.info | {"tags": str(self.tags)} | kwargs,
+                    confirm=confirm,
+                    link=link,
+                )
+            index()
         return self
 
     def tag_files(self):
@@ -151,11 +326,25 @@ class DocumentType(ABC):
         """
         Combines data from Papis's Crossref search with the full Crossref API, in a way that respects Papis's naming conventions
         """
-        document.info |= cls._consolidate_doi_data(
-            cls._get_papis_data_from_doi(document.info.get("doi")),
-            cls._get_crossref_data_from_doi(document.info.get("doi")),
+        doi = document.info.get("doi")
+        if not doi and (known := crosswalk.get_active()) is not None:
+            doi = known.equivalents(document.doc_id).get(crosswalk.DOI)
+        return document.info | (
+            cls._consolidate_doi_data(
+                cls._get_papis_data_from_doi(doi),
+                cls._get_crossref_data_from_doi(doi),
+            )
+            or {}
         )
 
+    @staticmethod
+    def for_kind(kind: str) -> Optional[DocumentType]:
+        """
+        Returns the DocumentType of documents identified by a crosswalk identifier kind ("doi", "arxiv" or "url")
+        """
+        name = {crosswalk.DOI: "Doi", crosswalk.ARXIV: "Arxiv", crosswalk.URL: "UrlDoc"}.get(kind)
+        return next((t for t in DocumentType.__subclasses__() if t.__name__ == name), None)
+
     @classmethod
     def _consolidate_doi_data(cls, papis_data, cref_data):
         """{{{
@@ -585,10 +774,13 @@ class DocumentType(ABC):
          }}}
         }}}"""
         try:
-            retrieved = Papis.doi_to_data(doc_id)
+            with tracing.span("papis.doi_to_data", doi=doc_id):
+                retrieved = Papis.doi_to_data(doc_id)
         except:
             logger.warning("Exception thrown during Crossref lookup of DOI %s", doc_id)
+            metrics.lookups.inc(source="papis", result="error")
             return None
+        metrics.lookups.inc(source="papis", result="hit" if retrieved else "miss")
         return retrieved
 
     @classmethod
@@ -785,9 +977,18 @@ class DocumentType(ABC):
 
         }}}
         }}}"""
+        if (dump := crossref_dump.get_active()) is not None and doc_id:
+            with tracing.span("crossref.dump", doi=doc_id):
+                retrieved = dump.get(doc_id)
+            metrics.lookups.inc(source="crossref_dump", result="hit" if retrieved else "miss")
+            if retrieved:
+                return retrieved
         try:
-            retrieved = works.doi(doc_id)
+            with tracing.span("crossref.works.doi", doi=doc_id):
+                retrieved = works.doi(doc_id)
         except:
             logger.warning("Exception thrown during Crossref lookup of DOI %s", doc_id)
+            metrics.lookups.inc(source="crossref", result="error")
             return None
+        metrics.lookups.inc(source="crossref", result="hit" if retrieved else "miss")
         return retrieved
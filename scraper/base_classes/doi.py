@@ -5,8 +5,9 @@ import doi
 import glob
 from scidownl import scidownl
 from typing import Optional, Collection
-from scraper import Constants
+from scraper import Constants, tracing
 from scraper.base_classes.document import Document, DocumentType
+from scraper.base_classes.identifiers import find_doi
 
 
 class Doi(DocumentType):
@@ -26,7 +27,10 @@ class Doi(DocumentType):
 
         }}}
         }}}"""
-        ret = doi.find_doi_in_text(doc_id)
+        # Found locally, so only strings which contain a DOI are checked with the resolver
+        ret = find_doi(doc_id)
+        if ret is None:
+            return None
         try:
             doi.validate_doi(ret)
             return ret
@@ -60,7 +64,8 @@ class Doi(DocumentType):
 
         }}}
         }}}"""
-        scidownl.SciHub(doc_id, outdir).download(1)
+        with tracing.span("scidownl.download", doi=doc_id):
+            scidownl.SciHub(doc_id, outdir).download(1)
         return glob.glob(f"{outdir}/*.pdf")
 
     @classmethod
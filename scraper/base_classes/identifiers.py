@@ -0,0 +1,178 @@
+"""Normalization of document identifiers (DOIs, ArXiv IDs and URLs), so different spellings of one compare equal
+
+`find_doi` finds the DOI in anything that contains one (percent-encoded resolver links, publisher URLs, citations)
+without the network, `canonicalize_doi` case-folds it for matching, and `dedupe_by_doi` drops the later spellings of each DOI from a list of links, so the
+same paper isn't validated and fetched once per spelling.
+"""
+
+from __future__ import annotations
+import re
+from typing import Optional, Iterable, Iterator, List, Set, Tuple
+from urllib.parse import urlsplit, unquote, parse_qsl
+
+doi_prefix_regex = re.compile(r"^\s*(?:https?://(?:dx\.)?doi\.org/|doi:\s*)", re.I)
+arxiv_prefix_regex = re.compile(r"^\s*(?:https?://arxiv\.org/(?:abs|pdf)/|arxiv:\s*)", re.I)
+arxiv_version_regex = re.compile(r"v\d+$")
+arxiv_id_regex = re.compile(r"\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7}")
+
+
+def normalize_doi(string: Optional[str]) -> Optional[str]:
+    """normalize_doi.
+    Strips resolver prefixes and surrounding whitespace from a DOI and lowercases it (DOIs are case-insensitive)
+
+    :param string: DOI, possibly as a doi.org URL or with a "doi:" prefix
+
+    >>> normalize_doi('https://doi.org/10.1016/J.ENTCS.2012.08.017 ')
+    '10.1016/j.entcs.2012.08.017'
+    >>> normalize_doi('') is None
+    True
+    """
+    if not string:
+        return None
+    return doi_prefix_regex.sub("", string).strip().lower() or None
+
+
+def normalize_arxiv_id(string: Optional[str]) -> Optional[str]:
+    """normalize_arxiv_id.
+    Returns the base ArXiv ID (without "arXiv:" prefix, URL or version suffix), so all versions of a preprint compare equal
+
+    :param string: ArXiv ID or abs / pdf URL
+
+    >>> normalize_arxiv_id('arXiv:1010.4840v2')
+    '1010.4840'
+    >>> normalize_arxiv_id('http://arxiv.org/abs/math/0506203v1')
+    'math/0506203'
+    """
+    if not string:
+        return None
+    string = arxiv_prefix_regex.sub("", string).strip()
+    if string.lower().endswith(".pdf"):
+        string = string[:-4]
+    return arxiv_version_regex.sub("", string).lower() or None
+
+
+def normalize_url(string: Optional[str]) -> Optional[str]:
+    """normalize_url.
+    Reduces a URL to host and path: no scheme, "www." or trailing slash, and a lowercase host
+
+    :param string: URL
+
+    >>> normalize_url('https://www.Example.org/papers/42/?v=1')
+    'example.org/papers/42?v=1'
+    >>> normalize_url('not a url') is None
+    True
+    """
+    if not string or not (split := urlsplit(string.strip())).netloc:
+        return None
+    host = split.netloc.lower().removeprefix("www.")
+    return host + split.path.rstrip("/") + ("?" + split.query if split.query else "")
+
+
+# Crossref's recommended pattern, loosened to allow the characters of SICI-style DOIs (e.g. <, >, ;, [, ])
+doi_regex = re.compile(r"10\.\d{4,9}/[^\s\"'&]+")
+_TRAILING = ".,;:!?/"
+_CLOSING = {")": "(", "]": "[", "}": "{", ">": "<"}
+# Pages publishers append to a DOI in their URLs (e.g. https://onlinelibrary.wiley.com/doi/10.1002/glia.440060207/abstract)
+_PUBLISHER_PAGE = re.compile(r"/(?:abstract|full|pdf|epdf|fulltext|html|summary|references|citedby)$", re.I)
+
+
+def _trim_doi(found: str) -> str:
+    found = _PUBLISHER_PAGE.sub("", found)
+    while found:
+        last = found[-1]
+        if last in _TRAILING or (last in _CLOSING and found.count(last) > found.count(_CLOSING[last])):
+            found = found[:-1]
+        else:
+            break
+    return found
+
+
+def find_doi(string: Optional[str]) -> Optional[str]:
+    """find_doi.
+    Finds the DOI in a string (a DOI, a resolver or publisher URL, a percent-encoded href, a citation, ...) without any
+    network calls and returns it as written, but unquoted and without prefixes or trailing punctuation.
+    Returns None if there is no DOI.
+
+    :param string: String containing a DOI
+
+    >>> find_doi('https://doi.org/10.1016%2FS0896-6273%2804%2900043-1')
+    '10.1016/S0896-6273(04)00043-1'
+    >>> find_doi('(see doi:10.1103/PhysRevE.61.4194).')
+    '10.1103/PhysRevE.61.4194'
+    >>> find_doi('//citeseerx.ist.psu.edu/viewdoc/summary?doi=10.1.1.130.7027') is None
+    True
+    """
+    if not string or "10" not in string:
+        return None
+    text = string.strip()
+    # Also undoes double encoding (%252F)
+    for _ in range(2):
+        if "%" not in text or (unquoted := unquote(text)) == text:
+            break
+        text = unquoted
+    if "://" in text or text.startswith("//"):
+        split = urlsplit(text)
+        candidates = [split.path, *(value for _, value in parse_qsl(split.query))]
+    else:
+        candidates = [text]
+    for candidate in candidates:
+        if found := doi_regex.search(candidate):
+            return _trim_doi(found.group(0))
+    return None
+
+
+def canonicalize_doi(string: Optional[str]) -> Optional[str]:
+    """canonicalize_doi.
+    `find_doi`, case-folded (DOIs are case-insensitive), for comparing DOIs
+
+    :param string: String containing a DOI
+
+    >>> canonicalize_doi('(see doi:10.1103/PhysRevE.61.4194).')
+    '10.1103/physreve.61.4194'
+    >>> canonicalize_doi('https://onlinelibrary.wiley.com/doi/10.1002/(SICI)1097-4636(199706)35:4%3C431::AID-JBM4%3E3.0.CO;2-G/abstract?x=1')
+    '10.1002/(sici)1097-4636(199706)35:4<431::aid-jbm4>3.0.co;2-g'
+    """
+    found = find_doi(string)
+    return found.lower() if found else None
+
+
+def canonicalize_dois(strings: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """canonicalize_dois.
+    `canonicalize_doi` for many strings.  Link lists repeat themselves, so each distinct string is only parsed once.
+
+    :param strings: Strings containing DOIs
+
+    >>> canonicalize_dois(['https://doi.org/10.1038%2F440611a', 'doi:10.1038/440611A', 'https://arxiv.org/abs/1006.3140'])
+    ['10.1038/440611a', '10.1038/440611a', None]
+    """
+    cache = {}
+    canonical = []
+    append = canonical.append
+    for string in strings:
+        try:
+            append(cache[string])
+        except KeyError:
+            append(cache.setdefault(string, canonicalize_doi(string)))
+    return canonical
+
+
+def dedupe_by_doi(strings: Iterable[str], seen: Optional[Set[str]] = None) -> Iterator[Tuple[str, Optional[str]]]:
+    """dedupe_by_doi.
+    Yields (string, canonical DOI) for the first string of each DOI, dropping later spellings of the same DOI.
+    Strings without a DOI are passed through (with None) unless they repeat exactly.
+
+    :param strings: Strings containing DOIs, e.g. the hrefs of a page
+    :param seen: (Optional) Set of the DOIs (and DOI-less strings) already seen, e.g. to dedupe across pages
+
+    >>> list(dedupe_by_doi(['https://doi.org/10.1038%2F440611a', '//arxiv.org/abs/1006.3140', 'doi:10.1038/440611A']))
+    [('https://doi.org/10.1038%2F440611a', '10.1038/440611a'), ('//arxiv.org/abs/1006.3140', None)]
+    """
+    seen = set() if seen is None else seen
+    cache = {}
+    for string in strings:
+        if string not in cache:
+            cache[string] = canonicalize_doi(string)
+        doi = cache[string]
+        if (key := doi or string) not in seen:
+            seen.add(key)
+            yield string, doi
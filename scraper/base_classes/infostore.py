@@ -0,0 +1,115 @@
+"""Off-heap storage of document metadata, for holding very large batches of documents
+
+A `Document`'s info dict is typically the bulk of its memory.  `Document.compact` moves it into an `InfoStore`
+(compressed pickles appended to a temporary file) and keeps only a small handle, which is materialized back into
+a dict the first time `Document.info` is accessed.
+
+Entries are never removed: the file grows with every `put` and is only freed when the store is closed (or, for the
+process-wide default store, when the process exits).  Compacting a document again stores a new entry only if its
+info changed since it was last materialized.  To bound the space used by one batch, give it its own `InfoStore` and
+close it once the batch is done.
+"""
+
+from __future__ import annotations
+import os
+import pickle
+import tempfile
+import threading
+import zlib
+from array import array
+from typing import Optional, Mapping, Any
+
+
+class InfoStore:
+    """
+    Append-only file of compressed metadata dicts, shared by many documents.  Only an offset and a length per
+    entry are kept in memory.
+
+    >>> store = InfoStore()
+    >>> handle = store.put({'title': 'A Simply Typed λ-Calculus', 'year': 2012})
+    >>> store.get(handle)
+    {'title': 'A Simply Typed λ-Calculus', 'year': 2012}
+
+    Methods
+    =======
+    :put:
+        Stores a dict and returns its handle.  Given the handle of an identical entry, returns it without appending.
+
+    :get:
+        Returns a new copy of the dict stored under a handle
+    """
+
+    def __init__(self, path: Optional[str] = None, level: int = 1) -> None:
+        """
+        :param path: (Optional) File to store metadata in.  An anonymous temporary file is used by default
+        :param level: (Optional) zlib compression level (default = 1)
+        """
+        self._fptr = tempfile.TemporaryFile() if path is None else open(path, "w+b")
+        self.level = level
+        self._offsets = array("Q")
+        self._lengths = array("I")
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Size of the stored data, in bytes
+        """
+        return self._end
+
+    def close(self) -> None:
+        self._fptr.close()
+
+    def put(self, info: Mapping[str, Any], reuse: Optional[int] = None) -> int:
+        """
+        :param info: Dict to store
+        :param reuse: (Optional) Handle of the entry the dict was loaded from, returned if the dict is unchanged
+        """
+        data = zlib.compress(pickle.dumps(dict(info), pickle.HIGHEST_PROTOCOL), self.level)
+        if reuse is not None and self._lengths[reuse] == len(data):
+            if os.pread(self._fptr.fileno(), len(data), self._offsets[reuse]) == data:
+                return reuse
+        with self._lock:
+            os.pwrite(self._fptr.fileno(), data, self._end)
+            self._offsets.append(self._end)
+            self._lengths.append(len(data))
+            self._end += len(data)
+            return len(self._offsets) - 1
+
+    def get(self, handle: int) -> dict:
+        data = os.pread(self._fptr.fileno(), self._lengths[handle], self._offsets[handle])
+        return pickle.loads(zlib.decompress(data))
+
+
+class StoredInfo:
+    """
+    Handle of a document's info in an `InfoStore`
+    """
+
+    __slots__ = ("store", "handle")
+
+    def __init__(self, store: InfoStore, handle: int) -> None:
+        self.store = store
+        self.handle = handle
+
+    def load(self) -> dict:
+        return self.store.get(self.handle)
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_default_store() -> InfoStore:
+    """get_default_store.
+    Returns the process-wide `InfoStore`, creating it on first use
+    """
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = InfoStore()
+        return _default_store
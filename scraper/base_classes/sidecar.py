@@ -0,0 +1,178 @@
+"""Slim document metadata, with bulky fields kept in a compressed sidecar
+
+`DocumentType.scrape` merges the raw Crossref record into Papis's record, so each document carries Crossref's
+`reference` list as well as Papis's `citations` copy of it, plus licenses, links, timestamps and other fields
+nobody reads, all of which end up in info.yaml.  In slim mode (`Document.get_info(sidecar=...)`):
+
+- `citations` is the one reference list kept (Crossref's `reference` is renamed to it if Papis found none)
+- the fields in BULKY_FIELDS are moved to a `Sidecar`: an SQLite table of zlib-compressed JSON, keyed by document ID
+- `Document.info` is a `LazyInfo`, which holds the slim fields and loads the bulky ones from the sidecar the first
+  time one of them is looked up.  Only the slim fields are written to Papis.
+"""
+
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import zlib
+from typing import Optional, Mapping, Any, Tuple, Iterable
+from scraper import Constants
+
+DEFAULT_SIDECAR_PATH = "{}/sidecar.sqlite".format(Constants.CACHE_DIR.value)
+
+REFERENCES = "citations"
+CROSSREF_REFERENCES = "reference"
+
+BULKY_FIELDS = frozenset(
+    {
+        "assertion",
+        "container-title",
+        "content-domain",
+        "created",
+        "deposited",
+        "funder",
+        "indexed",
+        "is-referenced-by-count",
+        "issued",
+        "license",
+        "link",
+        "member",
+        "page",
+        "prefix",
+        "published-online",
+        "published-print",
+        "reference-count",
+        "references-count",
+        "relation",
+        "score",
+        "short-container-title",
+        "source",
+        "subject",
+        "update-policy",
+    }
+)
+
+
+def slim_info(info: Mapping[str, Any], bulky: Iterable[str] = BULKY_FIELDS) -> Tuple[dict, dict]:
+    """slim_info.
+    Splits document metadata into the fields to keep and the bulky fields to move to a sidecar.
+    Crossref's reference list is dropped in favor of Papis's `citations` (or becomes `citations` if there is none).
+
+    :param info: Metadata, e.g. as returned by `DocumentType.scrape`
+    :param bulky: (Optional) Names of fields to move to the sidecar (default = BULKY_FIELDS)
+
+    >>> slim, bulk = slim_info({'title': 'T', 'reference': [{'key': 'r1'}], 'citations': [{'doi': '10.1/2'}], 'license': []})
+    >>> slim, bulk
+    ({'title': 'T', 'citations': [{'doi': '10.1/2'}]}, {'license': []})
+    >>> slim_info({'reference': [{'key': 'r1'}]})
+    ({'citations': [{'key': 'r1'}]}, {})
+    """
+    bulky = frozenset(bulky)
+    slim, bulk = {}, {}
+    for key, value in info.items():
+        if key == CROSSREF_REFERENCES:
+            if REFERENCES not in info:
+                slim[REFERENCES] = value
+        elif key in bulky:
+            bulk[key] = value
+        else:
+            slim[key] = value
+    return slim, bulk
+
+
+class Sidecar:
+    """
+    Compressed store of the bulky metadata fields of documents, keyed by document ID
+
+    Methods
+    =======
+    :put:
+        Stores a document's bulky fields, replacing any stored before
+
+    :get:
+        Returns a document's bulky fields ({} if none are stored)
+
+    :delete:
+        Removes a document's fields
+    """
+
+    def __init__(self, path: str = DEFAULT_SIDECAR_PATH, level: int = 6) -> None:
+        """
+        :param path: (Optional) Path of the SQLite database (default = DEFAULT_SIDECAR_PATH)
+        :param level: (Optional) zlib compression level (default = 6)
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.level = level
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS bulk (key TEXT PRIMARY KEY, data BLOB NOT NULL) WITHOUT ROWID")
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> Sidecar:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def put(self, key: str, fields: Mapping[str, Any]) -> None:
+        data = zlib.compress(json.dumps(fields, separators=(",", ":"), default=str).encode("utf-8"), self.level)
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO bulk (key, data) VALUES (?, ?)", (key, data))
+
+    def get(self, key: str) -> dict:
+        row = self._db.execute("SELECT data FROM bulk WHERE key = ?", (key,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else {}
+
+    def delete(self, key: str) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM bulk WHERE key = ?", (key,))
+
+
+class LazyInfo(dict):
+    """
+    Slim document metadata.  Looking up a field (`info[key]`, `get`, `in`) sees the slim fields and the fields stored
+    in the sidecar, which are loaded on first use.  Everything else (`len`, iteration, `keys`, `items`, `info | {...}`,
+    serialization) only sees the slim fields, so that only those are written to Papis; `full` returns all of them.
+
+    >>> sidecar = Sidecar(':memory:')
+    >>> sidecar.put('10.1000/1', {'license': [{'URL': 'https://example.org/license'}]})
+    >>> info = LazyInfo({'title': 'T'}, sidecar, '10.1000/1', ['license'])
+    >>> list(info), info['license'][0]['URL'], 'license' in info, info.get('link', 'none')
+    (['title'], 'https://example.org/license', True, 'none')
+    """
+
+    def __init__(self, slim: Mapping[str, Any], sidecar: Sidecar, key: str, bulky: Iterable[str] = BULKY_FIELDS) -> None:
+        super().__init__(slim)
+        self.sidecar = sidecar
+        self.key = key
+        self._bulky = frozenset(bulky)
+        self._bulk = None
+
+    def bulk(self) -> dict:
+        if self._bulk is None:
+            self._bulk = self.sidecar.get(self.key)
+        return self._bulk
+
+    def __missing__(self, key: str) -> Any:
+        if key in self._bulky and key in self.bulk():
+            return self.bulk()[key]
+        raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        return super().__contains__(key) or (key in self._bulky and key in self.bulk())
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def full(self) -> dict:
+        """
+        Returns all fields, slim and bulky, as one dict
+        """
+        return dict(self) | self.bulk()
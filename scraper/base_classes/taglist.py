@@ -110,3 +110,6 @@ class TagList:
 
     def __iter__(self):
         return iter(self._tags)
+
+    def __len__(self):
+        return len(self._tags)
@@ -3,7 +3,7 @@
 import scihub
 from operator import itemgetter
 from scraper.base_classes.document import Document, DocumentType
-from scraper import Constants
+from scraper import Constants, tracing
 from scraper.utils import sanitize_filename, get_title_as_filename
 from typing import Optional, Collection
 from urllib.parse import urlsplit, urlunsplit, SplitResult
@@ -67,7 +67,8 @@ class UrlDoc(DocumentType):
 
         }}}
         }}}"""
-        pdf, url = itemgetter("pdf", "url")(scihub.SciHub().fetch(doc_id))
+        with tracing.span("scihub.fetch", url=doc_id):
+            pdf, url = itemgetter("pdf", "url")(scihub.SciHub().fetch(doc_id))
         fname = sanitize_filename(fname) or get_title_as_filename(pdf)
         path = f"{outdir}/{fname}"
         with open(path, "xb") as fptr:
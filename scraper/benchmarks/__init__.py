@@ -0,0 +1,2 @@
+from .runner import *
+from .compare import *
@@ -0,0 +1,47 @@
+"""Runs the benchmark suite, appends the results to the history file and compares them with previous runs
+
+Each benchmark is compared with the latest earlier run that includes it, so a run limited by patterns doesn't
+become the only baseline of the next full run.
+
+    $ python -m scraper.benchmarks                      # everything
+    $ python -m scraper.benchmarks 'micro.*' --repeat 20
+    $ python -m scraper.benchmarks --threshold 0.15     # exit with status 1 on a >15% slowdown
+"""
+
+import argparse
+import sys
+from scraper import profiling
+from scraper.logger import configure_logging
+from scraper.benchmarks import micro, pipeline
+from scraper.benchmarks.compare import DEFAULT_THRESHOLD, compare, latest_results, report
+from scraper.benchmarks.runner import DEFAULT_HISTORY_PATH, run, make_run, append_history, load_history
+
+profiling.from_argv()
+configure_logging()
+parser = argparse.ArgumentParser(prog="python -m scraper.benchmarks", description=__doc__.split("\n")[0])
+parser.add_argument("patterns", nargs="*", default=["*"], help="Glob patterns of benchmarks to run")
+parser.add_argument("--repeat", type=int, default=5)
+parser.add_argument("--history", default=DEFAULT_HISTORY_PATH)
+parser.add_argument("--no-save", action="store_true", help="Don't append the results to the history file")
+parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+args = parser.parse_args()
+
+results = run(args.patterns, args.repeat)
+entry = make_run(results)
+for result in results:
+    if result.error:
+        print("{:<32} FAILED {}".format(result.name, result.error))
+    else:
+        print("{:<32} {:>12.1f} items/s  (median {:.4f}s of {})".format(
+            result.name, result.items_per_second, result.median, len(result.seconds)
+        ))
+history = load_history(args.history)
+if not args.no_save:
+    append_history(entry, args.history)
+if history:
+    comparisons = compare(latest_results(history), entry, args.threshold)
+    print("\nCompared with the latest earlier run of each benchmark (last run: {} ({})):".format(
+        history[-1].get("commit"), history[-1].get("timestamp")
+    ))
+    print(report(comparisons))
+    sys.exit(1 if any(c.regressed for c in comparisons) else 0)
@@ -0,0 +1,156 @@
+"""Compares benchmark runs and flags regressions
+
+By default the latest run in the history file is compared with the runs before it: each benchmark with the latest
+earlier run that includes it (runs limited to some benchmarks don't hide the others).  A benchmark has regressed when
+its throughput (items per second, from the median timing) dropped by more than the threshold.  Exits with status 1
+if anything regressed, so it can gate CI:
+
+    $ python -m scraper.benchmarks.compare --threshold 0.15
+    $ python -m scraper.benchmarks.compare --baseline 1a2b3c4   # compare with the last run at a commit
+"""
+
+from __future__ import annotations
+import argparse
+import re
+import sys
+from dataclasses import dataclass
+from typing import Optional, List
+from scraper.benchmarks.runner import DEFAULT_HISTORY_PATH, load_history
+
+DEFAULT_THRESHOLD = 0.10
+
+
+@dataclass
+class Comparison:
+    name: str
+    baseline: Optional[float]
+    current: Optional[float]
+    threshold: float = DEFAULT_THRESHOLD
+
+    @property
+    def change(self) -> Optional[float]:
+        """
+        Relative change in throughput, e.g. -0.25 for a 25% slowdown
+        """
+        if not self.baseline or not self.current:
+            return None
+        return self.current / self.baseline - 1
+
+    @property
+    def regressed(self) -> bool:
+        """
+        True if throughput dropped by more than the threshold, or the benchmark stopped working
+        """
+        if self.baseline and not self.current:
+            return True
+        return self.change is not None and self.change < -self.threshold
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> List[Comparison]:
+    """compare.
+    Compares the throughput of every benchmark in the current run with the baseline run
+
+    :param baseline: History entry to compare against
+    :param current: History entry to check
+    :param threshold: (Optional) Largest tolerated relative drop in throughput (default = 0.10)
+
+    >>> old = {'results': {'micro.clean_string': {'items_per_second': 1000.0}}}
+    >>> new = {'results': {'micro.clean_string': {'items_per_second': 850.0}}}
+    >>> [c.regressed for c in compare(old, new)], [c.regressed for c in compare(old, new, threshold=0.2)]
+    ([True], [False])
+    """
+    return [
+        Comparison(
+            name,
+            baseline["results"].get(name, {}).get("items_per_second"),
+            result.get("items_per_second"),
+            threshold,
+        )
+        for name, result in current["results"].items()
+    ]
+
+
+def latest_results(history: List[dict]) -> dict:
+    """latest_results.
+    Returns a history entry holding each benchmark's result from the latest run that includes it, for use as a baseline
+
+    :param history: Runs, oldest first
+
+    >>> full = {'commit': 'aaa', 'results': {'micro.a': {'items_per_second': 10.0}, 'micro.b': {'items_per_second': 20.0}}}
+    >>> partial = {'commit': 'bbb', 'results': {'micro.a': {'items_per_second': 11.0}}}
+    >>> latest_results([full, partial])['results']
+    {'micro.a': {'items_per_second': 11.0}, 'micro.b': {'items_per_second': 20.0}}
+    """
+    results = {}
+    for entry in history:
+        results.update(entry["results"])
+    return dict(history[-1], results=results) if history else {"results": {}}
+
+
+def find_run(history: List[dict], ref: str) -> dict:
+    """find_run.
+    Returns the run selected by `ref`: an index into the history (a signed or at most 3-digit number, e.g. -2) or
+    the prefix of a git commit
+    """
+    if re.fullmatch(r"[+-]\d+|\d{1,3}", ref):
+        try:
+            return history[int(ref)]
+        except IndexError:
+            raise KeyError("No benchmark run at index {} of {}".format(ref, len(history)))
+    for entry in reversed(history):
+        if (entry.get("commit") or "").startswith(ref):
+            return entry
+    raise KeyError("No benchmark run found for '{}'".format(ref))
+
+
+def _format_rate(rate: Optional[float]) -> str:
+    return "{:.1f}".format(rate) if rate else "-"
+
+
+def report(comparisons: List[Comparison]) -> str:
+    lines = ["{:<32} {:>14} {:>14} {:>8}".format("benchmark", "baseline/s", "current/s", "change")]
+    for c in comparisons:
+        change = "{:+.1%}".format(c.change) if c.change is not None else "-"
+        lines.append(
+            "{:<32} {:>14} {:>14} {:>8}{}".format(
+                c.name,
+                _format_rate(c.baseline),
+                _format_rate(c.current),
+                change,
+                "  REGRESSION" if c.regressed else "",
+            )
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--history", default=DEFAULT_HISTORY_PATH)
+    parser.add_argument(
+        "--baseline",
+        help="History index or git commit of the baseline run (default = the latest earlier run of each benchmark)",
+    )
+    parser.add_argument("--current", default="-1", help="History index or git commit of the run to check")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+    history = load_history(args.history)
+    if len(history) < 2:
+        print("Need at least two runs in {} to compare".format(args.history), file=sys.stderr)
+        return 0
+    current = find_run(history, args.current)
+    if args.baseline is None:
+        baseline = latest_results(history[: history.index(current)])
+    else:
+        baseline = find_run(history, args.baseline)
+    comparisons = compare(baseline, current, args.threshold)
+    print(report(comparisons))
+    regressed = [c.name for c in comparisons if c.regressed]
+    if regressed:
+        print("\n{} benchmark(s) regressed by more than {:.0%}: {}".format(
+            len(regressed), args.threshold, ", ".join(regressed)
+        ))
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Micro-benchmarks of the string, tag, URL and wikitext helpers on the scraper's hot paths
+
+Inputs are synthesized by `scraper.stubs`, so they are the same from run to run.
+"""
+
+from __future__ import annotations
+import bs4
+import wikitextparser as wikiparse
+from scraper.base_classes.identifiers import canonicalize_dois
+from scraper.base_classes.taglist import TagList
+from scraper.benchmarks.runner import benchmark
+from scraper.parsing import validate_and_parse_url, get_dois, iter_hrefs
+from scraper.stubs import fake_work, fake_wikitext, fake_html_page
+from scraper.utils import clean_string
+
+N = 1000
+
+
+def _titles(n: int = N):
+    return [fake_work("10.1000/{}".format(i))["title"][0] for i in range(n)]
+
+
+@benchmark("micro.clean_string", items=N)
+def bench_clean_string():
+    titles = _titles()
+
+    def call():
+        for title in titles:
+            clean_string(title)
+
+    yield call
+
+
+@benchmark("micro.taglist_algebra", items=N)
+def bench_taglist_algebra():
+    words = [title.split() for title in _titles()]
+
+    def call():
+        base = TagList("imported", "benchmark")
+        for title in words:
+            str((base + title) - title[0])
+
+    yield call
+
+
+@benchmark("micro.validate_and_parse_url", items=N)
+def bench_validate_and_parse_url():
+    urls = [
+        url
+        for i in range(N // 4)
+        for url in (
+            "https://en.wikipedia.org/wiki/Page_{}".format(i),
+            "http://dx.doi.org/10.1000/{}".format(i),
+            "https://arxiv.org/abs/1006.{:04d}".format(i),
+            "not a url {}".format(i),
+        )
+    ]
+
+    def call():
+        for url in urls:
+            try:
+                validate_and_parse_url(url)
+            except ValueError:
+                pass
+
+    yield call
+
+
+@benchmark("micro.canonicalize_dois", items=N)
+def bench_canonicalize_dois():
+    # Reference lists link the same DOIs in several spellings
+    links = [
+        link
+        for i in range(N // 4)
+        for link in (
+            "https://doi.org/10.1000%2F{}".format(i % 100),
+            "doi:10.1000/{}".format(i),
+            "https://onlinelibrary.wiley.com/doi/10.1002/(SICI)1097-4636(1997){}:4%3C431::AID-JBM4%3E3.0.CO;2-G/abstract".format(i),
+            "//arxiv.org/abs/1006.{:04d}".format(i),
+        )
+    ]
+
+    def call():
+        canonicalize_dois(links)
+
+    yield call
+
+
+@benchmark("micro.wiki_parse", items=100)
+def bench_wiki_parse():
+    pages = [fake_wikitext("Page {}".format(i)) for i in range(100)]
+
+    def call():
+        for page in pages:
+            for section in wikiparse.parse(page).sections:
+                get_dois(section)
+
+    yield call
+
+
+PAGE_LINKS = 20000
+
+
+def _chunks(page: bytes, size: int = 64 * 1024):
+    return (page[i : i + size] for i in range(0, len(page), size))
+
+
+@benchmark("micro.ref_links_bs4", items=PAGE_LINKS)
+def bench_ref_links_bs4():
+    page = fake_html_page(PAGE_LINKS)
+
+    def call():
+        soup = bs4.BeautifulSoup(page, features="lxml")
+        [link["href"] for link in soup.find_all("a", href=True) if "arxiv" in link["href"] or "doi" in link["href"]]
+
+    yield call
+
+
+@benchmark("micro.ref_links_streaming", items=PAGE_LINKS)
+def bench_ref_links_streaming():
+    page = fake_html_page(PAGE_LINKS)
+
+    def call():
+        list(iter_hrefs(_chunks(page)))
+
+    yield call
@@ -0,0 +1,142 @@
+"""End-to-end benchmarks of the pipeline stages, in documents per second
+
+Every network call goes to a local `scraper.stubs.StubServer` (with no injected latency, so the scraper's own
+overhead is what is measured), and documents are added to throwaway Papis libraries.
+"""
+
+from __future__ import annotations
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+import papis.api
+import papis.config
+import papis.database
+from scraper import endpoints
+from scraper.base_classes import Document
+from scraper.benchmarks.runner import benchmark
+from scraper.library.batch import PapisBatch
+from scraper.stubs import StubServer, fake_work
+
+N = 40
+
+
+@contextmanager
+def stubbed() -> Iterator[StubServer]:
+    with StubServer() as server, endpoints.using(**server.endpoints):
+        yield server
+
+
+@contextmanager
+def papis_library() -> Iterator[str]:
+    """
+    Points Papis at a new library (and cache) in a temporary directory, restoring the previous library afterwards
+    """
+    previous_lib, previous_cache = papis.config.get_lib_name(), os.environ.get("XDG_CACHE_HOME")
+    with tempfile.TemporaryDirectory(prefix="scraper-bench-") as root:
+        os.environ["XDG_CACHE_HOME"] = os.path.join(root, "cache")
+        library = tempfile.mkdtemp(dir=root)
+        papis.api.set_lib_from_name(library)
+        papis.database.clear_cached()
+        try:
+            yield library
+        finally:
+            if previous_cache is None:
+                os.environ.pop("XDG_CACHE_HOME", None)
+            else:
+                os.environ["XDG_CACHE_HOME"] = previous_cache
+            papis.api.set_lib_from_name(previous_lib)
+            papis.database.clear_cached()
+
+
+def doc_ids(n: int = N):
+    """
+    A mix of DOIs, arXiv IDs, PDF URLs and strings which are not IDs at all
+    """
+    return [
+        doc_id
+        for i in range(n // 4)
+        for doc_id in (
+            "doi:10.1000/{}".format(i),
+            "1006.{:04d}".format(i),
+            "https://example.org/papers/{}.pdf".format(i),
+            "not an id {}".format(i),
+        )
+    ]
+
+
+@benchmark("pipeline.classify", items=N)
+def bench_classify():
+    ids = doc_ids()
+    with stubbed():
+        yield lambda: [Document(doc_id) for doc_id in ids]
+
+
+@benchmark("pipeline.scrape", items=N)
+def bench_scrape():
+    with stubbed():
+        docs = [Document("doi:10.1000/{}".format(i)).update({"doi": "10.1000/{}".format(i)}) for i in range(N)]
+        yield lambda: [doc.get_info() for doc in docs]
+
+
+@benchmark("pipeline.download", items=N)
+def bench_download():
+    files = []
+
+    def call():
+        for doc in docs:
+            files.extend(doc.download().files or [])
+
+    with stubbed():
+        docs = [Document("1006.{:04d}".format(i)) for i in range(N)]
+        try:
+            yield call
+        finally:
+            for path in files:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def _scraped_docs(n: int = N):
+    """
+    Documents as they are after scraping: Papis-style metadata and no files
+    """
+    docs = []
+    for work in (fake_work("10.1000/{}".format(i)) for i in range(n)):
+        info = {
+            "doi": work["DOI"],
+            "title": work["title"][0],
+            "author": " and ".join("{family}, {given}".format(**a) for a in work["author"]),
+            "journal": work["container-title"][0],
+            "year": work["issued"]["date-parts"][0][0],
+            "type": "article",
+        }
+        docs.append(Document.from_dict({"doc_id": work["DOI"], "doctype": "Doi", "info": info, "tags": ["benchmark"]}))
+    return docs
+
+
+@benchmark("pipeline.add", items=N)
+def bench_add():
+    docs = _scraped_docs()
+    with papis_library() as library:
+
+        def call():
+            papis.api.set_lib_from_name(tempfile.mkdtemp(dir=os.path.dirname(library)))
+            papis.database.clear_cached()
+            for doc in docs:
+                doc.add_to_library(confirm=False)
+
+        yield call
+
+
+@benchmark("pipeline.add_batch", items=N)
+def bench_add_batch():
+    docs = _scraped_docs()
+    with papis_library() as library:
+
+        def call():
+            with PapisBatch(tempfile.mkdtemp(dir=os.path.dirname(library))) as batch:
+                for doc in docs:
+                    doc.add_to_library(batch=batch)
+
+        yield call
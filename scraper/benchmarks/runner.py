@@ -0,0 +1,183 @@
+"""Registry and runner for the benchmark suite
+
+A benchmark is a generator function which sets up its inputs, yields the callable to time, and cleans up when
+resumed.  Each call of that callable processes `items` items (documents, strings, pages, ...), so results are
+reported as items per second:
+
+>>> @benchmark("demo.sum", items=1000, registry={})
+... def demo_sum():
+...     numbers = list(range(1000))
+...     yield lambda: sum(numbers)
+>>> run_benchmark(demo_sum, repeat=3).items
+1000
+"""
+
+from __future__ import annotations
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from typing import Optional, Callable, Iterator, Iterable, Dict, List
+from scraper import Constants
+
+logger = logging.getLogger()
+
+DEFAULT_HISTORY_PATH = "{}/benchmarks.json".format(Constants.CACHE_DIR.value)
+
+BENCHMARKS = {}
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[[], Iterator[Callable[[], None]]]
+    items: int
+    warmup: int = 1
+
+    def __call__(self):
+        return contextmanager(self.setup)()
+
+
+@dataclass
+class Result:
+    """
+    Timings of one benchmark
+
+    name: str
+        Benchmark name, e.g. "pipeline.scrape"
+    items: int
+        Items processed per timed call
+    seconds: List[float]
+        Duration of each timed call
+    error: Optional[str]
+        Exception which stopped the benchmark, if any
+    """
+
+    name: str
+    items: int
+    seconds: List[float] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def median(self) -> Optional[float]:
+        return statistics.median(self.seconds) if self.seconds else None
+
+    @property
+    def items_per_second(self) -> Optional[float]:
+        return self.items / self.median if self.median else None
+
+    def to_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "repeat": len(self.seconds),
+            "seconds_median": self.median,
+            "seconds_min": min(self.seconds, default=None),
+            "seconds_max": max(self.seconds, default=None),
+            "items_per_second": self.items_per_second,
+            "error": self.error,
+        }
+
+
+def benchmark(name: str, items: int, warmup: int = 1, registry: Optional[Dict[str, Benchmark]] = None):
+    """benchmark.
+    Registers a generator function as a benchmark
+
+    :param name: Benchmark name; "micro.*" and "pipeline.*" by convention
+    :param items: Number of items processed by each call of the yielded callable
+    :param warmup: (Optional) Untimed calls made before timing (default = 1)
+    :param registry: (Optional) Dict to register in (default = BENCHMARKS)
+    """
+
+    def decorator(setup):
+        bench = Benchmark(name, setup, items, warmup)
+        (BENCHMARKS if registry is None else registry)[name] = bench
+        return bench
+
+    return decorator
+
+
+def run_benchmark(bench: Benchmark, repeat: int = 5) -> Result:
+    """run_benchmark.
+    Sets up a benchmark, makes its warmup calls and then `repeat` timed calls.
+    Exceptions are recorded in the result rather than raised, so one broken benchmark does not stop the suite.
+    """
+    result = Result(bench.name, bench.items)
+    try:
+        with bench() as call:
+            for _ in range(bench.warmup):
+                call()
+            for _ in range(repeat):
+                start = time.perf_counter()
+                call()
+                result.seconds.append(time.perf_counter() - start)
+    except Exception as e:
+        logger.debug(traceback.format_exc())
+        logger.warning("Benchmark %s failed: %r", bench.name, e)
+        result.error = repr(e)
+    return result
+
+
+def run(patterns: Iterable[str] = ("*",), repeat: int = 5) -> List[Result]:
+    """run.
+    Runs every registered benchmark whose name matches one of the passed glob patterns
+    """
+    patterns = list(patterns)
+    return [
+        run_benchmark(bench, repeat)
+        for name, bench in BENCHMARKS.items()
+        if any(fnmatch(name, pattern) for pattern in patterns)
+    ]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_run(results: Iterable[Result]) -> dict:
+    """make_run.
+    Returns a history entry for the passed results, labelled with the time, git commit and machine
+    """
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "results": {result.name: result.to_dict() for result in results},
+    }
+
+
+def load_history(path: str = DEFAULT_HISTORY_PATH) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as fptr:
+        return json.load(fptr)
+
+
+def append_history(entry: dict, path: str = DEFAULT_HISTORY_PATH) -> List[dict]:
+    """append_history.
+    Appends a run to the JSON history file (a list of runs, oldest first) and returns the updated history
+    """
+    history = load_history(path) + [entry]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fptr:
+        json.dump(history, fptr, indent=1)
+    os.replace(tmp, path)
+    return history
@@ -0,0 +1,325 @@
+"""Record and replay of HTTP traffic ("cassettes")
+
+While a cassette is recording, every HTTP exchange the scraper makes (Crossref, arXiv, Wikipedia, PDF hosts, DOI
+resolution, ...) is saved to a gzipped JSON Lines archive, one interaction per line.  Replaying the cassette
+answers the same requests from the archive instead, offline and without any network latency, so a slow run can
+be re-run (and profiled) exactly, and doctests which query live services can run offline.
+
+Requests are intercepted below the clients, at the transports all traffic here goes through: requests'
+`HTTPAdapter.send`, urllib's `OpenerDirector.open`, and `httpx2.HTTPTransport.handle_request` (habanero).  URLs are
+recorded after `scraper.endpoints` has rewritten them.  Interactions are matched on method, URL and request body;
+repeated requests get the recorded responses in order, and then the last one again.
+
+>>> with use_cassette('/tmp/run.jsonl.gz', mode='record'):  # doctest: +SKIP
+...     Document('doi:10.1016/j.entcs.2012.08.017').get_info()
+>>> with use_cassette('/tmp/run.jsonl.gz'):  # doctest: +SKIP
+...     Document('doi:10.1016/j.entcs.2012.08.017').get_info()   # same result, no network
+
+Setting SCRAPER_CASSETTE (and optionally SCRAPER_CASSETTE_MODE) in the environment uses a cassette for the whole
+process, e.g. to run the doctests offline:
+
+    $ SCRAPER_CASSETTE=doctests.jsonl.gz SCRAPER_CASSETTE_MODE=record python -m pytest --doctest-modules scraper/apis
+    $ SCRAPER_CASSETTE=doctests.jsonl.gz python -m pytest --doctest-modules scraper/apis
+    $ python -m scraper.cassettes doctests.jsonl.gz     # summarize a cassette
+"""
+
+from __future__ import annotations
+import atexit
+import base64
+import gzip
+import hashlib
+import http.client
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+import urllib.response
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Optional, Iterator, Dict, List, Tuple
+from urllib.parse import urlsplit
+import requests
+import requests.adapters
+import urllib3
+
+try:
+    import httpx2
+except ImportError:
+    httpx2 = None
+
+logger = logging.getLogger()
+
+MODES = ("auto", "record", "replay")
+
+# Bodies are stored decoded, so these no longer describe them
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+_active = None
+_originals = {}
+
+
+class CassetteMiss(LookupError):
+    """
+    Raised on replay for a request which is not in the cassette
+    """
+
+
+def _body_key(body) -> Optional[str]:
+    if not body:
+        return None
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if not isinstance(body, (bytes, bytearray)):
+        return None
+    return hashlib.sha1(body).hexdigest()
+
+
+def _encode_body(body: bytes) -> dict:
+    try:
+        return {"text": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(body).decode("ascii")}
+
+
+def _decode_body(interaction: dict) -> bytes:
+    if "base64" in interaction:
+        return base64.b64decode(interaction["base64"])
+    return interaction.get("text", "").encode("utf-8")
+
+
+class Cassette:
+    """
+    Recorded HTTP interactions, and the record/replay logic
+
+    Methods
+    =======
+    :start, stop:
+        Start and stop intercepting requests.  Stopping a recording cassette saves it.  Also a context manager.
+
+    :save:
+        Writes the recorded interactions to the archive
+
+    :play:
+        Returns the next recorded response for a request, or raises `CassetteMiss`
+
+    :record:
+        Adds an interaction
+
+    Properties
+    ==========
+    recording: bool
+        Whether requests go to the network (and are recorded) rather than being replayed
+
+    interactions: List[dict]
+        Recorded interactions, in order
+    """
+
+    def __init__(self, path: str, mode: str = "auto") -> None:
+        """
+        :param path: Path of the cassette archive (conventionally *.jsonl.gz)
+        :param mode: (Optional) "record" (overwrite the cassette from the network), "replay" (only answer from the
+            cassette) or "auto" (default: replay if the cassette exists, otherwise record)
+        """
+        if mode not in MODES:
+            raise ValueError("Unknown cassette mode '{}'.  Known modes: {}".format(mode, ", ".join(MODES)))
+        self.path = path
+        self.recording = mode == "record" or (mode == "auto" and not os.path.exists(path))
+        self.interactions = [] if self.recording else self.load(path)
+        self._queues = defaultdict(list)
+        for interaction in self.interactions:
+            self._queues[self._key(interaction)].append(interaction)
+        self._played = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(path: str) -> List[dict]:
+        with gzip.open(path, "rt", encoding="utf-8") as fptr:
+            return [json.loads(line) for line in fptr if line.strip()]
+
+    @staticmethod
+    def _key(interaction: dict) -> Tuple[str, str, Optional[str]]:
+        return interaction["method"].upper(), interaction["url"], interaction.get("request_body")
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as fptr:
+            for interaction in self.interactions:
+                fptr.write(json.dumps(interaction, separators=(",", ":")) + "\n")
+        os.replace(tmp, self.path)
+        logger.info("Saved %d HTTP interactions to %s", len(self.interactions), self.path)
+
+    def record(
+        self, method: str, url: str, request_body, status: int, reason: str, headers: Dict[str, str], body: bytes
+    ) -> None:
+        interaction = {
+            "method": method.upper(),
+            "url": url,
+            "request_body": _body_key(request_body),
+            "status": status,
+            "reason": reason,
+            "headers": {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS},
+            **_encode_body(body),
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def play(self, method: str, url: str, request_body=None) -> Tuple[int, str, Dict[str, str], bytes]:
+        """
+        Returns the status, reason, headers and body of the next recorded response to a request
+        """
+        key = (method.upper(), url, _body_key(request_body))
+        with self._lock:
+            recorded = self._queues.get(key)
+            if not recorded:
+                raise CassetteMiss("{} {} is not in the cassette {}".format(method, url, self.path))
+            interaction = recorded[min(self._played[key], len(recorded) - 1)]
+            self._played[key] += 1
+        return interaction["status"], interaction.get("reason", ""), interaction["headers"], _decode_body(interaction)
+
+    def start(self) -> Cassette:
+        global _active
+        if _active is not None:
+            raise RuntimeError("A cassette is already in use: {}".format(_active.path))
+        _active = self
+        _install()
+        logger.debug("%s cassette %s", "Recording" if self.recording else "Replaying", self.path)
+        return self
+
+    def stop(self) -> None:
+        global _active
+        if _active is not self:
+            return
+        _active = None
+        _uninstall()
+        if self.recording:
+            self.save()
+
+    def __enter__(self) -> Cassette:
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def _adapter_send(adapter, request, *args, **kwargs):
+    cassette = _active
+    if cassette is None:
+        return _originals["requests"](adapter, request, *args, **kwargs)
+    if cassette.recording:
+        response = _originals["requests"](adapter, request, *args, **kwargs)
+        cassette.record(
+            request.method, request.url, request.body, response.status_code, response.reason, response.headers, response.content
+        )
+        return response
+    status, reason, headers, body = cassette.play(request.method, request.url, request.body)
+    # A real (unread) urllib3 response, so `stream=True`, `iter_content` and `raw` behave as they do live
+    raw = urllib3.HTTPResponse(
+        body=io.BytesIO(body), headers=headers, status=status, reason=reason, preload_content=False
+    )
+    return adapter.build_response(request, raw)
+
+
+def _http_message(headers: Dict[str, str]) -> http.client.HTTPMessage:
+    message = http.client.HTTPMessage()
+    for key, value in headers.items():
+        message[key] = value
+    return message
+
+
+def _opener_open(opener, fullurl, data=None, *args, **kwargs):
+    cassette = _active
+    if cassette is None:
+        return _originals["urllib"](opener, fullurl, data, *args, **kwargs)
+    request = fullurl if isinstance(fullurl, urllib.request.Request) else urllib.request.Request(fullurl, data)
+    method, url, request_body = request.get_method(), request.full_url, data if data is not None else request.data
+    if cassette.recording:
+        try:
+            response = _originals["urllib"](opener, fullurl, data, *args, **kwargs)
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            cassette.record(method, url, request_body, e.code, str(e.reason), dict(e.headers or {}), body)
+            raise urllib.error.HTTPError(e.url, e.code, e.msg, e.hdrs, io.BytesIO(body)) from e
+        body = response.read()
+        cassette.record(method, url, request_body, response.status, response.reason, dict(response.headers), body)
+        return urllib.response.addinfourl(io.BytesIO(body), response.headers, response.url, response.status)
+    status, reason, headers, body = cassette.play(method, url, request_body)
+    if status >= 400:
+        raise urllib.error.HTTPError(url, status, reason, _http_message(headers), io.BytesIO(body))
+    return urllib.response.addinfourl(io.BytesIO(body), _http_message(headers), url, status)
+
+
+def _handle_request(transport, request):
+    cassette = _active
+    if cassette is None:
+        return _originals["httpx"](transport, request)
+    method, url = request.method, str(request.url)
+    if cassette.recording:
+        response = _originals["httpx"](transport, request)
+        body = response.read()
+        cassette.record(method, url, request.content, response.status_code, response.reason_phrase, dict(response.headers), body)
+        return response
+    status, reason, headers, body = cassette.play(method, url, request.content)
+    return httpx2.Response(status, headers=headers, content=body, request=request)
+
+
+def _install() -> None:
+    if _originals:
+        return
+    _originals["requests"] = requests.adapters.HTTPAdapter.send
+    _originals["urllib"] = urllib.request.OpenerDirector.open
+    requests.adapters.HTTPAdapter.send = _adapter_send
+    urllib.request.OpenerDirector.open = _opener_open
+    if httpx2 is not None:
+        _originals["httpx"] = httpx2.HTTPTransport.handle_request
+        httpx2.HTTPTransport.handle_request = _handle_request
+
+
+def _uninstall() -> None:
+    if not _originals:
+        return
+    requests.adapters.HTTPAdapter.send = _originals.pop("requests")
+    urllib.request.OpenerDirector.open = _originals.pop("urllib")
+    if httpx2 is not None:
+        httpx2.HTTPTransport.handle_request = _originals.pop("httpx")
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = "auto") -> Iterator[Cassette]:
+    """use_cassette.
+    Records or replays HTTP traffic within a block
+
+    :param path: Path of the cassette archive
+    :param mode: (Optional) "auto" (default), "record" or "replay" (see `Cassette`)
+    """
+    with Cassette(path, mode) as cassette:
+        yield cassette
+
+
+def get_active() -> Optional[Cassette]:
+    return _active
+
+
+def summary(path: str) -> str:
+    interactions = Cassette.load(path)
+    by_host = Counter((urlsplit(i["url"]).netloc, i["status"]) for i in interactions)
+    size = sum(len(_decode_body(i)) for i in interactions)
+    lines = ["{} interactions, {} bytes of response bodies".format(len(interactions), size)]
+    lines += ["{:>6}  {}  {}".format(count, status, host) for (host, status), count in by_host.most_common()]
+    return "\n".join(lines)
+
+
+if os.environ.get("SCRAPER_CASSETTE") and __name__ != "__main__":
+    atexit.register(
+        Cassette(os.environ["SCRAPER_CASSETTE"], os.environ.get("SCRAPER_CASSETTE_MODE", "auto")).start().stop
+    )
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print("== {} ==".format(path))
+        print(summary(path))
@@ -16,6 +16,11 @@ from enum import Enum, auto
 from typing import NamedTuple, Callable, Optional, Collection, Mapping, Any
 from urllib.parse import urlsplit, urlunsplit, SplitResult
 from validators import url as valid_total_url
+from scraper import profiling
+from scraper.logger import configure_logging
+
+profiling.from_argv()
+configure_logging()
 
 # Validator = Callable[str, Optional[str]]
 # Downloader = Callable[[str, ...], Collection[str]]
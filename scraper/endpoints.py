@@ -0,0 +1,168 @@
+"""Endpoint configuration for the web services the scraper talks to
+
+The clients used by the scraper (crossrefapi, habanero via Papis, papis.arxiv, wikipedia, scidownl, ...) build their
+own URLs, so endpoints are not configured client by client.  Instead each service is identified by the URL
+prefixes its clients use, and requests to those prefixes are rewritten to the configured base URL, at the two
+places all HTTP traffic here goes through: `requests.Session.request` and `urllib.request.urlopen` (and
+`httpx2.Client.request`, which habanero uses, when it is installed).
+
+Overrides are read from config/endpoints.yaml and SCRAPER_ENDPOINT_<SERVICE> environment variables at import,
+and can be set at runtime with `configure` (e.g. to point everything at `scraper.stubs.StubServer`):
+
+    $ SCRAPER_ENDPOINT_CROSSREF=http://127.0.0.1:8080/crossref python -m scraper.pipeline.journal ...
+
+>>> configure(crossref='http://127.0.0.1:8080/crossref')
+>>> rewrite('https://api.crossref.org/works/10.1007/BF01220868')
+'http://127.0.0.1:8080/crossref/works/10.1007/BF01220868'
+>>> rewrite('https://example.com/paper.pdf')
+'https://example.com/paper.pdf'
+>>> reset()
+"""
+
+from __future__ import annotations
+import logging
+import os
+import re
+import sys
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Iterator
+import requests
+import yaml
+
+try:
+    import httpx2
+except ImportError:
+    httpx2 = None
+
+logger = logging.getLogger()
+
+CONFIG_PATH = "{}/config/endpoints.yaml".format(Path(__file__).parent.parent)
+
+SERVICES = {
+    "crossref": re.compile(r"^https?://api\.crossref\.org(?=/|$)"),
+    "arxiv": re.compile(r"^https?://(?:export\.)?arxiv\.org/api(?=/|$)"),
+    "mediawiki": re.compile(r"^https?://[a-z\-]+\.wikipedia\.org/w/api\.php(?=\?|$)"),
+    "pdf": re.compile(r"^https?://(?:arxiv\.org/pdf|(?:[a-z0-9\-]+\.)*sci-hub\.[a-z]+)(?=/|$)"),
+    # Used to validate IDs: DOIs are resolved with the DOI handle API, arXiv IDs by fetching their abstract page
+    "doi": re.compile(r"^https?://(?:dx\.)?doi\.org/api/handles(?=/|$)"),
+    "arxiv_abs": re.compile(r"^https?://(?:www\.|export\.)?arxiv\.org/abs(?=/|$)"),
+}
+
+_endpoints = {}
+_originals = {}
+
+
+def rewrite(url: str) -> str:
+    """rewrite.
+    Returns the URL a request for `url` should actually go to under the current configuration
+
+    :param url: URL as built by a client library
+    """
+    for service, base in _endpoints.items():
+        if match := SERVICES[service].match(url):
+            return base.rstrip("/") + url[match.end() :]
+    return url
+
+
+def _session_request(self, method, url, *args, **kwargs):
+    return _originals["requests"](self, method, rewrite(url), *args, **kwargs)
+
+
+def _httpx_request(self, method, url, *args, **kwargs):
+    return _originals["httpx"](self, method, rewrite(str(url)), *args, **kwargs)
+
+
+def _urlopen(url, *args, **kwargs):
+    if isinstance(url, urllib.request.Request):
+        url.full_url = rewrite(url.full_url)
+    else:
+        url = rewrite(url)
+    return _originals["urllib"](url, *args, **kwargs)
+
+
+def _install() -> None:
+    if _originals:
+        return
+    _originals["requests"] = requests.Session.request
+    _originals["urllib"] = urllib.request.urlopen
+    requests.Session.request = _session_request
+    if httpx2 is not None:
+        _originals["httpx"] = httpx2.Client.request
+        httpx2.Client.request = _httpx_request
+    # Modules which did `from urllib.request import urlopen` before now (e.g. arxiv2bib) hold their own reference
+    _originals["modules"] = [
+        module
+        for module in list(sys.modules.values())
+        if getattr(module, "urlopen", None) is _originals["urllib"]
+    ]
+    for module in _originals["modules"]:
+        module.urlopen = _urlopen
+
+
+def _uninstall() -> None:
+    if not _originals:
+        return
+    requests.Session.request = _originals.pop("requests")
+    if httpx2 is not None:
+        httpx2.Client.request = _originals.pop("httpx")
+    original = _originals.pop("urllib")
+    for module in _originals.pop("modules"):
+        module.urlopen = original
+
+
+def configure(**endpoints: Optional[str]) -> None:
+    """configure.
+    Points services at new base URLs (or back at their defaults, if None is passed)
+
+    :param endpoints: Base URLs keyed by service name: crossref, arxiv, mediawiki, pdf, doi or arxiv_abs
+    """
+    for service, base in endpoints.items():
+        if service not in SERVICES:
+            raise ValueError("Unknown service '{}'.  Known services: {}".format(service, ", ".join(SERVICES)))
+        if base:
+            _endpoints[service] = base
+        else:
+            _endpoints.pop(service, None)
+    if _endpoints:
+        _install()
+    else:
+        _uninstall()
+    logger.debug("Endpoints: %s", _endpoints)
+
+
+def reset() -> None:
+    configure(**{service: None for service in SERVICES})
+
+
+def get_endpoints() -> Dict[str, str]:
+    return dict(_endpoints)
+
+
+@contextmanager
+def using(**endpoints: Optional[str]) -> Iterator[None]:
+    """using.
+    Temporarily points services at new base URLs
+    """
+    previous = get_endpoints()
+    configure(**endpoints)
+    try:
+        yield
+    finally:
+        reset()
+        configure(**previous)
+
+
+def _load_defaults() -> Dict[str, str]:
+    endpoints = {}
+    if os.path.exists(CONFIG_PATH):
+        with open(CONFIG_PATH) as f:
+            endpoints.update(yaml.load(f, Loader=yaml.FullLoader) or {})
+    for service in SERVICES:
+        if base := os.environ.get("SCRAPER_ENDPOINT_{}".format(service.upper())):
+            endpoints[service] = base
+    return endpoints
+
+
+configure(**_load_defaults())
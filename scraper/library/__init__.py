@@ -0,0 +1,5 @@
+from .dedup import *
+from .fulltext import *
+from .bulk_import import *
+from .batch import *
+from .existence import *
@@ -0,0 +1,188 @@
+"""Batched commits of many documents to a Papis library
+
+`papis.commands.add.run` handles one document at a time: it stages the document in a temporary folder, scans the
+library for duplicates, moves the folder into place and then re-writes the whole library cache.  `PapisBatch`
+stages documents in memory, writes each document's folder and info.yaml directly in place, and updates the
+library database once per commit.
+"""
+
+from __future__ import annotations
+import logging
+import os
+import shutil
+from string import ascii_lowercase
+from typing import Optional, Collection, Mapping, Any, List, Tuple, Callable
+import papis.bibtex
+import papis.database
+import papis.database.cache
+import papis.document
+import papis.utils
+from papis.commands.add import get_file_name, get_hash_folder
+from scraper import metrics, tracing
+from scraper.library.dedup import LSHIndex
+
+logger = logging.getLogger()
+
+
+class PapisBatch:
+    """
+    Stages documents and adds them to a Papis library in a single commit.
+    Can be used as a context manager, in which case staged documents are committed on a clean exit.
+
+    Methods
+    =======
+    :stage:
+        Stages files and metadata for the next commit
+
+    :add:
+        Stages a `scraper.base_classes.Document` (equivalent to `Document.add_to_library(batch=...)`)
+
+    :commit:
+        Writes all staged documents to the library and updates the library database once; returns the new Papis documents.
+        Keys of documents which could not be written are left in `failed`.
+
+    >>> with PapisBatch(link=True) as batch:  # doctest: +SKIP
+    ...     for doc in docs:
+    ...         doc.add_to_library(batch=batch)
+    """
+
+    def __init__(
+        self,
+        library: Optional[str] = None,
+        link: bool = False,
+        subfolder: Optional[str] = None,
+        duplicates=None,
+    ) -> None:
+        """
+        :param library: (Optional) Name of the Papis library to add to.  The current library is used if none is passed
+        :param link: (Optional) Whether to create symlinks instead of copying files (default = False)
+        :param subfolder: (Optional) Folder within the library in which to create document folders
+        :param duplicates: (Optional) `scraper.library.LSHIndex` used to skip near-duplicates, as in `Document.add_to_library`.
+            Documents are indexed in it once written; near-duplicates within one batch are caught by a staged-only index.
+        """
+        self.library = library
+        self.link = link
+        self.subfolder = subfolder
+        self.duplicates = duplicates
+        self.failed = []
+        self._staged = []
+        self._staged_duplicates = None
+
+    def __len__(self) -> int:
+        return len(self._staged)
+
+    def __enter__(self) -> PapisBatch:
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.commit()
+
+    def stage(
+        self,
+        files: Collection[str],
+        data: Mapping[str, Any],
+        key: Optional[str] = None,
+        on_commit: Optional[Callable[[], None]] = None,
+    ) -> bool:
+        """
+        Stages files and metadata for the next commit.  Returns False if the document was skipped as a duplicate.
+
+        :param files: Paths of the document's files
+        :param data: Document metadata
+        :param key: (Optional) Key identifying the document in the duplicates index and in `failed`
+        :param on_commit: (Optional) Called once the document has been written and the library database updated
+        """
+        if isinstance(files, str):
+            files = [files]
+        for path in files:
+            if not os.path.exists(path):
+                raise IOError("Document {} not found".format(path))
+        if self.duplicates is not None:
+            if self._staged_duplicates is None:
+                self._staged_duplicates = LSHIndex(
+                    self.duplicates.hasher, self.duplicates.bands, self.duplicates.threshold
+                )
+            if found := self.duplicates.query(data) or self._staged_duplicates.query(data):
+                logger.warning(
+                    "Not adding %s: likely duplicate of %s (similarity %.2f)",
+                    key or data.get("title"),
+                    *found[0],
+                )
+                return False
+            self._staged_duplicates.add(key or len(self._staged), data)
+        self._staged.append((key, list(files), dict(data), on_commit))
+        return True
+
+    def add(self, doc, key: Optional[str] = None, on_commit: Optional[Callable[[], None]] = None, **kwargs) -> bool:
+        return self.stage(
+            doc.files or [], doc.info | {"tags": str(doc.tags)} | kwargs, key=key or doc.doc_id, on_commit=on_commit
+        )
+
+    def _write(self, lib_dir: str, files: List[str], data: dict) -> papis.document.Document:
+        folder = os.path.join(lib_dir, self.subfolder or "", get_hash_folder(data, files))
+        os.makedirs(folder)
+        suffixes = papis.utils.create_identifier(ascii_lowercase)
+        suffix, names = "", []
+        for path in files:
+            name = papis.utils.clean_document_name(get_file_name(data, path, suffix=suffix))
+            suffix = next(suffixes)
+            if self.link:
+                os.symlink(os.path.abspath(path), os.path.join(folder, name))
+            else:
+                shutil.copy(path, os.path.join(folder, name))
+            names.append(name)
+        data["files"] = names
+        if data.get("ref") is None:
+            data["ref"] = papis.bibtex.create_reference(data)
+        doc = papis.document.Document(data=data)
+        doc.set_folder(folder)
+        doc.save()
+        return doc
+
+    def _update_database(self, database, docs: List[papis.document.Document]) -> None:
+        if isinstance(database, papis.database.cache.Database):
+            # The cache backend pickles the whole library on every `add`
+            database.get_documents().extend(docs)
+            database.save()
+        elif hasattr(database, "add_document_with_writer"):
+            # Whoosh: one writer and one commit for the whole batch
+            writer = database.get_writer()
+            schema_keys = database.get_schema_init_fields().keys()
+            for doc in docs:
+                database.add_document_with_writer(doc, writer, schema_keys)
+            writer.commit()
+        else:
+            for doc in docs:
+                database.add(doc)
+
+    def commit(self) -> List[papis.document.Document]:
+        if not self._staged:
+            return []
+        database = papis.database.get(self.library)
+        lib_dir = os.path.expanduser(database.get_dirs()[0])
+        if isinstance(database, papis.database.cache.Database):
+            # Load (or index) the library before writing, so new folders are not picked up twice
+            database.get_documents()
+        docs, callbacks, self.failed = [], [], []
+        with metrics.track("add_batch"), tracing.span("PapisBatch.commit", documents=len(self._staged)):
+            for key, files, data, on_commit in self._staged:
+                try:
+                    docs.append(self._write(lib_dir, files, data))
+                except Exception as e:
+                    logger.warning(
+                        'Failed to write document "%s" to library.  Exception: %s', key or data.get("title"), e
+                    )
+                    self.failed.append(key)
+                    continue
+                if self.duplicates is not None:
+                    self.duplicates.add(key or len(self.duplicates), data)
+                if on_commit is not None:
+                    callbacks.append(on_commit)
+            self._update_database(database, docs)
+        for on_commit in callbacks:
+            on_commit()
+        logger.info("Committed %d of %d staged documents", len(docs), len(self._staged))
+        self._staged = []
+        self._staged_duplicates = None
+        return docs
@@ -0,0 +1,266 @@
+"""Parallel bulk import of an existing directory tree of PDFs into a Papis library
+
+Each PDF is identified (DOI, then ArXiv ID) from a single cached analysis, classified into a `Document`,
+and its metadata is scraped, all in a process pool, except that arXiv metadata is fetched by the parent process, up to
+ARXIV_BATCH_SIZE IDs per request (arXiv asks for one request at a time).  Documents are then committed to the library in batches
+(see `scraper.library.batch`) with `link=True`, so no files are copied.
+Every handled file is appended to a checkpoint file, and re-runs skip files whose size and mtime are unchanged.
+
+Usage:
+
+    $ python -m scraper.library.bulk_import DIRECTORY [tag ...]
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, Iterator, Tuple, List
+from scraper import Constants, profiling
+from scraper.logger import configure_logging, configure_worker, worker_initargs
+from scraper.base_classes import Document, Doi, Arxiv
+from scraper.utils import get_validated_doi_from_pdf, get_arxivid_from_pdf
+from scraper.library.batch import PapisBatch
+from scraper.base_classes.arxiv import ARXIV_BATCH_SIZE
+
+logger = logging.getLogger()
+
+ADDED = "added"
+DUPLICATE = "duplicate"
+UNIDENTIFIED = "unidentified"
+FAILED = "failed"
+
+
+def find_pdfs(root: str) -> Iterator[str]:
+    """find_pdfs.
+    Yields the absolute paths of all PDFs under a directory, in a stable order
+
+    :param root: Directory to walk
+    """
+    for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+        dirnames.sort()
+        yield from (
+            os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith(".pdf")
+        )
+
+
+def get_checkpoint_path(root: str) -> str:
+    digest = hashlib.sha1(os.path.realpath(root).encode("utf-8")).hexdigest()[:12]
+    return "{}/bulk-import-{}.jsonl".format(Constants.CACHE_DIR.value, digest)
+
+
+def _drop_torn_tail(path: str, chunk_size: int = 64 * 1024) -> None:
+    """
+    Truncates a file after its last newline, so new lines aren't appended to a torn one
+    """
+    with open(path, "rb+") as fptr:
+        end = fptr.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        fptr.seek(end - 1)
+        if fptr.read(1) == b"\n":
+            return
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            fptr.seek(start)
+            found = fptr.read(position - start).rfind(b"\n")
+            if found >= 0:
+                fptr.truncate(start + found + 1)
+                return
+            position = start
+        fptr.truncate(0)
+
+
+class Checkpoint:
+    """
+    Append-only JSON Lines record of the files an import has handled.
+    A file counts as handled if its size and mtime match the last record for it and that record is not a failure.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._done = {}
+        if os.path.exists(path):
+            with open(path) as fptr:
+                for line in fptr:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from an interrupted run
+                        continue
+                    self._done[entry["path"]] = entry
+            _drop_torn_tail(path)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fptr = open(path, "a")
+
+    def __enter__(self) -> Checkpoint:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._fptr.close()
+
+    def handled(self, path: str, stat: os.stat_result) -> bool:
+        entry = self._done.get(path)
+        return (
+            entry is not None
+            and entry["status"] != FAILED
+            and (entry["size"], entry["mtime"]) == (stat.st_size, stat.st_mtime)
+        )
+
+    def record(self, path: str, stat: os.stat_result, status: str, doc_id: Optional[str] = None) -> None:
+        entry = {
+            "path": path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "status": status,
+            "doc_id": doc_id,
+        }
+        self._done[path] = entry
+        self._fptr.write(json.dumps(entry) + "\n")
+        self._fptr.flush()
+
+
+def identify_pdf(path: str) -> Optional[str]:
+    """identify_pdf.
+    Returns the DOI or ArXiv ID found in a PDF (the DOI is preferred), or None
+
+    :param path: Path of the PDF
+    """
+    return get_validated_doi_from_pdf(path) or get_arxivid_from_pdf(path)
+
+
+def _import_worker(path: str) -> Tuple[str, Optional[Document]]:
+    found = identify_pdf(path)
+    if found is None:
+        return path, None
+    doc = Document(found).add_files(path)
+    if doc.doctype is None:
+        return path, None
+    if doc.doctype is Arxiv:
+        # Metadata of arXiv documents is fetched by the parent, many IDs per request (see `Arxiv.fetch_info`)
+        return path, doc
+    if doc.doctype is Doi:
+        doc.update({"doi": doc.doc_id})
+    return path, doc.get_info()
+
+
+def _fill_arxiv_info(docs: List[Document]) -> None:
+    """
+    Fills the metadata of arXiv documents with batched arXiv API requests, then adds Crossref's for those with a DOI
+    """
+    Arxiv.fetch_info(docs)
+    for doc in docs:
+        if doc.info.get("doi"):
+            doc.get_info()
+
+
+def import_directory(
+    root: str,
+    *tags,
+    processes: Optional[int] = None,
+    checkpoint: Optional[str] = None,
+    batch_size: int = 100,
+    library: Optional[str] = None,
+    duplicates=None,
+    **kwargs,
+) -> Counter:
+    """import_directory.
+    Imports every PDF under a directory that has not been handled by a previous run
+
+    :param root: Directory to import
+    :param tags: Tags to apply in Papis
+    :kw processes: (Optional) Size of the process pool (default = number of CPUs)
+    :kw checkpoint: (Optional) Path of the checkpoint file.  Defaults to a file in the cache directory derived from `root`
+    :kw batch_size: (Optional) Number of documents per library commit (default = 100)
+    :kw library: (Optional) Name of the Papis library to import into
+    :kw duplicates: (Optional) `scraper.library.LSHIndex` of the library; near-duplicates are recorded as DUPLICATE
+    :param kwargs: Properties to set in each document's info.yaml file
+    """
+    counts = Counter()
+    batch = PapisBatch(library=library, link=True, duplicates=duplicates)
+    staged = {}
+    arxiv_docs = {}
+
+    def stage(path, doc):
+        doc.tags += tags
+        if not batch.add(doc, key=path, **kwargs):
+            progress.record(path, stats[path], DUPLICATE, doc.doc_id)
+            counts[DUPLICATE] += 1
+            return
+        staged[path] = doc
+        if len(batch) >= batch_size:
+            commit()
+
+    def stage_arxiv():
+        try:
+            _fill_arxiv_info(list(arxiv_docs.values()))
+        except Exception as e:
+            logger.warning("Failed to fetch arXiv metadata for %d PDFs.  Exception: %s", len(arxiv_docs), e)
+            for path in arxiv_docs:
+                progress.record(path, stats[path], FAILED)
+                counts[FAILED] += 1
+        else:
+            for path, doc in arxiv_docs.items():
+                stage(path, doc)
+        arxiv_docs.clear()
+
+    def commit():
+        batch.commit()
+        for path, doc in staged.items():
+            status = FAILED if path in batch.failed else ADDED
+            progress.record(path, stats[path], status, doc.doc_id)
+            counts[status] += 1
+        staged.clear()
+
+    with Checkpoint(checkpoint or get_checkpoint_path(root)) as progress:
+        stats = {}
+        for path in find_pdfs(root):
+            try:
+                stats[path] = os.stat(path)
+            except OSError as e:
+                # e.g. a broken symlink, or a file deleted during the walk; it is tried again on the next run
+                logger.warning('Skipping "%s".  Exception: %s', path, e)
+                counts[FAILED] += 1
+        pending = [path for path, stat in stats.items() if not progress.handled(path, stat)]
+        counts["skipped"] = len(stats) - len(pending)
+        logger.info("Importing %d PDFs (%d already handled)", len(pending), counts["skipped"])
+        with ProcessPoolExecutor(processes, initializer=configure_worker, initargs=worker_initargs()) as pool:
+            futures = {pool.submit(_import_worker, path): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    _, doc = future.result()
+                except Exception as e:
+                    logger.warning('Failed to identify "%s".  Exception: %s', path, e)
+                    progress.record(path, stats[path], FAILED)
+                    counts[FAILED] += 1
+                    continue
+                if doc is None:
+                    progress.record(path, stats[path], UNIDENTIFIED)
+                    counts[UNIDENTIFIED] += 1
+                    continue
+                if doc.doctype is Arxiv:
+                    arxiv_docs[path] = doc
+                    if len(arxiv_docs) >= ARXIV_BATCH_SIZE:
+                        stage_arxiv()
+                    continue
+                stage(path, doc)
+        if arxiv_docs:
+            stage_arxiv()
+        commit()
+    return counts
+
+
+if __name__ == "__main__":
+    profiling.from_argv()
+    configure_logging()
+    print(dict(import_directory(sys.argv[1], *sys.argv[2:])))
@@ -0,0 +1,255 @@
+"""Near-duplicate detection for Papis documents using MinHash signatures and LSH
+
+The same work often shows up as an ArXiv preprint, a journal DOI and a stray PDF URL, each with a slightly different title.
+Comparing every pair of documents is quadratic, so documents are instead reduced to MinHash signatures over shingled title + author text,
+and a banded locality-sensitive hash (LSH) index is used to find candidate pairs, which are then checked against a similarity threshold.
+
+Usage as a batch job over a whole library:
+
+    $ python -m scraper.library.dedup [library]
+"""
+
+from __future__ import annotations
+import logging
+import random
+import re
+import sys
+import unicodedata
+import zlib
+from collections import defaultdict
+from typing import Optional, Hashable, Iterable, Mapping, Any, List, Set, Tuple
+from papis import api as Papis
+from scraper import profiling
+from scraper.logger import configure_logging
+
+logger = logging.getLogger()
+
+# Mersenne prime used as the modulus for the universal hash family
+_PRIME = (1 << 61) - 1
+
+
+def normalize_text(string: Optional[str]) -> str:
+    """normalize_text.
+    Lowercases, strips accents and punctuation, and collapses whitespace.
+
+    :param string: Text to normalize
+
+    >>> normalize_text('  A Simply-Typed λ-Calculus  of Forward  AD. ')
+    'a simply typed λ calculus of forward ad'
+    >>> normalize_text(None)
+    ''
+    """
+    if not string:
+        return ""
+    string = unicodedata.normalize("NFKD", string)
+    string = "".join(c for c in string if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[\W_]+", " ", string.lower()).split())
+
+
+def get_signature_text(info: Mapping[str, Any]) -> str:
+    """get_signature_text.
+    Builds the text which is shingled to produce a document's signature: the normalized title followed by the sorted family names of the authors.
+    Understands both Papis-style records ('author_list' / 'author' strings) and raw Crossref records (lists of titles and author dicts).
+
+    :param info: Document metadata (Document.info, a Papis document, or a Crossref record)
+
+    >>> get_signature_text({'title': 'Closed Categories', 'author': 'Eilenberg, S. and Kelly, G. M.'})
+    'closed categories eilenberg kelly'
+    >>> get_signature_text({'title': ['Closed categories'], 'author': [{'family': 'Kelly'}, {'family': 'Eilenberg'}]})
+    'closed categories eilenberg kelly'
+    """
+    title = info.get("title") or ""
+    if isinstance(title, (list, tuple)):
+        title = title[0] if title else ""
+    authors = info.get("author_list") or info.get("author") or []
+    if isinstance(authors, str):
+        names = [a.split(",")[0] for a in authors.split(" and ")]
+    else:
+        names = [a.get("family", "") if isinstance(a, Mapping) else str(a) for a in authors]
+    families = sorted(filter(None, map(normalize_text, names)))
+    return " ".join([normalize_text(title), *families]).strip()
+
+
+class MinHasher:
+    """
+    Computes fixed-length MinHash signatures of character shingles.
+    The fraction of equal positions in two signatures estimates the Jaccard similarity of the underlying shingle sets.
+
+    >>> hasher = MinHasher(num_perm=64)
+    >>> sig = hasher.signature('a simply typed lambda calculus')
+    >>> len(sig)
+    64
+    >>> hasher.similarity(sig, hasher.signature('a simply typed lambda calculus'))
+    1.0
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1) -> None:
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)
+        ]
+
+    def shingles(self, text: str) -> Set[str]:
+        """
+        Returns the set of overlapping character k-grams of the passed text
+
+        >>> sorted(MinHasher(shingle_size=3).shingles('abcd'))
+        ['abc', 'bcd']
+        """
+        k = self.shingle_size
+        if len(text) <= k:
+            return {text} if text else set()
+        return {text[i : i + k] for i in range(len(text) - k + 1)}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [zlib.crc32(s.encode("utf-8")) for s in self.shingles(text)]
+        if not hashes:
+            return tuple([_PRIME] * self.num_perm)
+        return tuple(min([(a * h + b) % _PRIME for h in hashes]) for a, b in self._perms)
+
+    @staticmethod
+    def similarity(sig1: Tuple[int, ...], sig2: Tuple[int, ...]) -> float:
+        return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+class LSHIndex:
+    """
+    Banded LSH index over MinHash signatures of document metadata.
+    Each signature is split into `bands` bands; two documents become candidates if any band matches exactly,
+    and candidates are only reported as duplicates if their estimated similarity reaches `threshold`.
+
+    Methods
+    =======
+    :add:
+        Adds a document's metadata to the index under the given key
+
+    :query:
+        Returns (key, similarity) pairs for indexed documents resembling the passed metadata
+
+    :duplicates:
+        Returns groups of keys whose documents are near-duplicates of one another
+
+    >>> index = LSHIndex()
+    >>> index.add('a', {'title': 'A Simply Typed Lambda-Calculus of Forward Automatic Differentiation', 'author': 'Manzyuk, Oleksandr'})
+    >>> index.add('b', {'title': 'Closed categories', 'author': 'Eilenberg, S.'})
+    >>> [key for key, _ in index.query({'title': 'A simply typed lambda calculus of forward automatic differentiation.', 'author': 'Manzyuk, O.'})]
+    ['a']
+    """
+
+    def __init__(
+        self, hasher: Optional[MinHasher] = None, bands: int = 16, threshold: float = 0.7
+    ) -> None:
+        self.hasher = hasher or MinHasher()
+        if self.hasher.num_perm % bands:
+            raise ValueError(
+                "Number of bands ({}) must divide the signature length ({})".format(
+                    bands, self.hasher.num_perm
+                )
+            )
+        self.bands = bands
+        self.rows = self.hasher.num_perm // bands
+        self.threshold = threshold
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+        self._signatures = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._signatures
+
+    def _bands(self, signature: Tuple[int, ...]) -> Iterable[Tuple[int, ...]]:
+        r = self.rows
+        return (signature[i * r : (i + 1) * r] for i in range(self.bands))
+
+    def signature(self, info: Mapping[str, Any]) -> Tuple[int, ...]:
+        return self.hasher.signature(get_signature_text(info))
+
+    def add(self, key: Hashable, info: Mapping[str, Any]) -> None:
+        if not get_signature_text(info):
+            logger.debug("Not indexing %s: no title or author data", key)
+            return
+        signature = self.signature(info)
+        self._signatures[key] = signature
+        for bucket, band in zip(self._buckets, self._bands(signature)):
+            bucket[band].append(key)
+
+    def query(self, info: Mapping[str, Any]) -> List[Tuple[Hashable, float]]:
+        if not get_signature_text(info):
+            return []
+        signature = self.signature(info)
+        candidates = {
+            key
+            for bucket, band in zip(self._buckets, self._bands(signature))
+            for key in bucket.get(band, ())
+        }
+        scored = [
+            (key, self.hasher.similarity(signature, self._signatures[key]))
+            for key in candidates
+        ]
+        return sorted(
+            [(key, score) for key, score in scored if score >= self.threshold],
+            key=lambda pair: -pair[1],
+        )
+
+    def candidate_pairs(self) -> Set[Tuple[Hashable, Hashable]]:
+        pairs = set()
+        for bucket in self._buckets:
+            for keys in bucket.values():
+                for i, first in enumerate(keys):
+                    for second in keys[i + 1 :]:
+                        pairs.add((first, second))
+        return pairs
+
+    def duplicates(self) -> List[Set[Hashable]]:
+        """
+        Groups indexed keys into sets of near-duplicates (transitively), using union-find over the verified candidate pairs
+        """
+        parent = {}
+
+        def find(key):
+            parent.setdefault(key, key)
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for first, second in self.candidate_pairs():
+            sim = self.hasher.similarity(self._signatures[first], self._signatures[second])
+            if sim >= self.threshold:
+                parent[find(first)] = find(second)
+        groups = defaultdict(set)
+        for key in parent:
+            groups[find(key)].add(key)
+        return [group for group in groups.values() if len(group) > 1]
+
+    @classmethod
+    def from_library(cls: LSHIndex, library: Optional[str] = None, **kwargs) -> LSHIndex:
+        """
+        Builds an index over every document in a Papis library, keyed by document folder
+        """
+        index = cls(**kwargs)
+        for doc in Papis.get_all_documents_in_lib(library):
+            index.add(doc.get_main_folder(), doc)
+        return index
+
+
+def find_library_duplicates(library: Optional[str] = None, **kwargs) -> List[List[str]]:
+    """find_library_duplicates.
+    Batch job: returns groups of folders in a Papis library that appear to hold the same work
+
+    :param library: Name of the Papis library to scan.  The current library is used if none is passed
+    :param kwargs: Passed to `LSHIndex`
+    """
+    index = LSHIndex.from_library(library, **kwargs)
+    logger.info("Indexed %d documents for duplicate detection", len(index))
+    return [sorted(group) for group in index.duplicates()]
+
+
+if __name__ == "__main__":
+    profiling.from_argv()
+    configure_logging()
+    for group in find_library_duplicates(sys.argv[1] if len(sys.argv) > 1 else None):
+        print("\n".join(group), end="\n\n")
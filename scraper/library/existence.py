@@ -0,0 +1,192 @@
+"""Existence index of the identifiers already present in a Papis library
+
+Before a document is downloaded or scraped, its normalized DOI and base ArXiv ID (without version), and optionally
+its normalized-title hash, are looked up in a small SQLite table, so a paper already in the library is skipped
+with a single primary-key lookup rather than a scan of every info.yaml file.  Titles aren't matched by default, since
+distinct papers share titles ("Introduction", "Erratum", ...).
+The index is rebuilt from a library with `sync` and kept up to date by `Document.add_to_library(existing=...)`.
+
+Usage:
+
+    $ python -m scraper.library.existence sync [library]
+    $ python -m scraper.library.existence check DOI_OR_ARXIV_ID [...]
+"""
+
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+from typing import Optional, Mapping, Any, Iterable, List, Tuple
+from papis import api as Papis
+from papis.arxiv import find_arxivid_in_text
+from scraper import Constants, profiling
+from scraper.logger import configure_logging
+from scraper.library.dedup import normalize_text
+from scraper.base_classes.identifiers import normalize_doi, normalize_arxiv_id, arxiv_id_regex
+
+logger = logging.getLogger()
+
+DEFAULT_INDEX_PATH = "{}/existence.sqlite".format(Constants.CACHE_DIR.value)
+
+DOI = "doi"
+ARXIV = "arxiv"
+TITLE = "title"
+
+
+def get_title_hash(title: Optional[str]) -> Optional[str]:
+    """get_title_hash.
+    Returns a short hash of the normalized title, or None if the title is empty
+
+    :param title: Document title (a Crossref-style list of titles is also accepted)
+
+    >>> get_title_hash('Closed  Categories.') == get_title_hash('closed categories')
+    True
+    """
+    if isinstance(title, (list, tuple)):
+        title = title[0] if title else None
+    if not (title := normalize_text(title)):
+        return None
+    return hashlib.sha1(title.encode("utf-8")).hexdigest()[:16]
+
+
+def get_identifiers(info: Mapping[str, Any], doc_id: Optional[str] = None) -> List[Tuple[str, str]]:
+    """get_identifiers.
+    Returns the (kind, value) keys under which a document is indexed, most specific first.
+    Understands Papis documents, Crossref records and `Document.info`.
+
+    :param info: Document metadata
+    :param doc_id: (Optional) Validated document ID (a DOI or ArXiv ID), as in `Document.doc_id`
+
+    >>> get_identifiers({'DOI': '10.1007/BF01220868', 'url': 'http://arxiv.org/abs/1006.3140v1'})
+    [('doi', '10.1007/bf01220868'), ('arxiv', '1006.3140')]
+    """
+    keys = []
+    for candidate in (doc_id, info.get("doi"), info.get("DOI")):
+        if candidate and (found := normalize_doi(candidate)) and found.startswith("10."):
+            keys.append((DOI, found))
+            break
+    for candidate in (info.get("arxivid"), info.get("eprint"), doc_id, info.get("url")):
+        if candidate and (found := normalize_arxiv_id(find_arxivid_in_text(candidate) or candidate)):
+            if arxiv_id_regex.fullmatch(found):
+                keys.append((ARXIV, found))
+                break
+    if title_hash := get_title_hash(info.get("title")):
+        keys.append((TITLE, title_hash))
+    return keys
+
+
+class ExistenceIndex:
+    """
+    SQLite table mapping normalized identifiers to the key (Papis folder or document ID) of the document that has them
+
+    Methods
+    =======
+    :add:
+        Indexes the identifiers of a document's metadata
+
+    :lookup:
+        Returns the key of an indexed document sharing any identifier with the passed metadata, or None
+
+    :find:
+        `lookup` for a `scraper.base_classes.Document`
+
+    :sync:
+        Rebuilds the index from a Papis library
+
+    >>> index = ExistenceIndex(':memory:')
+    >>> index.add('kock1970', {'doi': '10.1007/BF01220868'})
+    >>> index.lookup({'doi': 'https://doi.org/10.1007/bf01220868'})
+    'kock1970'
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, titles: bool = False) -> None:
+        """
+        :param path: (Optional) Path of the SQLite database (":memory:" for a throwaway index)
+        :param titles: (Optional) Whether a matching title hash alone counts as a match (default = False)
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.titles = titles
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS identifiers (
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (kind, value)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> ExistenceIndex:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(DISTINCT key) FROM identifiers").fetchone()[0]
+
+    def _insert(self, key: str, identifiers: Iterable[Tuple[str, str]]) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO identifiers (kind, value, key) VALUES (?, ?, ?)",
+            [(kind, value, key) for kind, value in identifiers],
+        )
+
+    def add(self, key: str, info: Mapping[str, Any], doc_id: Optional[str] = None) -> None:
+        with self._db:
+            self._insert(str(key), get_identifiers(info, doc_id))
+
+    def lookup(self, info: Mapping[str, Any], doc_id: Optional[str] = None) -> Optional[str]:
+        for kind, value in get_identifiers(info, doc_id):
+            if kind == TITLE and not self.titles:
+                continue
+            if row := self._db.execute(
+                "SELECT key FROM identifiers WHERE kind = ? AND value = ?", (kind, value)
+            ).fetchone():
+                return row[0]
+        return None
+
+    def find(self, doc) -> Optional[str]:
+        return self.lookup(doc.info, doc.doc_id)
+
+    def sync(self, library: Optional[str] = None) -> int:
+        """
+        Replaces the contents of the index with the identifiers of every document in a Papis library.
+        Returns the number of documents indexed.
+
+        :param library: (Optional) Name of the Papis library.  The current library is used if none is passed
+        """
+        docs = Papis.get_all_documents_in_lib(library)
+        with self._db:
+            self._db.execute("DELETE FROM identifiers")
+            for doc in docs:
+                self._insert(doc.get_main_folder() or doc["ref"], get_identifiers(doc))
+        logger.info("Indexed identifiers of %d documents", len(docs))
+        return len(docs)
+
+    @classmethod
+    def from_library(cls, library: Optional[str] = None, **kwargs) -> ExistenceIndex:
+        index = cls(**kwargs)
+        index.sync(library)
+        return index
+
+
+if __name__ == "__main__":
+    profiling.from_argv()
+    configure_logging()
+    command, *args = sys.argv[1:]
+    with ExistenceIndex() as index:
+        if command == "sync":
+            print("Indexed {} documents".format(index.sync(*args[:1])))
+        elif command == "check":
+            for arg in args:
+                print("{}: {}".format(arg, index.lookup({}, arg) or "not found"))
+        else:
+            raise ValueError("Unknown command '{}'".format(command))
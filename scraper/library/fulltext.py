@@ -0,0 +1,267 @@
+"""Local full-text search index over downloaded PDFs
+
+Text is extracted in a process pool and stored in an SQLite FTS5 table, keyed by the SHA-256 of the file's contents.
+A handful of files (e.g. the PDF of one downloaded document) is extracted in the calling process instead.
+Files whose size and modification time are unchanged are skipped without being re-read, and files whose contents
+are already indexed (e.g. the same PDF downloaded twice) are only linked to the existing text.
+
+Usage:
+
+    $ python -m scraper.library.fulltext index FILE_OR_DIR [...]
+    $ python -m scraper.library.fulltext search QUERY
+"""
+
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Optional, Callable, Iterable, List, Tuple
+from papis import api as Papis
+from scraper import Constants, profiling
+from scraper.logger import configure_logging, configure_worker, worker_initargs
+
+logger = logging.getLogger()
+
+DEFAULT_INDEX_PATH = "{}/fulltext.sqlite".format(Constants.CACHE_DIR.value)
+
+# Fewer changed files than this are hashed and extracted in the calling process: starting a pool costs more than it saves
+POOL_THRESHOLD = 8
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """hash_file.
+    Returns the hex SHA-256 digest of a file's contents
+
+    :param path: Path of file to hash
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as fptr:
+        while chunk := fptr.read(chunk_size):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def extract_pdf_text(path: str) -> str:
+    """extract_pdf_text.
+    Extracts the text of every page of a PDF using pdfminer
+
+    :param path: Path of PDF
+    """
+    from pdfminer.high_level import extract_text
+
+    return extract_text(path)
+
+
+def _hash_worker(path: str) -> Tuple[str, Optional[str]]:
+    try:
+        return path, hash_file(path)
+    except OSError as e:
+        logger.warning('Failed to read file "%s".  Exception: %s', path, e)
+        return path, None
+
+
+def _extract_worker(args: Tuple[Callable[[str], str], str]) -> Optional[str]:
+    extractor, path = args
+    try:
+        return extractor(path)
+    except Exception as e:
+        logger.warning('Failed to extract text from "%s".  Exception: %s', path, e)
+        return None
+
+
+def _map(pool: Optional[ProcessPoolExecutor], fn: Callable, items: Iterable, chunksize: int = 1) -> Iterable:
+    return map(fn, items) if pool is None else pool.map(fn, items, chunksize=chunksize)
+
+
+def _phrase(string: str) -> str:
+    return '"{}"'.format(string.replace('"', '""'))
+
+
+class FullTextIndex:
+    """
+    On-disk inverted index of PDF text
+
+    Methods
+    =======
+    :index_files:
+        Incrementally (re)indexes the passed files and directories; returns the number of files whose text was extracted
+
+    :index_document:
+        Indexes the files of a `scraper.base_classes.Document` (e.g. after `Document.download`)
+
+    :search:
+        Returns (path, snippet) pairs matching an FTS5 query, a phrase or a set of prefixes
+
+    :search_documents:
+        Returns the Papis documents whose files match a query
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_INDEX_PATH,
+        processes: Optional[int] = None,
+        extractor: Callable[[str], str] = extract_pdf_text,
+    ) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.processes = processes
+        self.extractor = extractor
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+            CREATE VIRTUAL TABLE IF NOT EXISTS fulltext USING fts5(sha256 UNINDEXED, content);
+            """
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> FullTextIndex:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @staticmethod
+    def _walk(paths: Iterable[str]) -> Iterable[str]:
+        for path in paths:
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    yield from (
+                        os.path.join(root, n) for n in sorted(names) if n.lower().endswith(".pdf")
+                    )
+            else:
+                yield path
+
+    def _changed(self, paths: Iterable[str]) -> List[Tuple[str, os.stat_result]]:
+        changed = []
+        for path in map(os.path.abspath, self._walk(paths)):
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                logger.warning('Skipping "%s".  Exception: %s', path, e)
+                continue
+            row = self._db.execute(
+                "SELECT size, mtime FROM files WHERE path = ?", (path,)
+            ).fetchone()
+            if row != (stat.st_size, stat.st_mtime):
+                changed.append((path, stat))
+        return changed
+
+    def _has_text(self, sha: str) -> bool:
+        return (
+            self._db.execute("SELECT 1 FROM files WHERE sha256 = ? LIMIT 1", (sha,)).fetchone()
+            is not None
+        )
+
+    def index_files(self, paths: Iterable[str]) -> int:
+        changed = self._changed([paths] if isinstance(paths, str) else paths)
+        if not changed:
+            return 0
+        stats = dict(changed)
+        pool = None
+        if len(changed) >= POOL_THRESHOLD:
+            pool = ProcessPoolExecutor(self.processes, initializer=configure_worker, initargs=worker_initargs())
+        with pool or nullcontext():
+            hashes = dict(_map(pool, _hash_worker, stats, chunksize=16))
+            to_extract = {}
+            for path, sha in hashes.items():
+                if sha is not None and sha not in to_extract and not self._has_text(sha):
+                    to_extract[sha] = path
+            texts = _map(
+                pool, _extract_worker, [(self.extractor, p) for p in to_extract.values()]
+            )
+            extracted = dict(zip(to_extract, texts))
+        with self._db:
+            for sha, text in extracted.items():
+                if text is not None:
+                    self._db.execute(
+                        "INSERT INTO fulltext (sha256, content) VALUES (?, ?)", (sha, text)
+                    )
+            stale = set()
+            for path, sha in hashes.items():
+                if sha is None or (sha in extracted and extracted[sha] is None):
+                    continue
+                if old := self._db.execute(
+                    "SELECT sha256 FROM files WHERE path = ?", (path,)
+                ).fetchone():
+                    stale.add(old[0])
+                stat = stats[path]
+                self._db.execute(
+                    "INSERT OR REPLACE INTO files (path, sha256, size, mtime) VALUES (?, ?, ?, ?)",
+                    (path, sha, stat.st_size, stat.st_mtime),
+                )
+            for sha in stale:
+                if not self._db.execute(
+                    "SELECT 1 FROM files WHERE sha256 = ? LIMIT 1", (sha,)
+                ).fetchone():
+                    self._db.execute("DELETE FROM fulltext WHERE sha256 = ?", (sha,))
+        count = sum(text is not None for text in extracted.values())
+        logger.info("Extracted text from %d of %d changed files", count, len(changed))
+        return count
+
+    def index_document(self, doc) -> int:
+        return self.index_files(doc.files)
+
+    def search(
+        self, query: str, phrase: bool = False, prefix: bool = False, limit: int = 20
+    ) -> List[Tuple[str, str]]:
+        """
+        Searches indexed text
+
+        :param query: Query string.  Passed to FTS5 as-is unless `phrase` or `prefix` is set, so FTS5 syntax ('"exact phrase"', 'categ*', 'a AND b') works directly
+        :param phrase: (Optional) Match the query as one exact phrase
+        :param prefix: (Optional) Match every word of the query as a prefix
+        :param limit: (Optional) Maximum number of files to return
+        """
+        if phrase:
+            query = _phrase(query)
+        elif prefix:
+            query = " ".join(_phrase(word) + "*" for word in query.split())
+        return self._db.execute(
+            """
+            SELECT files.path, snippet(fulltext, 1, '[', ']', '...', 12)
+            FROM fulltext JOIN files ON files.sha256 = fulltext.sha256
+            WHERE fulltext MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (query, limit),
+        ).fetchall()
+
+    def search_documents(self, query: str, library: Optional[str] = None, **kwargs) -> list:
+        """
+        Searches indexed text and returns the matching Papis documents of the passed (or current) library.
+        Symlinked files (added with `link=True`) are matched by their targets.
+        """
+        matches = {os.path.realpath(path) for path, _ in self.search(query, **kwargs)}
+        return [
+            doc
+            for doc in Papis.get_all_documents_in_lib(library)
+            if any(os.path.realpath(f) in matches for f in doc.get_files())
+        ]
+
+
+if __name__ == "__main__":
+    profiling.from_argv()
+    configure_logging()
+    command, *args = sys.argv[1:]
+    with FullTextIndex() as index:
+        if command == "index":
+            print("Indexed {} files".format(index.index_files(args)))
+        elif command == "search":
+            for path, snippet in index.search(" ".join(args)):
+                print("{}\n    {}".format(path, snippet))
+        else:
+            raise ValueError("Unknown command '{}'".format(command))
@@ -1,11 +1,195 @@
+"""Logging configuration and output sinks
+
+Nothing is configured at import.  Entry points call `configure_logging`, which routes all records through a
+`QueueHandler`: logging threads only put records on a queue, and a single listener thread formats them and writes
+them out, so worker threads never contend on the file or stream.  Repetitive warnings (e.g. the same Crossref
+lookup failure for thousands of DOIs) are sampled before they are queued.
+
+The queue is a `multiprocessing.Queue`, so forked worker processes, which inherit the handler but not the listener
+thread, send their records to the parent's listener.  Process pools started some other way (spawn, forkserver) pass
+`initializer=configure_worker, initargs=worker_initargs()`.
+
+Settings not passed to `configure_logging` are read from the environment:
+
+    SCRAPER_LOG_LEVEL=INFO                          root level
+    SCRAPER_LOG_FILE=~/scraper.log                  defaults to $PYTHON_REPO/get-crossref-data.log, then stderr
+    SCRAPER_LOG_FORMAT=json                         one JSON object per record
+    SCRAPER_LOG_LEVELS=papis=WARNING,urllib3=ERROR  per-logger levels
+"""
+
+import atexit
 import logging
+import logging.handlers
 import json
+import multiprocessing
+import sys
+import threading
+import time
+import traceback
 from functools import wraps
 import os
 
-logging.basicConfig(filename='{}/get-crossref-data.log'.format(os.environ['PYTHON_REPO']), encoding='utf-8', level=logging.DEBUG)
 logger = logging.getLogger(name=__name__)
 
+# Attributes every LogRecord has; anything else was passed in `extra` and is included in structured records
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_handler = None
+
+class StructuredFormatter(logging.Formatter):
+    """StructuredFormatter.
+    Formats records as single-line JSON objects, including any fields passed with `extra`
+
+    >>> record = logging.makeLogRecord({'name': 'scraper', 'levelno': 30, 'levelname': 'WARNING', 'msg': 'Lookup of %s failed', 'args': ('10.1000/1',), 'created': 0, 'doi': '10.1000/1'})
+    >>> StructuredFormatter().format(record)
+    '{"time": "1970-01-01T00:00:00.000Z", "level": "WARNING", "logger": "scraper", "message": "Lookup of 10.1000/1 failed", "doi": "10.1000/1"}'
+    """
+
+    def format(self, record):
+        out = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.{:03d}Z'.format(int(record.created % 1 * 1000)),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        out.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS and not k.startswith('_')})
+        if record.exc_info:
+            out['exception'] = ''.join(traceback.format_exception(*record.exc_info))
+        elif record.exc_text:
+            out['exception'] = record.exc_text
+        return json.dumps(out, default=str)
+
+class SamplingFilter(logging.Filter):
+    """SamplingFilter.
+    Rate-limits repetitive records: of the records with the same logger, level and message template (i.e. before
+    arguments are substituted), at most `burst` per `interval` seconds get through.  The next record let through
+    reports how many were dropped (in its message, and as `suppressed` in structured records).
+    Records below `min_level` are never dropped.
+
+    >>> sampler = SamplingFilter(burst=2, interval=60)
+    >>> records = [logging.makeLogRecord({'levelno': 30, 'msg': 'Lookup of %s failed', 'args': (i,)}) for i in range(5)]
+    >>> [sampler.filter(r) for r in records]
+    [True, True, False, False, False]
+    """
+
+    def __init__(self, burst=5, interval=60.0, min_level=logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.min_level = min_level
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.min_level:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        with self._lock:
+            start, count, suppressed = self._windows.get(key, (record.created, 0, 0))
+            if record.created - start >= self.interval:
+                start, count = record.created, 0
+            if count >= self.burst:
+                self._windows[key] = (start, count, suppressed + 1)
+                return False
+            self._windows[key] = (start, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = '{} [{} similar messages suppressed]'.format(record.msg, suppressed)
+        return True
+
+def _parse_levels(spec):
+    return dict(item.split('=', 1) for item in spec.split(',') if '=' in item)
+
+def configure_logging(level=None, filename=None, structured=None, levels=None, sample_burst=5, sample_interval=60.0):
+    """configure_logging.
+    Sends all log records through a queue to a listener thread which writes them to a file or stderr.
+    Calling it again replaces the previous configuration.  Returns the `QueueListener`.
+
+    :param level: (Optional) Root log level (default = $SCRAPER_LOG_LEVEL or INFO)
+    :param filename: (Optional) File to append to (default = $SCRAPER_LOG_FILE, $PYTHON_REPO/get-crossref-data.log, or stderr)
+    :param structured: (Optional) Whether to write JSON records (default = whether $SCRAPER_LOG_FORMAT is "json")
+    :param levels: (Optional) Levels of individual loggers, e.g. {'papis': 'WARNING'} (default = $SCRAPER_LOG_LEVELS)
+    :param sample_burst: (Optional) Repetitions of a warning let through per interval; None disables sampling (default = 5)
+    :param sample_interval: (Optional) Sampling interval in seconds (default = 60)
+    """
+    global _listener, _handler
+    level = level or os.environ.get('SCRAPER_LOG_LEVEL', 'INFO')
+    if filename is None:
+        filename = os.environ.get('SCRAPER_LOG_FILE')
+        if filename is None and os.environ.get('PYTHON_REPO'):
+            filename = '{}/get-crossref-data.log'.format(os.environ['PYTHON_REPO'])
+    if structured is None:
+        structured = os.environ.get('SCRAPER_LOG_FORMAT', '').lower() == 'json'
+    if levels is None:
+        levels = _parse_levels(os.environ.get('SCRAPER_LOG_LEVELS', ''))
+
+    output = logging.FileHandler(os.path.expanduser(filename), encoding='utf-8') if filename else logging.StreamHandler(sys.stderr)
+    output.setFormatter(StructuredFormatter() if structured else logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    # Created in the spawn context, so it can be passed to workers started any way
+    records = multiprocessing.get_context('spawn').Queue()
+    handler = logging.handlers.QueueHandler(records)
+    if sample_burst is not None:
+        handler.addFilter(SamplingFilter(sample_burst, sample_interval))
+
+    stop_logging()
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level if isinstance(level, int) else level.upper())
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level if isinstance(logger_level, int) else logger_level.upper())
+    _handler = handler
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+def stop_logging():
+    """stop_logging.
+    Writes out queued records and removes the handler added by `configure_logging`
+    """
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        for output in _listener.handlers:
+            output.close()
+        _listener = None
+
+atexit.register(stop_logging)
+
+def _forget_listener():
+    # A forked child has a copy of the listener but not its thread; stopping it would stop the parent's listener
+    global _listener
+    _listener = None
+
+os.register_at_fork(after_in_child=_forget_listener)
+
+def worker_initargs():
+    """worker_initargs.
+    Returns the arguments of `configure_worker` for the current configuration
+    """
+    return (_handler.queue if _handler is not None else None, logging.getLogger().level)
+
+def configure_worker(records, level=logging.INFO):
+    """configure_worker.
+    Process pool initializer which sends a worker's records to the parent's listener
+
+    :param records: Queue of the parent's handler (from `worker_initargs`), or None if logging isn't configured
+    :param level: (Optional) Root log level
+    """
+    global _handler
+    _forget_listener()
+    if records is None or (_handler is not None and _handler.queue is records):
+        # Not configured, or forked with the handler already in place
+        return
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+    _handler = logging.handlers.QueueHandler(records)
+    logging.getLogger().addHandler(_handler)
+    logging.getLogger().setLevel(level)
+
 def log_and_return(fn):
     """log_and_return.
     Decorator and miniature IOC container.
@@ -47,3 +231,51 @@ def write_json_to_file(data, outfile):
             f.write(formatted)
         return ''
 
+
+class JsonLinesSink:
+    """JsonLinesSink.
+    Streams records to a file (or stdout) as JSON Lines: one compact JSON object per line, written as soon as it is
+    passed and flushed every `flush_every` records, so memory stays flat and readers can consume the file while it
+    is being written.
+
+    >>> with JsonLinesSink(None) as sink:
+    ...     sink.write({'source_url': 'https://example.org', 'href': 'https://doi.org/10.1000/1'})
+    {"source_url": "https://example.org", "href": "https://doi.org/10.1000/1"}
+    """
+
+    def __init__(self, outfile=None, flush_every=1, append=False):
+        """
+        :param outfile: File to write.  Uses stdout if None
+        :param flush_every: (Optional) Number of records between flushes (default = 1)
+        :param append: (Optional) Whether to append to an existing file rather than truncate it (default = False)
+        """
+        self.outfile = outfile
+        self.flush_every = flush_every
+        self.count = 0
+        self._fptr = sys.stdout if outfile is None else open(outfile, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, record):
+        self._fptr.write(json.dumps(record, default=str) + '\n')
+        self.count += 1
+        if self.count % self.flush_every == 0:
+            self._fptr.flush()
+
+    def write_all(self, records):
+        """write_all.
+        Writes each record of an iterable as it is produced.  Returns the number written.
+        """
+        start = self.count
+        for record in records:
+            self.write(record)
+        return self.count - start
+
+    def close(self):
+        self._fptr.flush()
+        if self.outfile is not None:
+            self._fptr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
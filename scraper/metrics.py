@@ -0,0 +1,281 @@
+"""Prometheus-style metrics for the scraping pipeline
+
+Counters, gauges and latency histograms are kept in memory and rendered in the Prometheus text exposition format,
+either over HTTP (`start_http_server`) or written to a file when the process exits (`dump_at_exit`).
+Setting SCRAPER_METRICS_PORT or SCRAPER_METRICS_FILE in the environment does either one at import.
+
+Metrics are per process: process pools (e.g. `scraper.library.bulk_import`) only report what the parent process does.
+
+>>> requests = Counter('demo_requests_total', 'Requests made', ['source'], registry=Registry())
+>>> requests.inc(source='crossref'); requests.inc(2, source='crossref')
+>>> print(requests.render())
+# HELP demo_requests_total Requests made
+# TYPE demo_requests_total counter
+demo_requests_total{source="crossref"} 3.0
+"""
+
+from __future__ import annotations
+import atexit
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Sequence, Iterator, Dict, Tuple, List
+from scraper import profiling
+
+logger = logging.getLogger()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Registry:
+    """
+    Collection of metrics which are rendered together
+    """
+
+    def __init__(self) -> None:
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("Metric '{}' is already registered".format(metric.name))
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        return "".join(metric.render() + "\n" for metric in list(self._metrics.values()))
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                "Metric '{}' takes labels {}, not {}".format(self.name, self.labelnames, tuple(labels))
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for key, value in sorted(self._values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP {} {}".format(self.name, self.documentation),
+                "# TYPE {} {}".format(self.name, self.kind),
+                *(
+                    "{}{} {}".format(name, _format_labels(labels), _format_value(value))
+                    for name, labels, value in self._samples()
+                ),
+            ]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing count (e.g. documents downloaded, bytes received)
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    """
+    Value which can go up and down (e.g. documents in progress)
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values (e.g. latencies) in cumulative buckets, plus their sum and count.
+    `time` is a context manager which observes the seconds spent in its block.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != float("inf"):
+            self.buckets += (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            if (entry := self._values.get(key)) is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def _samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        for key, (counts, total, count) in sorted(self._values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", labels | {"le": _format_value(bound)}, cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+stage_seconds = Histogram(
+    "scraper_stage_seconds", "Time spent in each pipeline stage", ["stage", "doctype"]
+)
+stage_total = Counter(
+    "scraper_stage_total", "Pipeline stages run, by outcome", ["stage", "doctype", "outcome"]
+)
+in_progress = Gauge("scraper_in_progress", "Pipeline stages currently running", ["stage"])
+download_bytes = Counter("scraper_download_bytes_total", "Bytes of files downloaded", ["doctype"])
+lookups = Counter(
+    "scraper_lookups_total", "Metadata lookups, by source and result (hit, miss or error)", ["source", "result"]
+)
+pdf_cache = Counter("scraper_pdf_analysis_cache_total", "PDF analysis cache hits and misses", ["result"])
+
+
+@contextmanager
+def track(stage: str, doctype=None) -> Iterator[None]:
+    """track.
+    Times a pipeline stage and counts it as "ok" or "error" (if an exception escapes the block)
+
+    :param stage: Stage name (validate, download, scrape, add, pdf_parse, ...)
+    :param doctype: (Optional) DocumentType (or its name) the stage is running for
+    """
+    doctype = getattr(doctype, "__name__", doctype) or ""
+    in_progress.inc(stage=stage)
+    outcome = "error"
+    try:
+        with stage_seconds.time(stage=stage, doctype=doctype), profiling.stage(stage):
+            yield
+        outcome = "ok"
+    finally:
+        in_progress.dec(stage=stage)
+        stage_total.inc(stage=stage, doctype=doctype, outcome=outcome)
+
+
+def dump(path: str, registry: Registry = REGISTRY) -> None:
+    """dump.
+    Writes all metrics to a file in the text exposition format (e.g. for node_exporter's textfile collector)
+    """
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "w") as fptr:
+        fptr.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def dump_at_exit(path: str, registry: Registry = REGISTRY) -> None:
+    atexit.register(dump, path, registry)
+
+
+def start_http_server(port: int, addr: str = "", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """start_http_server.
+    Serves metrics at http://addr:port/metrics from a daemon thread.  Returns the server (call `shutdown` to stop it).
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args) -> None:
+            logger.debug("metrics: " + format, *args)
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if os.environ.get("SCRAPER_METRICS_FILE"):
+    dump_at_exit(os.environ["SCRAPER_METRICS_FILE"])
+if os.environ.get("SCRAPER_METRICS_PORT"):
+    start_http_server(int(os.environ["SCRAPER_METRICS_PORT"]))
@@ -1,4 +1,9 @@
+import re
 import bs4
+from lxml import etree
+
+# Hrefs which may hold a DOI or ArXiv ID
+ref_href_regex = re.compile(r'arxiv|doi')
 
 def get_refs_from_soup(soup):
     """get_refs_from_soup.
@@ -7,3 +12,50 @@ def get_refs_from_soup(soup):
     :param soup: BeautifulSoup object (parsed HTML)
     """
     return soup.find_all('cite', recursive=True)
+
+class _HrefTarget:
+    """
+    lxml parser target which collects the matching hrefs of `<a>` tags as they are parsed, without building a tree
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.found = []
+
+    def start(self, tag, attrib):
+        if tag == 'a' and (href := attrib.get('href')) is not None and self.pattern.search(href):
+            self.found.append(href)
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        pass
+
+def iter_hrefs(chunks, pattern=ref_href_regex):
+    """iter_hrefs.
+    Yields the hrefs of the `<a>` tags in an HTML document which match a pattern, in document order.
+    The document is parsed incrementally, chunk by chunk, with an event-driven lxml parser, so no tree is built and only the current chunk is held in memory.
+
+    :param chunks: Iterable of the document's bytes (or str), e.g. `requests.Response.iter_content()`
+    :param pattern: (Optional) Compiled regex searched for in each href (default = `ref_href_regex`, hrefs containing "arxiv" or "doi")
+
+    >>> list(iter_hrefs([b'<p><a href="https://doi.org/10.1038%2F44', b'0611a">x</a><a href="/wiki/Main">y</a>']))
+    ['https://doi.org/10.1038%2F440611a']
+    """
+    target = _HrefTarget(pattern)
+    parser = etree.HTMLParser(target=target)
+    fed = False
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+            fed = True
+            yield from target.found
+            target.found.clear()
+    # lxml refuses to close a parser which was never fed (an empty page)
+    if fed:
+        parser.close()
+        yield from target.found
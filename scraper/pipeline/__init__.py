@@ -0,0 +1,2 @@
+from .journal import *
+from .workqueue import *
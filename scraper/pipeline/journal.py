@@ -0,0 +1,329 @@
+"""Crash-safe job journal for batch imports
+
+Each job (one document ID passed to the pipeline) moves through the stages
+PENDING -> VALIDATED -> DOWNLOADED -> SCRAPED -> ADDING -> ADDED, and its state, including the serialized
+`Document` (files, info and tags), is committed to an SQLite journal in WAL mode after every stage.
+When a run is interrupted, re-running it resumes each job from its last completed stage, so nothing is
+validated, downloaded or scraped twice.
+
+Adding to Papis is the one step which is not idempotent.  Before `add_to_library` is called the job is marked
+ADDING, and the document carries its job key in its info (under JOB_KEY).  A job found in ADDING on resume is
+only added again if no document with that key is in the library.  Jobs whose document is skipped by the
+`existing` or `duplicates` checks of `add_to_library` end as DUPLICATE.
+
+Jobs are run in chunks of ARXIV_BATCH_SIZE: each chunk is validated first, and the metadata of its arXiv documents is
+fetched with one batched request (`Arxiv.fetch_info`) and journaled, so downloading them only fetches their PDFs.  With a `PapisBatch`, jobs stay ADDING until
+the batch is committed (every `batch_size` jobs, and at the end of the run), and only the jobs it wrote are then recorded as ADDED.
+
+Usage:
+
+    $ python -m scraper.pipeline.journal JOURNAL [DOC_ID ...]
+"""
+
+from __future__ import annotations
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+from typing import Callable, Optional, Iterable, List, Tuple
+from papis import api as Papis
+from scraper import Constants, profiling
+from scraper.logger import configure_logging
+from scraper.base_classes import Document, Arxiv
+from scraper.base_classes.arxiv import ARXIV_BATCH_SIZE, prefetch_info
+from scraper.library.batch import PapisBatch
+
+logger = logging.getLogger()
+
+DEFAULT_JOURNAL_PATH = "{}/journal.sqlite".format(Constants.CACHE_DIR.value)
+
+JOB_KEY = "scraper_job"
+
+PENDING = "pending"
+VALIDATED = "validated"
+DOWNLOADED = "downloaded"
+SCRAPED = "scraped"
+ADDING = "adding"
+ADDED = "added"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+FAILED = "failed"
+
+FINISHED = (ADDED, DUPLICATE, INVALID)
+
+
+class JobJournal:
+    """
+    Durable record of each job's last completed stage and the state of its document
+
+    Methods
+    =======
+    :enqueue:
+        Adds jobs in the PENDING stage.  Keys already in the journal are left alone, so re-enqueueing a batch is safe.
+
+    :record:
+        Commits a job's new stage (and document state) to disk
+
+    :fail:
+        Records a failed attempt at a job's next stage; the job keeps its last completed stage
+
+    :get:
+        Returns a job's stage and restored `Document` (None before validation)
+
+    :unfinished:
+        Returns the keys of jobs which are not finished (added, duplicate or invalid), and have attempts left
+
+    :counts:
+        Returns a Counter of jobs by stage
+    """
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Every stage transition must survive power loss, not just a killed process
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                key TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                state TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage);
+            """
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> JobJournal:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def enqueue(self, keys: Iterable[str]) -> int:
+        with self._db:
+            return self._db.executemany(
+                "INSERT OR IGNORE INTO jobs (key, stage, updated) VALUES (?, ?, ?)",
+                [(key, PENDING, time.time()) for key in keys],
+            ).rowcount
+
+    def record(self, key: str, stage: str, doc: Optional[Document] = None) -> None:
+        state = json.dumps(doc.to_dict(), default=str) if doc is not None else None
+        with self._db:
+            self._db.execute(
+                """
+                UPDATE jobs SET stage = ?, state = COALESCE(?, state), error = NULL, updated = ?
+                WHERE key = ?
+                """,
+                (stage, state, time.time(), key),
+            )
+
+    def fail(self, key: str, error: Exception) -> None:
+        with self._db:
+            self._db.execute(
+                "UPDATE jobs SET error = ?, attempts = attempts + 1, updated = ? WHERE key = ?",
+                (repr(error), time.time(), key),
+            )
+
+    def get(self, key: str) -> Tuple[str, Optional[Document]]:
+        row = self._db.execute("SELECT stage, state FROM jobs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        stage, state = row
+        return stage, Document.from_dict(json.loads(state)) if state else None
+
+    def unfinished(self, max_attempts: Optional[int] = None) -> List[str]:
+        return [
+            key
+            for key, attempts in self._db.execute(
+                "SELECT key, attempts FROM jobs WHERE stage NOT IN ({}) ORDER BY rowid".format(
+                    ", ".join("?" * len(FINISHED))
+                ),
+                FINISHED,
+            )
+            if max_attempts is None or attempts < max_attempts
+        ]
+
+    def counts(self) -> Counter:
+        return Counter(dict(self._db.execute("SELECT stage, COUNT(*) FROM jobs GROUP BY stage")))
+
+
+class JournaledPipeline:
+    """
+    Runs jobs through validation, download, scraping and adding to Papis, recording every stage in a `JobJournal`.
+    The individual steps are methods, so they can be overridden (e.g. to add rate limiting or to fake them in tests).
+
+    >>> with JobJournal() as journal:  # doctest: +SKIP
+    ...     JournaledPipeline(journal, 'imported').run(['1006.3140', '10.1016/j.entcs.2012.08.017'])
+    Counter({'added': 2})
+    """
+
+    def __init__(
+        self,
+        journal: JobJournal,
+        *tags,
+        library: Optional[str] = None,
+        max_attempts: int = 3,
+        batch: Optional[PapisBatch] = None,
+        batch_size: int = 100,
+        **kwargs,
+    ) -> None:
+        """
+        :param journal: Journal to record progress in
+        :param tags: Tags to apply in Papis
+        :kw library: (Optional) Name of the Papis library which documents are added to (used to check for interrupted adds)
+        :kw max_attempts: (Optional) Number of times a job's stage is attempted before the job is given up on (default = 3)
+        :kw batch: (Optional) `scraper.library.PapisBatch` to stage documents in.  It is committed every `batch_size` jobs
+            and at the end of `run`, and jobs are recorded as ADDED only once their document has been written.
+        :kw batch_size: (Optional) Number of staged jobs per batch commit (default = 100)
+        :param kwargs: Passed to `Document.add_to_library` (e.g. `existing`, `duplicates`)
+        """
+        self.journal = journal
+        self.tags = tags
+        self.library = library
+        self.max_attempts = max_attempts
+        self.batch = batch
+        self.batch_size = batch_size
+        self.kwargs = kwargs
+        self._staged = []
+        self._committed = set()
+        self._library_keys = None
+
+    def validate(self, key: str) -> Document:
+        return Document(key, *self.tags)
+
+    def download(self, doc: Document) -> Document:
+        return doc.download()
+
+    def scrape(self, doc: Document) -> Document:
+        return doc.get_info()
+
+    def add(self, doc: Document, on_commit: Callable[[], None]) -> Document:
+        """
+        Adds a job's document to the library (or stages it in the batch), calling `on_commit` once it is in the library
+        """
+        return doc.add_to_library(
+            confirm=False, batch=self.batch, key=doc.info[JOB_KEY], on_commit=on_commit, **self.kwargs
+        )
+
+    def is_added(self, key: str) -> bool:
+        if self._library_keys is None:
+            # Read the library once per run, not once per interrupted job
+            self._library_keys = {d.get(JOB_KEY) for d in Papis.get_all_documents_in_lib(self.library)}
+        return key in self._library_keys
+
+    def fetch_info(self, keys: Iterable[str]) -> None:
+        """
+        Fills the metadata of validated arXiv jobs with batched requests (see `Arxiv.fetch_info`) and journals it
+        """
+        jobs = {}
+        for key in keys:
+            stage, doc = self.journal.get(key)
+            if stage == VALIDATED and doc.doctype is Arxiv and not doc.info.get("eprint"):
+                jobs[key] = doc
+        if prefetch_info(list(jobs.values())):
+            for key, doc in jobs.items():
+                self.journal.record(key, VALIDATED, doc)
+
+    def run_job(self, key: str, until: Optional[str] = None) -> str:
+        """
+        Runs a job from its last completed stage.  Returns the stage it ends in, or FAILED.
+
+        :param until: (Optional) VALIDATED to stop a job once it has been validated, if it hasn't got further
+        """
+        stage, doc = self.journal.get(key)
+        try:
+            if stage == PENDING:
+                doc = self.validate(key)
+                if doc.doctype is None:
+                    self.journal.record(key, INVALID)
+                    return INVALID
+                self.journal.record(key, stage := VALIDATED, doc)
+            if stage == until == VALIDATED:
+                return stage
+            if stage == VALIDATED:
+                self.journal.record(key, stage := DOWNLOADED, self.download(doc))
+            if stage == DOWNLOADED:
+                self.journal.record(key, stage := SCRAPED, self.scrape(doc))
+            if stage == ADDING and self.is_added(key):
+                logger.info("Job %s was added before the last run stopped", key)
+                self.journal.record(key, stage := ADDED)
+            if stage in (SCRAPED, ADDING):
+                doc.update({JOB_KEY: key})
+                self.journal.record(key, stage := ADDING, doc)
+                self.add(doc, on_commit=lambda: self._committed.add(key))
+                if self.batch is None:
+                    stage = ADDED if key in self._committed else DUPLICATE
+                    self._committed.discard(key)
+                    self.journal.record(key, stage)
+                else:
+                    self._staged.append(key)
+        except Exception as e:
+            logger.warning('Job "%s" failed after stage "%s".  Exception: %s', key, stage, e)
+            self.journal.fail(key, e)
+            return FAILED
+        return stage
+
+    def run(self, keys: Iterable[str] = ()) -> Counter:
+        """
+        Enqueues the passed keys, then runs every unfinished job in the journal
+
+        :param keys: (Optional) Document IDs to add to the journal before running
+        """
+        self.journal.enqueue(keys)
+        self._library_keys = None
+        counts = Counter()
+        unfinished = self.journal.unfinished(self.max_attempts)
+        for start in range(0, len(unfinished), ARXIV_BATCH_SIZE):
+            stages = {key: self.run_job(key, until=VALIDATED) for key in unfinished[start : start + ARXIV_BATCH_SIZE]}
+            self.fetch_info(key for key, stage in stages.items() if stage == VALIDATED)
+            for key, stage in stages.items():
+                counts[self.run_job(key) if stage == VALIDATED else stage] += 1
+                if self.batch is not None and len(self._staged) >= self.batch_size:
+                    self._commit_into(counts)
+        if self.batch is not None:
+            self._commit_into(counts)
+        return +counts
+
+    def commit(self) -> Counter:
+        """
+        Commits the batch, then records its jobs as ADDED, as failed attempts if their document wasn't written,
+        or as DUPLICATE if it was skipped
+        """
+        self.batch.commit()
+        counts = Counter()
+        for key in self._staged:
+            if key in self.batch.failed:
+                self.journal.fail(key, IOError("Failed to write {} to the library".format(key)))
+                counts[FAILED] += 1
+            else:
+                stage = ADDED if key in self._committed else DUPLICATE
+                self.journal.record(key, stage)
+                counts[stage] += 1
+        self._staged.clear()
+        self._committed.clear()
+        return counts
+
+    def _commit_into(self, counts: Counter) -> None:
+        committed = self.commit()
+        counts.subtract({ADDING: sum(committed.values())})
+        counts.update(committed)
+
+
+if __name__ == "__main__":
+    profiling.from_argv()
+    configure_logging()
+    path, *keys = sys.argv[1:]
+    with JobJournal(path) as journal:
+        print(dict(JournaledPipeline(journal).run(keys)))
@@ -0,0 +1,441 @@
+"""Work queue for distributed ingestion
+
+Several `scraper` worker processes, on one or more hosts, pull document IDs from a shared queue, validate,
+download and scrape them, and post the resulting `Document` state back to the queue.  A single
+`LibraryWriter` adds finished documents to the Papis library, so the library is never written concurrently.
+
+Jobs are leased rather than popped: a worker holds a job until its lease expires, and a heartbeat thread keeps
+extending the lease while the job is being worked on.  If a worker dies, its lease runs out and the job is
+handed to another worker (up to `max_attempts` times).
+
+The queue is an SQLite file on a shared filesystem, locked with BEGIN IMMEDIATE transactions.  WAL mode
+needs shared memory and does not work over network filesystems, so the default rollback journal is used.
+Lease times are wall-clock times, so hosts' clocks should be kept in sync (e.g. with NTP).
+Workers' download directories must also be reachable from the writer's host, since the writer adds the files
+that workers downloaded.
+Any object with the same methods as `WorkQueue` (put, lease, heartbeat, complete, fail, results, mark_written,
+write_failed, counts) can be passed to `QueueWorker` and `LibraryWriter` instead, e.g. one backed by a Redis-compatible server.
+
+Usage:
+
+    $ python -m scraper.pipeline.workqueue put QUEUE DOC_ID [...]
+    $ python -m scraper.pipeline.workqueue worker QUEUE
+    $ python -m scraper.pipeline.workqueue writer QUEUE [tag ...]
+"""
+
+from __future__ import annotations
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional, Iterable, Iterator, List, Tuple
+from scraper import Constants, profiling
+from scraper.logger import configure_logging
+from scraper.base_classes import Document, Arxiv
+from scraper.base_classes.arxiv import ARXIV_BATCH_SIZE, prefetch_info
+from scraper.base_classes.identifiers import canonicalize_doi, normalize_arxiv_id, arxiv_id_regex
+from scraper.library.batch import PapisBatch
+from scraper.pipeline.journal import PENDING, FAILED, INVALID
+
+logger = logging.getLogger()
+
+DEFAULT_QUEUE_PATH = "{}/queue.sqlite".format(Constants.CACHE_DIR.value)
+
+LEASED = "leased"
+DONE = "done"
+WRITTEN = "written"
+
+
+def get_worker_id() -> str:
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue:
+    """
+    Job queue with leases, backed by an SQLite file
+
+    Methods
+    =======
+    :put:
+        Enqueues document IDs.  IDs already in the queue are left alone.
+
+    :lease:
+        Atomically claims up to `n` pending jobs (or jobs whose lease has expired) for a worker
+
+    :heartbeat:
+        Extends a worker's leases; returns the keys it still holds
+
+    :complete, fail:
+        Report the outcome of a leased job.  Ignored if the worker no longer holds the lease.
+
+    :results:
+        Returns (key, Document) pairs of completed jobs which have not been written to the library
+
+    :mark_written:
+        Records that completed jobs have been added to the library
+
+    :write_failed:
+        Records a failed attempt at adding completed jobs to the library.  Jobs out of attempts are marked failed;
+        the others are left done, to be written again.
+
+    :counts:
+        Returns a Counter of jobs by status
+    """
+
+    def __init__(
+        self, path: str = DEFAULT_QUEUE_PATH, lease_seconds: float = 300, max_attempts: int = 3
+    ) -> None:
+        """
+        :param path: (Optional) Path of the queue file, which every worker and the writer must be able to reach
+        :param lease_seconds: (Optional) How long a job is held without a heartbeat before another worker may take it (default = 300)
+        :param max_attempts: (Optional) Number of leases and library writes a job gets before it is marked failed (default = 3)
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        with self._transaction():
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    key TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    worker TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT
+                )
+                """
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> WorkQueue:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # Take the write lock up front, so two workers can never lease the same job
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def put(self, keys: Iterable[str]) -> int:
+        with self._transaction() as db:
+            return db.executemany(
+                "INSERT OR IGNORE INTO jobs (key, status) VALUES (?, ?)",
+                [(key, PENDING) for key in keys],
+            ).rowcount
+
+    def lease(self, worker: str, n: int = 1) -> List[str]:
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                """
+                UPDATE jobs SET status = ?, error = 'lease expired', worker = NULL
+                WHERE status = ? AND lease_expires < ? AND attempts >= ?
+                """,
+                (FAILED, LEASED, now, self.max_attempts),
+            )
+            keys = [
+                key
+                for key, in db.execute(
+                    """
+                    SELECT key FROM jobs
+                    WHERE status = ? OR (status = ? AND lease_expires < ?)
+                    ORDER BY rowid LIMIT ?
+                    """,
+                    (PENDING, LEASED, now, n),
+                )
+            ]
+            db.executemany(
+                """
+                UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE key = ?
+                """,
+                [(LEASED, worker, now + self.lease_seconds, key) for key in keys],
+            )
+        return keys
+
+    def heartbeat(self, worker: str, keys: Iterable[str]) -> List[str]:
+        keys = list(keys)
+        with self._transaction() as db:
+            db.executemany(
+                "UPDATE jobs SET lease_expires = ? WHERE key = ? AND worker = ? AND status = ?",
+                [(time.time() + self.lease_seconds, key, worker, LEASED) for key in keys],
+            )
+            return [
+                key
+                for key in keys
+                if db.execute(
+                    "SELECT 1 FROM jobs WHERE key = ? AND worker = ? AND status = ?", (key, worker, LEASED)
+                ).fetchone()
+            ]
+
+    def _finish(self, key: str, worker: str, status: str, result=None, error=None) -> bool:
+        with self._transaction() as db:
+            return (
+                db.execute(
+                    """
+                    UPDATE jobs SET status = ?, result = ?, error = ?, lease_expires = NULL
+                    WHERE key = ? AND worker = ? AND status = ?
+                    """,
+                    (status, result, error, key, worker, LEASED),
+                ).rowcount
+                == 1
+            )
+
+    def complete(self, key: str, worker: str, doc: Optional[Document]) -> bool:
+        if doc is None:
+            return self._finish(key, worker, INVALID)
+        return self._finish(key, worker, DONE, json.dumps(doc.to_dict(), default=str))
+
+    def fail(self, key: str, worker: str, error: Exception) -> bool:
+        with self._transaction() as db:
+            attempts = db.execute("SELECT attempts FROM jobs WHERE key = ?", (key,)).fetchone()[0]
+        status = FAILED if attempts >= self.max_attempts else PENDING
+        return self._finish(key, worker, status, error=repr(error))
+
+    def results(self, limit: Optional[int] = None) -> List[Tuple[str, Document]]:
+        return [
+            (key, Document.from_dict(json.loads(result)))
+            for key, result in self._db.execute(
+                "SELECT key, result FROM jobs WHERE status = ? ORDER BY rowid LIMIT ?",
+                (DONE, -1 if limit is None else limit),
+            )
+        ]
+
+    def mark_written(self, keys: Iterable[str]) -> None:
+        with self._transaction() as db:
+            db.executemany(
+                "UPDATE jobs SET status = ? WHERE key = ? AND status = ?",
+                [(WRITTEN, key, DONE) for key in keys],
+            )
+
+    def write_failed(self, keys: Iterable[str], error: Exception) -> None:
+        with self._transaction() as db:
+            db.executemany(
+                """
+                UPDATE jobs SET status = CASE WHEN attempts + 1 >= ? THEN ? ELSE status END,
+                    attempts = attempts + 1, error = ?
+                WHERE key = ? AND status = ?
+                """,
+                [(self.max_attempts, FAILED, repr(error), key, DONE) for key in keys],
+            )
+
+    def counts(self) -> Counter:
+        return Counter(dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")))
+
+
+class _Heartbeat(threading.Thread):
+    """
+    Extends a worker's leases in the background.  Uses its own connection, since SQLite connections are per-thread.
+    """
+
+    def __init__(self, queue: WorkQueue, worker: str, keys: List[str]) -> None:
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.worker = worker
+        self.keys = keys
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        with WorkQueue(self.queue.path, self.queue.lease_seconds, self.queue.max_attempts) as queue:
+            while not self.stopped.wait(self.queue.lease_seconds / 3):
+                if not queue.heartbeat(self.worker, self.keys):
+                    logger.warning("Worker %s lost its lease on %s", self.worker, self.keys)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+
+class QueueWorker:
+    """
+    Leases jobs from a queue and validates, downloads and scrapes them.  Override `process` to change the steps.
+    The metadata of the arXiv documents among the jobs leased together is fetched up front, with one batched request
+    (see `Arxiv.fetch_info`), so downloading them only fetches their PDFs.
+
+    >>> QueueWorker(WorkQueue('/mnt/shared/queue.sqlite')).run()  # doctest: +SKIP
+    Counter({'done': 48, 'failed': 2})
+    """
+
+    def __init__(
+        self, queue: WorkQueue, *tags, worker_id: Optional[str] = None, poll: float = 5, lease_size: int = 1
+    ) -> None:
+        """
+        :param queue: Queue to take jobs from
+        :param tags: Tags to apply in Papis
+        :kw worker_id: (Optional) Name of this worker.  Defaults to "hostname:pid"
+        :kw poll: (Optional) Seconds to wait before checking an empty queue again, when `run` is not stopping on empty
+        :kw lease_size: (Optional) Number of jobs to lease at a time (default = 1)
+        """
+        self.queue = queue
+        self.tags = tags
+        self.worker_id = worker_id or get_worker_id()
+        self.poll = poll
+        self.lease_size = lease_size
+        self._prefetched = {}
+
+    def fetch_info(self, keys: List[str]) -> None:
+        """
+        Validates the leased jobs which look like arXiv IDs and fills their metadata with batched requests
+        """
+        docs = {}
+        for key in keys:
+            if canonicalize_doi(key) or not arxiv_id_regex.fullmatch(normalize_arxiv_id(key) or ""):
+                continue
+            try:
+                docs[key] = Document(key, *self.tags)
+            except Exception as e:
+                logger.debug("Validation of %s failed; left to the job.  Exception: %s", key, e)
+        prefetch_info([doc for doc in docs.values() if doc.doctype is Arxiv])
+        self._prefetched.update(docs)
+
+    def process(self, key: str) -> Optional[Document]:
+        """
+        Returns the scraped Document for a key, or None if the key is not a valid document ID
+        """
+        doc = self._prefetched.pop(key, None) or Document(key, *self.tags)
+        if doc.doctype is None:
+            return None
+        return doc.download().get_info()
+
+    def run_job(self, key: str) -> str:
+        heartbeat = _Heartbeat(self.queue, self.worker_id, [key])
+        heartbeat.start()
+        try:
+            doc = self.process(key)
+        except Exception as e:
+            logger.warning('Job "%s" failed on %s.  Exception: %s', key, self.worker_id, e)
+            self.queue.fail(key, self.worker_id, e)
+            return FAILED
+        finally:
+            heartbeat.stop()
+        if not self.queue.complete(key, self.worker_id, doc):
+            logger.warning("Worker %s finished %s after losing its lease; result discarded", self.worker_id, key)
+        return INVALID if doc is None else DONE
+
+    def run(self, stop_when_empty: bool = True) -> Counter:
+        """
+        Processes jobs until the queue is empty (or forever, if `stop_when_empty` is False)
+        """
+        counts = Counter()
+        while True:
+            keys = self.queue.lease(self.worker_id, self.lease_size)
+            if not keys:
+                if stop_when_empty:
+                    return counts
+                time.sleep(self.poll)
+                continue
+            # Each job's own heartbeat only starts when the job does, so hold the others' leases meanwhile
+            heartbeat = _Heartbeat(self.queue, self.worker_id, keys) if len(keys) > 1 else None
+            if heartbeat is not None:
+                heartbeat.start()
+            try:
+                self.fetch_info(keys)
+                counts.update(self.run_job(key) for key in keys)
+            finally:
+                if heartbeat is not None:
+                    heartbeat.stop()
+                self._prefetched.clear()
+
+
+class LibraryWriter:
+    """
+    The single process which adds completed jobs to the Papis library, one `PapisBatch` commit at a time
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        *tags,
+        batch_size: int = 100,
+        library: Optional[str] = None,
+        poll: float = 5,
+        **kwargs,
+    ) -> None:
+        """
+        :param queue: Queue to read results from
+        :param tags: Extra tags to apply in Papis
+        :kw batch_size: (Optional) Maximum number of documents per library commit (default = 100)
+        :kw library: (Optional) Name of the Papis library to add to
+        :kw poll: (Optional) Seconds to wait between checks for new results
+        :param kwargs: Passed to `Document.add_to_library` (e.g. `existing`, `duplicates`)
+        """
+        self.queue = queue
+        self.tags = tags
+        self.batch_size = batch_size
+        self.library = library
+        self.poll = poll
+        self.kwargs = kwargs
+
+    def add(self, doc: Document, batch: PapisBatch) -> None:
+        doc.tags += self.tags
+        doc.add_to_library(batch=batch, **self.kwargs)
+
+    def write(self) -> int:
+        """
+        Adds one batch of completed jobs to the library.  Returns the number of jobs written.
+        Jobs whose documents the batch failed to write are reported with `write_failed`.
+        """
+        results = self.queue.results(self.batch_size)
+        if not results:
+            return 0
+        batch = PapisBatch(self.library)
+        for key, doc in results:
+            self.add(doc, batch)
+        batch.commit()
+        failed = [key for key, doc in results if doc.doc_id in batch.failed]
+        written = [key for key, doc in results if doc.doc_id not in batch.failed]
+        self.queue.mark_written(written)
+        if failed:
+            logger.warning("Failed to write %d of %d jobs to the library", len(failed), len(results))
+            self.queue.write_failed(failed, IOError("Failed to write to the library"))
+        return len(written)
+
+    def run(self, stop_when_idle: bool = True) -> int:
+        """
+        Writes results until no jobs are pending, leased or done (or forever, if `stop_when_idle` is False)
+        """
+        written = 0
+        while True:
+            if count := self.write():
+                written += count
+                continue
+            counts = self.queue.counts()
+            if stop_when_idle and not (counts[PENDING] or counts[LEASED] or counts[DONE]):
+                return written
+            time.sleep(self.poll)
+
+
+if __name__ == "__main__":
+    profiling.from_argv()
+    configure_logging()
+    command, path, *args = sys.argv[1:]
+    with WorkQueue(path) as queue:
+        if command == "put":
+            print("Enqueued {} jobs".format(queue.put(args)))
+        elif command == "worker":
+            print(dict(QueueWorker(queue, lease_size=ARXIV_BATCH_SIZE).run(stop_when_empty=False)))
+        elif command == "writer":
+            print("Wrote {} documents".format(LibraryWriter(queue, *args).run()))
+        else:
+            raise ValueError("Unknown command '{}'".format(command))
@@ -0,0 +1,266 @@
+"""Built-in profiling for the scraper's entry points
+
+Run any entry point with `--profile` to profile it on real inputs:
+
+    $ python -m scraper.library.bulk_import ~/papers --profile
+    $ python scraper/scihubget.py 10.1016/j.entcs.2012.08.017 --profile=cprofile --profile-out=/tmp/scihub
+
+Profiles are split by pipeline stage (validate, download, scrape, add, pdf_parse, ...: every block wrapped in
+`scraper.metrics.track`), and written when the process exits:
+
+sample (default)
+    A background thread samples every thread's stack every 5ms.  Writes PREFIX.collapsed, one
+    "stage;file:function;...;file:function count" line per distinct stack, which flamegraph.pl, speedscope and
+    inferno read directly, and PREFIX-summary.txt with the top functions per stage by self and total samples.
+
+cprofile
+    Deterministic profiles, one cProfile.Profile per stage.  Writes PREFIX-STAGE.pstats (for snakeviz, gprof2dot
+    or `python -m pstats`) and PREFIX-summary.txt with the top functions per stage by cumulative time.
+"""
+
+from __future__ import annotations
+import atexit
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter, defaultdict
+from typing import Optional, List, Dict
+
+logger = logging.getLogger()
+
+NO_STAGE = "(no stage)"
+TOP_N = 25
+
+_profiler = None
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NOOP = _NoopStage()
+
+
+class _Stage:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> None:
+        _profiler.enter(self.name)
+
+    def __exit__(self, *exc) -> None:
+        _profiler.exit()
+
+
+def stage(name: str):
+    """stage.
+    Returns a context manager which attributes the time spent in its block to a stage, or a no-op when not profiling.
+    Called by `scraper.metrics.track`, so instrumented stages need no further changes.
+    """
+    if _profiler is None:
+        return _NOOP
+    return _Stage(name)
+
+
+def _frame_name(frame) -> str:
+    return "{}:{}".format(os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+
+
+class _Profiler:
+    def __init__(self) -> None:
+        self._stages = defaultdict(list)
+
+    def current_stage(self, thread_id: int) -> str:
+        stages = self._stages.get(thread_id)
+        return stages[-1] if stages else NO_STAGE
+
+    def enter(self, name: str) -> None:
+        self._stages[threading.get_ident()].append(name)
+
+    def exit(self) -> None:
+        self._stages[threading.get_ident()].pop()
+
+
+class SamplingProfiler(_Profiler):
+    """
+    Samples the stacks of all threads at a fixed interval and counts them by stage
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        super().__init__()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="scraper-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                names.append(self.current_stage(thread_id))
+                self.stacks[";".join(reversed(names))] += 1
+
+    def summary(self, top: int = TOP_N) -> str:
+        by_stage = defaultdict(lambda: (Counter(), Counter()))
+        totals = Counter()
+        for stack, count in self.stacks.items():
+            stage_name, *frames = stack.split(";")
+            own, total = by_stage[stage_name]
+            totals[stage_name] += count
+            if frames:
+                own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        lines = ["{} samples at {}s intervals".format(sum(totals.values()), self.interval)]
+        for stage_name, samples in totals.most_common():
+            own, total = by_stage[stage_name]
+            lines += ["", "== {} ({} samples) ==".format(stage_name, samples)]
+            lines.append("{:>8} {:>8}  function".format("self", "total"))
+            for name, count in own.most_common(top):
+                lines.append("{:>8} {:>8}  {}".format(count, total[name], name))
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix: str, top: int = TOP_N) -> List[str]:
+        with open(prefix + ".collapsed", "w") as fptr:
+            fptr.writelines("{} {}\n".format(stack, count) for stack, count in sorted(self.stacks.items()))
+        with open(prefix + "-summary.txt", "w") as fptr:
+            fptr.write(self.summary(top))
+        return [prefix + ".collapsed", prefix + "-summary.txt"]
+
+
+class StageProfiler(_Profiler):
+    """
+    Keeps one cProfile.Profile per stage, switching between them as stages are entered and left.
+    Only the thread which started profiling is profiled.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.profiles = defaultdict(cProfile.Profile)
+        self._thread_id = threading.get_ident()
+
+    def _switch(self, old: str, new: str) -> None:
+        self.profiles[old].disable()
+        self.profiles[new].enable()
+
+    def start(self) -> None:
+        self.profiles[NO_STAGE].enable()
+
+    def stop(self) -> None:
+        self.profiles[self.current_stage(self._thread_id)].disable()
+
+    def enter(self, name: str) -> None:
+        if threading.get_ident() != self._thread_id:
+            return super().enter(name)
+        old = self.current_stage(self._thread_id)
+        super().enter(name)
+        self._switch(old, name)
+
+    def exit(self) -> None:
+        if threading.get_ident() != self._thread_id:
+            return super().exit()
+        old = self.current_stage(self._thread_id)
+        super().exit()
+        self._switch(old, self.current_stage(self._thread_id))
+
+    def summary(self, top: int = TOP_N) -> str:
+        out = io.StringIO()
+        for stage_name, profile in self.profiles.items():
+            out.write("== {} ==\n".format(stage_name))
+            pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(top)
+        return out.getvalue()
+
+    def write(self, prefix: str, top: int = TOP_N) -> List[str]:
+        written = []
+        for stage_name, profile in self.profiles.items():
+            path = "{}-{}.pstats".format(prefix, stage_name.strip("()").replace(" ", "-"))
+            profile.dump_stats(path)
+            written.append(path)
+        with open(prefix + "-summary.txt", "w") as fptr:
+            fptr.write(self.summary(top))
+        return written + [prefix + "-summary.txt"]
+
+
+MODES = {"sample": SamplingProfiler, "cprofile": StageProfiler}
+
+
+def start(mode: str = "sample") -> _Profiler:
+    """start.
+    Starts profiling the current process
+
+    :param mode: (Optional) "sample" (default) or "cprofile"
+    """
+    global _profiler
+    if _profiler is not None:
+        raise RuntimeError("A profiler is already running")
+    _profiler = MODES[mode]()
+    _profiler.start()
+    return _profiler
+
+
+def stop(prefix: Optional[str] = None) -> List[str]:
+    """stop.
+    Stops profiling, and writes the results if a path prefix is passed.  Returns the paths written.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return []
+    profiler.stop()
+    if prefix is None:
+        return []
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    written = profiler.write(prefix)
+    logger.info("Wrote profile to %s", ", ".join(written))
+    return written
+
+
+def from_argv(argv: Optional[List[str]] = None) -> Optional[_Profiler]:
+    """from_argv.
+    Removes `--profile[=sample|cprofile]` and `--profile-out=PREFIX` from the command line (sys.argv by default) and,
+    if `--profile` was passed, starts profiling until the process exits.
+
+    >>> argv = ['bulk_import', '~/papers', '--profile-out=/tmp/p']
+    >>> from_argv(argv) is None, argv
+    (True, ['bulk_import', '~/papers'])
+    """
+    argv = sys.argv if argv is None else argv
+    mode = prefix = None
+    for arg in list(argv[1:]):
+        if arg == "--profile" or arg.startswith("--profile="):
+            mode = arg.partition("=")[2] or "sample"
+        elif arg.startswith("--profile-out="):
+            prefix = arg.partition("=")[2]
+        else:
+            continue
+        argv.remove(arg)
+    if mode is None:
+        return None
+    prefix = prefix or "scraper-profile-{}".format(os.getpid())
+    atexit.register(stop, prefix)
+    return start(mode)
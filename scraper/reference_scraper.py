@@ -1,6 +1,10 @@
 #!/bin/env python3
 import sys
+from scraper import profiling
+from scraper.logger import configure_logging
 
+profiling.from_argv()
+configure_logging()
 args = sys.argv
 try:
     url = args[1]
@@ -1,8 +1,13 @@
 #!/bin/python3
 
 from scidownl import *
+from scraper import profiling
+from scraper.logger import configure_logging
 import sys
 
+profiling.from_argv()
+configure_logging()
+
 out = 'paper'
 for doi in sys.argv:
     SciHub(doi, out).download()
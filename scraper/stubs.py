@@ -0,0 +1,466 @@
+"""Offline stub servers for Crossref, arXiv, MediaWiki, PDF hosts and ID resolvers
+
+`StubServer` answers the requests the scraper's clients make, from one local HTTP server:
+
+    /crossref/works/DOI                 Crossref works endpoint (JSON)
+    /arxiv/query?id_list=ID[,ID...]     arXiv API (Atom)
+    /mediawiki?action=parse|query...    MediaWiki API (JSON wikitext, extracts and revisions)
+    /pdf/ANYTHING                       PDF download hosts (a small PDF whose first page names its DOI)
+    /doi/DOI                            DOI handle API, used to validate DOIs (JSON)
+    /arxiv_abs/ID                       arXiv abstract pages, used to validate arXiv IDs (HTML)
+
+The ID resolvers answer HTTP 404 for anything which is not shaped like a DOI or arXiv ID, like the real ones do
+for unknown IDs.
+
+Responses are replayed from a fixtures directory when a recorded response exists (FIXTURES/SERVICE/KEY, where
+KEY is the DOI, arXiv ID, page title or PDF path with "/" replaced by "_"), and synthesized deterministically
+from the requested ID otherwise, so arbitrarily large workloads can be generated.
+
+Latency (mean plus uniform jitter), error rates (HTTP 500/503) and throttling (a token bucket answering HTTP 429
+with Retry-After) can be injected globally or per service.  Point the scraper at a running server with
+`scraper.endpoints.configure(**server.endpoints)`, or:
+
+    $ python -m scraper.stubs --port 8080 --latency 0.2 --error-rate 0.01 --rate-limit 50
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Mapping, Dict, List, Tuple
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger()
+
+SERVICES = ("crossref", "arxiv", "mediawiki", "pdf", "doi", "arxiv_abs")
+
+doi_regex = re.compile(r"10\.\d{4,9}/\S+")
+arxiv_id_regex = re.compile(r"(?:\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(?:v\d+)?")
+
+
+def make_pdf(*pages, info=None) -> bytes:
+    """make_pdf.
+    Builds a minimal PDF in memory.  Each page is a list of (font size, text) lines, set top to bottom in Helvetica.
+
+    :param pages: Lines of each page
+    :param info: (Optional) Document information dictionary entries, e.g. {'Title': 'Some title'}
+
+    >>> make_pdf([(24, 'A title')])[:8]
+    b'%PDF-1.4'
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        ops, y = [], 750
+        for size, text in lines:
+            escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append("BT /F1 {} Tf 72 {} Td ({}) Tj ET".format(size, y, escaped))
+            y -= size * 2
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (len(objects))
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    if info:
+        entries = " ".join("/{} ({})".format(k, v) for k, v in info.items())
+        objects.append(("<< " + entries + " >>").encode("latin-1"))
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for num, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (num, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    trailer = b"/Size %d /Root 1 0 R" % (len(objects) + 1)
+    if info:
+        trailer += b" /Info %d 0 R" % len(objects)
+    out += b"trailer\n<< %s >>\nstartxref\n%d\n%%%%EOF\n" % (trailer, xref)
+    return bytes(out)
+
+
+@dataclass
+class Faults:
+    """
+    Faults injected into a service's responses
+
+    latency: float
+        Mean added delay, in seconds
+    jitter: float
+        Delays are drawn uniformly from latency +/- jitter
+    error_rate: float
+        Fraction of requests answered with HTTP 500 or 503
+    rate_limit: Optional[float]
+        Requests per second allowed (with a burst of the same size, and at least one) before answering HTTP 429
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit: Optional[float] = None
+
+
+class _TokenBucket:
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        # A rate below one request per second still allows one request once its token has refilled
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def _seed(key: str) -> random.Random:
+    return random.Random(zlib.crc32(key.encode("utf-8")))
+
+
+def _words(rng: random.Random, n: int) -> str:
+    vocabulary = (
+        "categorical monoidal differential lambda calculus quantum field theory gauge entropy lattice "
+        "automatic forward reverse mode semantics closed monads strong functors operator algebra"
+    ).split()
+    return " ".join(rng.choice(vocabulary) for _ in range(n))
+
+
+def fake_work(doi: str) -> dict:
+    """fake_work.
+    Deterministically synthesizes a Crossref work record for a DOI
+
+    >>> fake_work('10.1000/1')['DOI'] == fake_work('10.1000/1')['DOI'] == '10.1000/1'
+    True
+    """
+    rng = _seed(doi)
+    year = rng.randint(1950, 2022)
+    return {
+        "DOI": doi,
+        "URL": "http://dx.doi.org/" + doi,
+        "type": "journal-article",
+        "title": [_words(rng, 6).capitalize()],
+        "author": [
+            {"given": _words(rng, 1).capitalize(), "family": _words(rng, 1).capitalize(), "affiliation": []}
+            for _ in range(rng.randint(1, 4))
+        ],
+        "container-title": ["Journal of " + _words(rng, 2).title()],
+        "publisher": "Stub Publishing",
+        "volume": str(rng.randint(1, 300)),
+        "page": "{0}-{1}".format(*sorted(rng.sample(range(1, 999), 2))),
+        "issued": {"date-parts": [[year, rng.randint(1, 12)]]},
+        "reference-count": 3,
+        "reference": [
+            {"key": "{}_ref{}".format(doi, i), "DOI": "10.1000/{}".format(rng.randint(1, 10 ** 6))}
+            for i in range(3)
+        ],
+        "language": "en",
+        "link": [{"URL": "https://sci-hub.se/{}".format(doi), "content-type": "application/pdf"}],
+    }
+
+
+def fake_arxiv_entry(arxiv_id: str) -> str:
+    rng = _seed(arxiv_id)
+    authors = "".join(
+        "<author><name>{} {}</name></author>".format(_words(rng, 1).capitalize(), _words(rng, 1).capitalize())
+        for _ in range(rng.randint(1, 3))
+    )
+    return (
+        "<entry><id>http://arxiv.org/abs/{id}</id><published>20{yy}-01-01T00:00:00Z</published>"
+        "<updated>20{yy}-01-01T00:00:00Z</updated><title>{title}</title><summary>{summary}</summary>{authors}"
+        '<link title="pdf" href="http://arxiv.org/pdf/{id}" rel="related" type="application/pdf"/>'
+        '<arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="math.CT"/></entry>'
+    ).format(
+        id=escape(arxiv_id if re.search(r"v\d+$", arxiv_id) else arxiv_id + "v1"),
+        yy="{:02d}".format(rng.randint(7, 22)),
+        title=_words(rng, 6).capitalize(),
+        summary=_words(rng, 40),
+        authors=authors,
+    )
+
+
+def fake_wikitext(title: str) -> str:
+    rng = _seed(title)
+    refs = "\n".join(
+        "* {{{{cite journal |title={} |doi=10.1000/{} |arxiv={:04d}.{:05d}}}}}".format(
+            _words(rng, 4), rng.randint(1, 10 ** 6), rng.randint(701, 2112), rng.randint(1, 99999)
+        )
+        for _ in range(rng.randint(3, 12))
+    )
+    return "'''{}''' is {}.\n\n== References ==\n{}\n".format(title, _words(rng, 30), refs)
+
+
+def fake_html_page(links: int) -> bytes:
+    """fake_html_page.
+    A reference-heavy HTML page, like a long Wikipedia article: paragraphs of text, each with one link, every other
+    one to a DOI (percent-encoded) or an arXiv abstract.  About 250 bytes per link.
+
+    :param links: Number of links
+
+    >>> fake_html_page(4).count(b'<a href=')
+    4
+    """
+    parts = ["<html><head><title>Page</title></head><body>"]
+    for i in range(links):
+        work = fake_work("10.1000/{}".format(i))
+        href = (
+            "https://doi.org/10.1000%2F{}".format(i) if i % 4 == 0
+            else "//arxiv.org/abs/1006.{:04d}".format(i % 10000) if i % 4 == 1
+            else "/wiki/{}".format(work["title"][0].replace(" ", "_"))
+        )
+        parts.append('<p>{0} <a href="{1}" title="{0}">{0}</a> {2}</p>'.format(
+            work["title"][0], href, work["container-title"][0]
+        ))
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def fake_pdf(path: str) -> bytes:
+    rng = _seed(path)
+    doi = "10.1000/{}".format(zlib.crc32(path.encode("utf-8")))
+    return make_pdf(
+        [(24, _words(rng, 5).capitalize()), (10, "doi: " + doi), (10, _words(rng, 12))],
+        [(10, "References"), (10, "[1] " + _words(rng, 10))],
+    )
+
+
+class StubServer:
+    """
+    Local HTTP server which stands in for Crossref, arXiv, MediaWiki, PDF hosts and the DOI and arXiv ID resolvers
+
+    >>> with StubServer(latency=0.05, rate_limit=100) as server:  # doctest: +SKIP
+    ...     with scraper.endpoints.using(**server.endpoints):
+    ...         run_benchmark()
+
+    Properties
+    ==========
+    url: str
+        Base URL of the server
+
+    endpoints: Dict[str, str]
+        Base URL of each service, as accepted by `scraper.endpoints.configure`
+
+    requests: Counter
+        Number of requests served, by service and HTTP status
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        host: str = "127.0.0.1",
+        fixtures: Optional[str] = None,
+        services: Optional[Mapping[str, Mapping]] = None,
+        seed: Optional[int] = None,
+        **faults,
+    ) -> None:
+        """
+        :param port: (Optional) Port to listen on.  An unused port is chosen by default
+        :param host: (Optional) Address to listen on (default = 127.0.0.1)
+        :param fixtures: (Optional) Directory of recorded responses
+        :param services: (Optional) Per-service fault settings, e.g. {'crossref': {'error_rate': 0.1}}
+        :param seed: (Optional) Seed for the injected latencies and errors
+        :param faults: Fault settings for all services (see `Faults`)
+        """
+        self.fixtures = fixtures
+        self.faults = {
+            service: Faults(**(faults | dict((services or {}).get(service, {})))) for service in SERVICES
+        }
+        self.buckets = {
+            service: _TokenBucket(f.rate_limit) for service, f in self.faults.items() if f.rate_limit
+        }
+        self.requests = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def endpoints(self) -> Dict[str, str]:
+        return {service: "{}/{}".format(self.url, service) for service in SERVICES}
+
+    def start(self) -> StubServer:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> StubServer:
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _fixture(self, service: str, key: str) -> Optional[bytes]:
+        if self.fixtures is None:
+            return None
+        path = os.path.join(self.fixtures, service, key.replace("/", "_"))
+        if os.path.exists(path):
+            with open(path, "rb") as fptr:
+                return fptr.read()
+        return None
+
+    def _count(self, service: str, status: int) -> None:
+        with self._lock:
+            self.requests[service, status] = self.requests.get((service, status), 0) + 1
+
+    def _inject(self, service: str) -> Optional[Tuple[int, Dict[str, str]]]:
+        """
+        Sleeps for the injected latency, and returns an error status (and headers) if one is to be injected
+        """
+        faults = self.faults[service]
+        with self._lock:
+            delay = max(0.0, faults.latency + self._rng.uniform(-faults.jitter, faults.jitter))
+            failed = self._rng.random() < faults.error_rate
+            status = self._rng.choice((500, 503))
+        if delay:
+            time.sleep(delay)
+        if (bucket := self.buckets.get(service)) is not None and not bucket.take():
+            return 429, {"Retry-After": "1"}
+        if failed:
+            return status, {}
+        return None
+
+    def crossref(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+        if not path.startswith("works/"):
+            return 404, "text/plain", b"Resource not found."
+        doi = unquote(path[len("works/") :])
+        if (body := self._fixture("crossref", doi)) is not None:
+            return 200, "application/json", body
+        message = {"status": "ok", "message-type": "work", "message-version": "1.0.0", "message": fake_work(doi)}
+        return 200, "application/json", json.dumps(message).encode("utf-8")
+
+    def arxiv(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+        ids = [i for i in ",".join(query.get("id_list", [])).split(",") if i]
+        if not ids and (search := query.get("search_query")):
+            ids = [part.split(":", 1)[1] for part in search[0].split("+AND+") if part.startswith("id_list:")]
+        entries = "".join(
+            (self._fixture("arxiv", i) or fake_arxiv_entry(i).encode("utf-8")).decode("utf-8") for i in ids
+        )
+        feed = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">'
+            "<title>ArXiv Query</title><opensearch:totalResults>{}</opensearch:totalResults>{}</feed>"
+        ).format(len(ids), entries)
+        return 200, "application/atom+xml", feed.encode("utf-8")
+
+    def mediawiki(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+        title = (query.get("page") or query.get("titles") or ["Main Page"])[0]
+        wikitext = (self._fixture("mediawiki", title) or fake_wikitext(title).encode("utf-8")).decode("utf-8")
+        pageid = zlib.crc32(title.encode("utf-8")) % 10 ** 8
+        if query.get("action", ["query"])[0] == "parse":
+            body = {"parse": {"title": title, "pageid": pageid, "wikitext": {"*": wikitext}}}
+        else:
+            page = {
+                "pageid": pageid,
+                "ns": 0,
+                "title": title,
+                "fullurl": "https://en.wikipedia.org/wiki/" + title.replace(" ", "_"),
+                "extract": wikitext,
+                "revisions": [{"revid": pageid, "parentid": pageid - 1, "*": wikitext}],
+                "pageprops": {},
+            }
+            body = {"batchcomplete": "", "query": {"pages": {str(pageid): page}}}
+        return 200, "application/json", json.dumps(body).encode("utf-8")
+
+    def pdf(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+        return 200, "application/pdf", self._fixture("pdf", path) or fake_pdf(path)
+
+    def doi(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+        doi = unquote(path)
+        if not doi_regex.fullmatch(doi):
+            return 404, "application/json", json.dumps({"responseCode": 100, "handle": doi}).encode("utf-8")
+        values = [{"index": 1, "type": "URL", "data": {"format": "string", "value": "https://sci-hub.se/" + doi}}]
+        return 200, "application/json", json.dumps({"responseCode": 1, "handle": doi, "values": values}).encode("utf-8")
+
+    def arxiv_abs(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+        arxiv_id = unquote(path)
+        if not arxiv_id_regex.fullmatch(arxiv_id):
+            return 404, "text/html", b"<html><body>Article identifier not recognized</body></html>"
+        page = "<html><head><title>[{0}]</title></head><body><h1>{0}</h1></body></html>".format(escape(arxiv_id))
+        return 200, "text/html", page.encode("utf-8")
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                parts = urlsplit(self.path)
+                service, _, rest = parts.path.lstrip("/").partition("/")
+                if service not in SERVICES:
+                    return self._send(service, 404, "text/plain", b"Unknown service")
+                if (fault := stub._inject(service)) is not None:
+                    status, headers = fault
+                    return self._send(service, status, "text/plain", b"Injected fault", headers)
+                self._send(service, *getattr(stub, service)(rest, parse_qs(parts.query)))
+
+            def _send(self, service, status, content_type, body, headers=None) -> None:
+                stub._count(service, status)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                logger.debug("stub: " + format, *args)
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--fixtures")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    server = StubServer(
+        args.port,
+        args.host,
+        args.fixtures,
+        seed=args.seed,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+    )
+    for service, url in server.endpoints.items():
+        print("export SCRAPER_ENDPOINT_{}={}".format(service.upper(), url))
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,21 @@
+import papis.api
+import papis.database
+import pytest
+from .. import endpoints
+from ..stubs import StubServer
+
+
+@pytest.fixture
+def papis_library(tmp_path, monkeypatch):
+    library = tmp_path / 'library'
+    library.mkdir()
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    papis.api.set_lib_from_name(str(library))
+    papis.database.clear_cached()
+    return library
+
+
+@pytest.fixture
+def stub_server():
+    with StubServer(seed=0) as server, endpoints.using(**server.endpoints):
+        yield server
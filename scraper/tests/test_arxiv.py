@@ -1,5 +1,52 @@
-from ..base_classes import Arxiv
+import json
+from ..base_classes import Document, Arxiv
+from ..base_classes import arxiv_snapshot
+from ..base_classes.arxiv import fetch_arxiv_metadata
 from . import DocumentTestBase as fix
 
 def test_arxiv_papis_retrieval():
     pass
+
+
+def test_batched_metadata_fetch(stub_server):
+    ids = ['1006.{:04d}'.format(i) for i in range(250)]
+    found = fetch_arxiv_metadata(ids, batch_size=100, delay=0)
+    assert stub_server.requests == {('arxiv', 200): 3}
+    docs = [Document(i) for i in ids[:5]]
+    assert all(doc.doctype is Arxiv for doc in docs)
+    assert Arxiv.fetch_info(docs, delay=0) == []
+    assert sorted(found) == ids
+    info = found['1006.0042']
+    assert info['eprint'] == '1006.0042v1' and info['archiveprefix'] == 'arXiv' and info['type'] == 'article'
+    assert info['author_list'] and info['author'] and info['title'] and info['year']
+    assert all(doc.info['title'] == found[doc.doc_id]['title'] for doc in docs)
+
+
+def _snapshot_line(arxiv_id):
+    return json.dumps({
+        'id': arxiv_id, 'title': 'Paper  ' + arxiv_id, 'authors_parsed': [['Noether', 'Emmy', '']],
+        'categories': 'math.CT', 'abstract': '  Abstract\n', 'journal-ref': None,
+        'versions': [{'version': 'v1', 'created': 'Mon, 2 Apr 2007 19:18:42 GMT'}, {'version': 'v2', 'created': ''}],
+    })
+
+
+def test_snapshot_lookup_and_fallback(tmp_path, stub_server):
+    path = tmp_path / 'snapshot.json'
+    ids = ['0704.{:04d}'.format(i) for i in range(200, 0, -1)] + ['math/0601001', 'z' * 30]
+    path.write_text('\n'.join(map(_snapshot_line, ids)) + '\n')
+    with arxiv_snapshot.ArxivSnapshot(str(path)) as snapshot:
+        # The over-long ID is left out of the index, and of its count
+        assert len(snapshot) == 201 and 'math/0601001' in snapshot and '0704.0000' not in snapshot
+        assert snapshot._offset('z' * 24) is None and snapshot.get('0704.0200')['title'] == 'Paper 0704.0200'
+        info = snapshot.get('0704.0042')
+        assert info['eprint'] == '0704.0042v2' and snapshot.get('0704.0042v1')['eprint'] == '0704.0042v1'
+        assert (info['title'], info['author'], info['year'], info['month']) == ('Paper 0704.0042', 'Noether, Emmy', '2007', 'Apr')
+    path.write_text(_snapshot_line('2101.00001') + '\n')
+    try:
+        assert arxiv_snapshot.use_snapshot(str(path)).get('2101.00001v1')['title'] == 'Paper 2101.00001'
+        docs = [Document('2101.00001'), Document('2201.00002')]
+        assert Arxiv.fetch_info(docs, delay=0) == []
+        assert stub_server.requests[('arxiv', 200)] == 1
+        assert docs[0].info['title'] == 'Paper 2101.00001' and docs[1].info['eprint'] == '2201.00002v1'
+    finally:
+        arxiv_snapshot.use_snapshot(None)
@@ -0,0 +1,60 @@
+import os
+import papis.api
+import papis.database
+import papis.database.cache
+from ..library.batch import PapisBatch
+from ..library.dedup import LSHIndex
+
+
+def test_commit_writes_documents_and_saves_cache_once(tmp_path, monkeypatch):
+    library = tmp_path / 'library'
+    library.mkdir()
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    papis.api.set_lib_from_name(str(library))
+    papis.database.clear_cached()
+    # Index the (empty) library up front, so only the commit's own save is counted
+    papis.database.get(str(library)).get_documents()
+    saves = []
+    save = papis.database.cache.Database.save
+    monkeypatch.setattr(papis.database.cache.Database, 'save', lambda self: saves.append(1) or save(self))
+
+    pdfs = []
+    for i in range(3):
+        pdf = tmp_path / 'paper{}.pdf'.format(i)
+        pdf.write_bytes(b'%PDF')
+        pdfs.append(pdf)
+    with PapisBatch(str(library), link=True) as batch:
+        for i, pdf in enumerate(pdfs):
+            batch.stage([str(pdf)], {'title': 'Paper {}'.format(i), 'author': 'Kock, Anders'})
+        assert len(batch) == 3
+
+    docs = papis.api.get_all_documents_in_lib(str(library))
+    assert sorted(d['title'] for d in docs) == ['Paper 0', 'Paper 1', 'Paper 2']
+    for doc in docs:
+        assert os.path.exists(doc.get_info_file())
+        assert all(os.path.islink(f) for f in doc.get_files())
+    assert len(saves) == 1
+
+
+def test_duplicates_are_indexed_once_written(tmp_path, papis_library, monkeypatch):
+    pdf = tmp_path / 'paper.pdf'
+    pdf.write_bytes(b'%PDF')
+    data = {'title': 'Basic Concepts of Enriched Category Theory', 'author': 'Kelly, G. M.'}
+    write = PapisBatch._write
+
+    def broken_write(self, lib_dir, files, data):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(PapisBatch, '_write', broken_write)
+    batch = PapisBatch(str(papis_library), link=True, duplicates=LSHIndex())
+    assert batch.stage([str(pdf)], data, key='first')
+    # A copy within the batch is skipped
+    assert not batch.stage([str(pdf)], dict(data), key='copy')
+    batch.commit()
+    assert batch.failed == ['first'] and len(batch.duplicates) == 0
+
+    monkeypatch.setattr(PapisBatch, '_write', write)
+    assert batch.stage([str(pdf)], dict(data), key='retry')
+    batch.commit()
+    assert 'retry' in batch.duplicates
+    assert not batch.stage([str(pdf)], dict(data), key='copy')
@@ -0,0 +1,57 @@
+import json
+from ..benchmarks import benchmark, run_benchmark, make_run, append_history, compare
+from ..benchmarks.compare import find_run, latest_results, main
+
+
+def test_results_are_appended_to_history(tmp_path):
+    registry = {}
+    cleaned_up = []
+
+    @benchmark('demo.join', items=100, registry=registry)
+    def bench_join():
+        words = ['word'] * 100
+        yield lambda: ' '.join(words)
+        cleaned_up.append(True)
+
+    @benchmark('demo.broken', items=1, registry=registry)
+    def bench_broken():
+        yield lambda: 1 / 0
+
+    results = [run_benchmark(bench, repeat=3) for bench in registry.values()]
+    assert cleaned_up == [True]
+    assert len(results[0].seconds) == 3 and results[0].items_per_second > 0
+    assert results[1].error == "ZeroDivisionError('division by zero')"
+    path = str(tmp_path / 'history.json')
+    append_history(make_run(results), path)
+    history = append_history(make_run(results), path)
+    assert len(history) == 2 and json.load(open(path)) == history
+    assert history[-1]['results']['demo.broken']['items_per_second'] is None
+
+
+def test_regressions_are_flagged(tmp_path, capsys):
+    def entry(commit, **rates):
+        return {'commit': commit, 'results': {name: {'items_per_second': rate} for name, rate in rates.items()}}
+
+    baseline = entry('aaa', scrape=100.0, classify=500.0, add=30.0)
+    current = entry('bbb', scrape=95.0, classify=300.0, add=None)
+    assert {c.name: c.regressed for c in compare(baseline, current, threshold=0.1)} == {
+        'scrape': False, 'classify': True, 'add': True
+    }
+    path = tmp_path / 'history.json'
+    path.write_text(json.dumps([baseline, current]))
+    assert main(['--history', str(path)]) == 1
+    assert 'REGRESSION' in capsys.readouterr().out
+    assert main(['--history', str(path), '--current', 'aaa']) == 0
+
+
+def test_partial_runs_do_not_hide_baselines(tmp_path):
+    full = {'commit': '1234567', 'results': {'scrape': {'items_per_second': 100.0}, 'add': {'items_per_second': 30.0}}}
+    partial = {'commit': 'abcdef0', 'results': {'scrape': {'items_per_second': 100.0}}}
+    current = {'commit': 'bbbbbbb', 'results': {'scrape': {'items_per_second': 100.0}, 'add': {'items_per_second': 10.0}}}
+    assert [c.name for c in compare(latest_results([full, partial]), current) if c.regressed] == ['add']
+    path = tmp_path / 'history.json'
+    path.write_text(json.dumps([full, partial, current]))
+    assert main(['--history', str(path)]) == 1
+    # An all-digit commit prefix is not an index
+    assert find_run([full, partial, current], '1234') is full
+    assert find_run([full, partial, current], '-2') is partial
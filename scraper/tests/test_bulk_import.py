@@ -0,0 +1,82 @@
+import os
+import papis.api
+from ..library.bulk_import import Checkpoint, find_pdfs, import_directory, ADDED, DUPLICATE, FAILED, UNIDENTIFIED
+from ..library.dedup import LSHIndex
+from ..stubs import make_pdf
+
+
+def test_find_pdfs_walks_tree_in_order(tmp_path):
+    (tmp_path / 'b').mkdir()
+    for name in ['b/2.pdf', 'a.PDF', 'notes.txt', 'b/1.pdf']:
+        (tmp_path / name).write_bytes(b'')
+    assert [os.path.relpath(p, tmp_path) for p in find_pdfs(str(tmp_path))] == ['a.PDF', 'b/1.pdf', 'b/2.pdf']
+
+
+def test_checkpoint_survives_restart(tmp_path):
+    pdf = tmp_path / 'paper.pdf'
+    pdf.write_bytes(b'%PDF')
+    log = str(tmp_path / 'checkpoint.jsonl')
+    with Checkpoint(log) as checkpoint:
+        checkpoint.record(str(pdf), os.stat(pdf), ADDED, '1006.3140')
+    with open(log, 'a') as fptr:
+        fptr.write('{"path": "torn')
+    other = tmp_path / 'other.pdf'
+    other.write_bytes(b'%PDF')
+    with Checkpoint(log) as checkpoint:
+        assert checkpoint.handled(str(pdf), os.stat(pdf))
+        checkpoint.record(str(other), os.stat(other), ADDED, '1701.00660')
+    reloaded = Checkpoint(log)
+    assert reloaded.handled(str(pdf), os.stat(pdf)) and reloaded.handled(str(other), os.stat(other))
+
+
+def test_checkpoint_retries_failures_and_changed_files(tmp_path):
+    first, second = tmp_path / 'first.pdf', tmp_path / 'second.pdf'
+    first.write_bytes(b'%PDF')
+    second.write_bytes(b'%PDF')
+    with Checkpoint(str(tmp_path / 'checkpoint.jsonl')) as checkpoint:
+        checkpoint.record(str(first), os.stat(first), FAILED)
+        checkpoint.record(str(second), os.stat(second), UNIDENTIFIED)
+        assert not checkpoint.handled(str(first), os.stat(first))
+        assert checkpoint.handled(str(second), os.stat(second))
+        os.utime(second, (0, 12345))
+        assert not checkpoint.handled(str(second), os.stat(second))
+
+
+def test_arxiv_pdfs_get_metadata(tmp_path, papis_library, stub_server):
+    papers = tmp_path / 'papers'
+    papers.mkdir()
+    for i in range(3):
+        (papers / 'paper{}.pdf'.format(i)).write_bytes(make_pdf([(12, 'arXiv:1006.314{}v1 [math.CT]'.format(i))]))
+    counts = import_directory(
+        str(papers), processes=1, checkpoint=str(tmp_path / 'checkpoint.jsonl'), library=str(papis_library)
+    )
+    assert stub_server.requests[('arxiv', 200)] == 1
+    assert counts[ADDED] == 3
+    docs = papis.api.get_all_documents_in_lib(str(papis_library))
+    assert sorted(d['eprint'] for d in docs) == ['1006.3140v1', '1006.3141v1', '1006.3142v1']
+    assert all(d['title'] and d['author'] for d in docs)
+
+
+def test_duplicates_are_not_counted_as_added(tmp_path, papis_library, stub_server):
+    papers = tmp_path / 'papers'
+    papers.mkdir()
+    for name in ['a.pdf', 'b.pdf']:
+        (papers / name).write_bytes(make_pdf([(12, 'arXiv:1006.3140v1 [math.CT]')]))
+    counts = import_directory(
+        str(papers), processes=1, checkpoint=str(tmp_path / 'checkpoint.jsonl'), library=str(papis_library),
+        duplicates=LSHIndex(),
+    )
+    assert (counts[ADDED], counts[DUPLICATE]) == (1, 1)
+    assert len(papis.api.get_all_documents_in_lib(str(papis_library))) == 1
+    assert Checkpoint(str(tmp_path / 'checkpoint.jsonl')).handled(str(papers / 'b.pdf'), os.stat(papers / 'b.pdf'))
+
+
+def test_broken_symlink_does_not_abort_import(tmp_path, papis_library, stub_server):
+    papers = tmp_path / 'papers'
+    papers.mkdir()
+    (papers / 'a.pdf').write_bytes(make_pdf([(12, 'arXiv:1006.3140v1 [math.CT]')]))
+    os.symlink(tmp_path / 'gone.pdf', papers / 'broken.pdf')
+    counts = import_directory(
+        str(papers), processes=1, checkpoint=str(tmp_path / 'checkpoint.jsonl'), library=str(papis_library)
+    )
+    assert (counts[ADDED], counts[FAILED]) == (1, 1)
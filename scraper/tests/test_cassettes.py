@@ -0,0 +1,56 @@
+import urllib.error
+import urllib.request
+import pytest
+import requests
+from crossref.restful import Works
+from papis.arxiv import get_data
+from papis.crossref import doi_to_data
+from ..cassettes import Cassette, CassetteMiss, use_cassette
+
+
+def fetch_everything():
+    work = Works().doi('10.1000/42')
+    entries = get_data(id_list='1006.3140')
+    papis_data = doi_to_data('10.1000/7')
+    pdf = requests.get('https://sci-hub.se/10.1000/42').content
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen('https://doi.org/api/handles/not-a-doi')
+    return work, entries, papis_data, pdf, e.value.code
+
+
+def test_replay_matches_recording_without_network(tmp_path, stub_server):
+    path = str(tmp_path / 'run.jsonl.gz')
+    with use_cassette(path, mode='record') as cassette:
+        recorded = fetch_everything()
+    assert len(cassette.interactions) == 5
+    # The server is gone; only the cassette can answer
+    stub_server.stop()
+    with use_cassette(path) as cassette:
+        assert not cassette.recording
+        assert fetch_everything() == recorded
+        with pytest.raises(CassetteMiss):
+            requests.get('https://sci-hub.se/10.1000/43')
+
+
+def test_repeated_requests_replay_in_order(tmp_path):
+    path = str(tmp_path / 'run.jsonl.gz')
+    cassette = Cassette(path, mode='record')
+    for body in (b'first', b'second'):
+        cassette.record('GET', 'https://api.crossref.org/works/10.1000/1', None, 200, 'OK', {}, body)
+    cassette.save()
+    replay = Cassette(path, mode='replay')
+    bodies = [replay.play('GET', 'https://api.crossref.org/works/10.1000/1')[3] for _ in range(3)]
+    assert bodies == [b'first', b'second', b'second']
+
+
+def test_streamed_responses_replay(tmp_path, stub_server):
+    path = str(tmp_path / 'run.jsonl.gz')
+    url = 'https://sci-hub.se/10.1000/42'
+    with use_cassette(path, mode='record'):
+        recorded = b''.join(requests.get(url, stream=True).iter_content(1024))
+    stub_server.stop()
+    with use_cassette(path):
+        response = requests.get(url, stream=True)
+        assert b''.join(response.iter_content(1024)) == recorded
+        assert requests.get(url, stream=True).raw.read() == recorded
+        assert requests.get(url).content == recorded
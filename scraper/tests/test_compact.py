@@ -0,0 +1,58 @@
+import gc
+import tracemalloc
+from ..base_classes import Document, TagList
+from ..base_classes.infostore import InfoStore
+from ..stubs import fake_work
+
+
+def make_docs(n):
+    return [
+        Document.from_dict({'doc_id': '10.1000/{}'.format(i), 'doctype': 'Doi', 'info': fake_work('10.1000/{}'.format(i)), 'tags': ['crawl']})
+        for i in range(n)
+    ]
+
+
+def test_compact_documents_materialize_on_access():
+    store = InfoStore()
+    doc = make_docs(1)[0].compact(store)
+    assert len(store) == 1 and not hasattr(doc, '__dict__')
+    assert doc.info == fake_work('10.1000/0')
+    doc.update({'note': 'kept'})
+    assert doc.info['note'] == 'kept' and isinstance(doc.tags, TagList) and str(doc.tags) == 'crawl'
+    doc.tags += ['more']
+    assert sorted(doc.tags) == ['crawl', 'more']
+
+
+def test_compact_documents_take_a_fraction_of_the_memory():
+    def measure(compact):
+        gc.collect()
+        tracemalloc.start()
+        docs = make_docs(2000)
+        if compact:
+            store = InfoStore()
+            docs = [doc.compact(store) for doc in docs]
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+
+    assert measure(compact=True) < measure(compact=False) / 5
+
+
+def test_recompacting_reuses_unchanged_entries():
+    store = InfoStore()
+    doc = make_docs(1)[0].compact(store)
+    for _ in range(3):
+        assert doc.info['DOI'] == '10.1000/0'
+        doc.compact(store)
+    assert len(store) == 1
+    doc.update({'note': 'changed'})
+    doc.compact(store)
+    assert len(store) == 2 and doc.info['note'] == 'changed'
+
+
+def test_compact_keeps_a_single_path_whole():
+    doc = Document.from_dict({'doc_id': 'https://example.org/paper.pdf', 'doctype': 'UrlDoc'})
+    # UrlDoc.download returns one path rather than a list
+    doc._files = '/tmp/paper.pdf'
+    assert doc.compact(InfoStore()).files == ('/tmp/paper.pdf',)
@@ -0,0 +1,61 @@
+import gzip
+import json
+from ..base_classes import Document
+from ..base_classes import crossref_dump
+from ..base_classes.crossref_dump import CrossrefDump, build_index
+from ..stubs import fake_work
+
+
+def _write_shard(path, dois):
+    with gzip.open(path, 'wt') as fptr:
+        fptr.writelines(json.dumps(fake_work(doi)) + '\n' for doi in dois)
+
+
+def test_dump_is_indexed_in_blocks_and_resumed(tmp_path):
+    dump, index = tmp_path / 'dump', str(tmp_path / 'index')
+    dump.mkdir()
+    for shard in range(3):
+        _write_shard(dump / '{}.jsonl.gz'.format(shard), ['10.1000/{}.{}'.format(shard, i) for i in range(300)])
+    assert build_index(str(dump), index, workers=2) == 3
+    assert build_index(str(dump), index) == 0
+    _write_shard(dump / '1.jsonl.gz', ['10.1000/new'])
+    assert build_index(str(dump), index) == 1
+    with CrossrefDump(index_dir=index) as works:
+        assert len(works) == 601
+        assert works.get('10.1000/2.123') == fake_work('10.1000/2.123')
+        assert works.get('10.1000/NEW')['DOI'] == '10.1000/new'
+        assert works.get('10.1000/1.5') is None
+
+
+def test_bad_lines_and_shards_do_not_abort_the_build(tmp_path):
+    dump, index = tmp_path / 'dump', str(tmp_path / 'index')
+    dump.mkdir()
+    with gzip.open(dump / '0.jsonl.gz', 'wt') as fptr:
+        fptr.write(json.dumps(fake_work('10.1000/1')) + '\n{"DOI": \n[]\n{"title": "no DOI"}\n')
+        fptr.write(json.dumps(fake_work('10.1000/2')) + '\n')
+    (dump / '1.jsonl.gz').write_bytes(gzip.compress(b'{"DOI": "10.1000/3"}\n')[:-8])
+    assert build_index(str(dump), index) == 1
+    with CrossrefDump(index_dir=index) as works:
+        assert len(works) == 2 and works.get('10.1000/2')['DOI'] == '10.1000/2'
+    _write_shard(dump / '1.jsonl.gz', ['10.1000/3'])
+    assert build_index(str(dump), index) == 1
+    with CrossrefDump(index_dir=index) as works:
+        assert works.get('10.1000/3')['DOI'] == '10.1000/3'
+
+
+def test_scrape_uses_dump_before_api(tmp_path, stub_server):
+    dump = tmp_path / 'dump'
+    dump.mkdir()
+    _write_shard(dump / '0.jsonl.gz', ['10.1000/42'])
+    try:
+        # Without building, a dump with no index isn't used (and no index is created)
+        assert crossref_dump.use_dump(str(dump), str(tmp_path / 'index')) is None
+        assert not (tmp_path / 'index').exists()
+        crossref_dump.use_dump(str(dump), str(tmp_path / 'index'), build=True)
+        doc = Document('doi:10.1000/42').update({'doi': '10.1000/42'}).get_info()
+        other = Document('doi:10.1000/43').update({'doi': '10.1000/43'}).get_info()
+        assert doc.info['reference'] == fake_work('10.1000/42')['reference']
+        assert other.info['reference'] == fake_work('10.1000/43')['reference']
+        assert stub_server.requests[('crossref', 200)] == 3
+    finally:
+        crossref_dump.use_dump(None)
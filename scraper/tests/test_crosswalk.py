@@ -0,0 +1,41 @@
+import pytest
+from ..base_classes import Document, Doi, Arxiv, UrlDoc
+from ..base_classes import crosswalk
+from ..stubs import fake_work
+
+
+@pytest.fixture
+def known(tmp_path):
+    try:
+        yield crosswalk.use_crosswalk(str(tmp_path / 'crosswalk.sqlite'))
+    finally:
+        crosswalk.use_crosswalk(None)
+
+
+def test_known_references_resolve_without_network(known, stub_server):
+    doc = Document('doi:10.1000/42')
+    validations = dict(stub_server.requests)
+    for reference in ('https://doi.org/10.1000/42', 'doi:10.1000/42', 'http://dx.doi.org/10.1000/42'):
+        again = Document(reference)
+        assert (again.doctype, again.doc_id) == (Doi, '10.1000/42')
+    assert stub_server.requests == validations
+
+    # The DOI of a DOI document is found without being set in its info
+    doc.get_info()
+    assert doc.info['title'] == fake_work('10.1000/42')['title'][0]
+
+
+def test_equivalences_found_while_scraping_are_linked(known, stub_server):
+    doc = Document('1006.3140')
+    # As filled in by the arXiv importer
+    doc.update({'doi': '10.1000/7', 'eprint': '1006.3140v1', 'url': 'http://arxiv.org/abs/1006.3140v1'})
+    known.record(doc)
+    requests = dict(stub_server.requests)
+    assert known.equivalents('https://doi.org/10.1000/7') == {'arxiv': '1006.3140', 'doi': '10.1000/7', 'url': 'http://arxiv.org/abs/1006.3140v1'}
+    again = Document('https://arxiv.org/abs/1006.3140v2')
+    assert (again.doctype, again.doc_id) == (Arxiv, '1006.3140v2')
+    assert stub_server.requests == requests
+    known.link([('url', 'https://publisher.example/article/7'), ('doi', '10.1000/7')])
+    assert known.resolve('https://www.publisher.example/article/7/') == ('url', 'https://publisher.example/article/7')
+    assert Document('https://www.publisher.example/article/7/').doctype is UrlDoc
+    assert len(known) == 1
@@ -0,0 +1,45 @@
+from ..library.dedup import LSHIndex, MinHasher, get_signature_text
+
+preprint = {
+    'title': 'A Simply Typed Lambda-Calculus of Forward Automatic Differentiation',
+    'author': 'Manzyuk, Oleksandr',
+}
+journal = {
+    'title': ['A Simply Typed λ-Calculus of Forward Automatic Differentiation'],
+    'author': [{'given': 'Oleksandr', 'family': 'Manzyuk'}],
+}
+unrelated = {
+    'title': 'Notions of computation and monads',
+    'author_list': [{'family': 'Moggi'}],
+}
+
+
+def test_signature_text_ignores_case_and_punctuation():
+    assert get_signature_text({'title': 'Closed Categories.'}) == get_signature_text({'title': ['closed categories']})
+
+
+def test_identical_text_has_identical_signature():
+    hasher = MinHasher()
+    assert hasher.signature('closed categories') == hasher.signature('closed categories')
+
+
+def test_query_finds_near_duplicate_only():
+    index = LSHIndex()
+    index.add('preprint', preprint)
+    index.add('unrelated', unrelated)
+    assert [key for key, _ in index.query(journal)] == ['preprint']
+
+
+def test_duplicates_groups_near_duplicates():
+    index = LSHIndex()
+    index.add('preprint', preprint)
+    index.add('journal', journal)
+    index.add('unrelated', unrelated)
+    assert index.duplicates() == [{'preprint', 'journal'}]
+
+
+def test_documents_without_metadata_are_not_indexed():
+    index = LSHIndex()
+    index.add('empty', {})
+    assert 'empty' not in index
+    assert index.query({}) == []
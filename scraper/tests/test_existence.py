@@ -0,0 +1,82 @@
+import papis.api
+import papis.database
+import papis.document
+import pytest
+from ..base_classes import Document, Doi
+from ..library.batch import PapisBatch
+from ..library.existence import ExistenceIndex, get_identifiers
+
+
+def test_identifiers_are_normalized():
+    assert get_identifiers({'title': 'Closed Categories.'}, 'arXiv:1010.4840v3')[0] == ('arxiv', '1010.4840')
+    assert get_identifiers({'doi': 'doi: 10.1007/BF01220868'})[0] == ('doi', '10.1007/bf01220868')
+    assert get_identifiers({'url': 'https://example.com/paper'}) == []
+
+
+def test_lookup_matches_any_identifier():
+    with ExistenceIndex(':memory:') as index:
+        index.add('kock', {'doi': '10.1007/BF01220868', 'title': 'Monads on symmetric monoidal closed categories'})
+        index.add('blute', {'url': 'http://arxiv.org/abs/1006.3140v1'})
+        assert index.lookup({}, 'https://doi.org/10.1007/bf01220868') == 'kock'
+        assert index.lookup({}, '1006.3140v2') == 'blute'
+        assert index.lookup({'doi': '10.1007/BF01304852'}) is None
+        assert index.lookup({'title': 'Monads on symmetric monoidal closed categories'}) is None
+        index.titles = True
+        assert index.lookup({'title': 'Monads on Symmetric Monoidal Closed Categories'}) == 'kock'
+        assert len(index) == 2
+
+
+def test_sync_from_library(tmp_path, monkeypatch):
+    library = tmp_path / 'library'
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    for name, data in [('kock', {'doi': '10.1007/BF01220868'}), ('blute', {'eprint': '1006.3140'})]:
+        doc = papis.document.Document(data=data | {'title': name})
+        doc.set_folder(str(library / name))
+        (library / name).mkdir(parents=True)
+        doc.save()
+    papis.api.set_lib_from_name(str(library))
+    papis.database.clear_cached()
+    with ExistenceIndex(str(tmp_path / 'existence.sqlite')) as index:
+        assert index.sync(str(library)) == 2
+        assert index.lookup({'doi': '10.1007/bf01220868'}) == str(library / 'kock')
+        assert index.lookup({}, '1006.3140v1') == str(library / 'blute')
+
+
+def test_known_documents_are_not_downloaded(monkeypatch):
+    monkeypatch.setattr(Doi, 'validate', classmethod(lambda cls, doc_id: doc_id))
+
+    def download(cls, doc, **kwargs):
+        raise AssertionError('downloaded a known document')
+
+    monkeypatch.setattr(Doi, 'download', classmethod(download))
+    with ExistenceIndex(':memory:') as index:
+        index.add('kock', {'doi': '10.1007/BF01220868'})
+        doc = Document('10.1007/BF01220868').download(existing=index)
+        assert doc.files == []
+        with pytest.raises(AssertionError):
+            Document('10.1007/BF01304852').download(existing=index)
+
+
+def test_batched_documents_are_indexed_once_committed(tmp_path, papis_library, monkeypatch):
+    monkeypatch.setattr(Doi, 'validate', classmethod(lambda cls, doc_id: doc_id))
+    write = PapisBatch._write
+
+    def flaky_write(self, lib_dir, files, data):
+        if data['title'] == 'Broken':
+            raise OSError('disk full')
+        return write(self, lib_dir, files, data)
+
+    monkeypatch.setattr(PapisBatch, '_write', flaky_write)
+    pdf = tmp_path / 'paper.pdf'
+    pdf.write_bytes(b'%PDF')
+    with ExistenceIndex(':memory:') as index:
+        batch = PapisBatch(str(papis_library), link=True)
+        for doi, title in [('10.1007/BF01220868', 'Monads'), ('10.1007/BF01304852', 'Broken')]:
+            doc = Document(doi).add_files(str(pdf))
+            doc.update({'doi': doi, 'title': title})
+            doc.add_to_library(batch=batch, existing=index)
+        assert len(index) == 0
+        batch.commit()
+        assert batch.failed == ['10.1007/BF01304852']
+        assert index.lookup({'doi': '10.1007/BF01220868'}) == '10.1007/BF01220868'
+        assert index.lookup({'doi': '10.1007/BF01304852'}) is None
@@ -0,0 +1,66 @@
+import os
+from ..library import fulltext
+from ..library.fulltext import FullTextIndex
+
+
+def read_text(path):
+    with open(path) as fptr:
+        return fptr.read()
+
+
+def make_index(tmp_path):
+    return FullTextIndex(str(tmp_path / 'index.sqlite'), processes=1, extractor=read_text)
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_phrase_and_prefix_queries(tmp_path):
+    paper = write(tmp_path / 'paper.pdf', 'Cartesian differential categories and the lambda calculus')
+    with make_index(tmp_path) as index:
+        assert index.index_files([str(tmp_path)]) == 1
+        assert [p for p, _ in index.search('differential categories', phrase=True)] == [paper]
+        assert index.search('categories differential', phrase=True) == []
+        assert [p for p, _ in index.search('cartes lamb', prefix=True)] == [paper]
+
+
+def test_reindexing_unchanged_files_is_a_noop(tmp_path):
+    write(tmp_path / 'paper.pdf', 'monads')
+    with make_index(tmp_path) as index:
+        assert index.index_files([str(tmp_path)]) == 1
+        assert index.index_files([str(tmp_path)]) == 0
+
+
+def test_modified_file_is_reindexed(tmp_path):
+    paper = write(tmp_path / 'paper.pdf', 'monads')
+    with make_index(tmp_path) as index:
+        index.index_files([paper])
+        write(tmp_path / 'paper.pdf', 'comonads and more')
+        os.utime(paper, (0, 12345))
+        assert index.index_files([paper]) == 1
+        assert index.search('monads') == []
+        assert [p for p, _ in index.search('comonads')] == [paper]
+
+
+def test_identical_contents_are_extracted_once(tmp_path):
+    first = write(tmp_path / 'first.pdf', 'monads')
+    second = write(tmp_path / 'second.pdf', 'monads')
+    with make_index(tmp_path) as index:
+        assert index.index_files([first, second]) == 1
+        assert sorted(p for p, _ in index.search('monads')) == [first, second]
+
+
+def test_few_files_are_indexed_without_a_pool(tmp_path, monkeypatch):
+    paper = write(tmp_path / 'paper.pdf', 'monads')
+    monkeypatch.setattr(fulltext, 'ProcessPoolExecutor', None)
+    with make_index(tmp_path) as index:
+        assert index.index_files([paper]) == 1
+
+
+def test_many_files_are_indexed_in_a_pool(tmp_path):
+    papers = [write(tmp_path / '{}.pdf'.format(i), 'paper {}'.format(i)) for i in range(fulltext.POOL_THRESHOLD)]
+    with make_index(tmp_path) as index:
+        assert index.index_files([str(tmp_path)]) == len(papers)
+        assert [p for p, _ in index.search('paper 3', phrase=True)] == [papers[3]]
@@ -0,0 +1,12 @@
+import bs4
+from ..stubs import fake_html_page
+from ..parsing import iter_hrefs
+
+
+def test_streaming_hrefs_match_soup():
+    page = fake_html_page(500).replace(b'<p>', b'<p><a name="x">anchor</a><A HREF="https://DOI.org/10.1/Upper">u</A>', 7)
+    soup = bs4.BeautifulSoup(page, features='lxml')
+    expected = [a['href'] for a in soup.find_all('a', href=True) if 'arxiv' in a['href'] or 'doi' in a['href']]
+    # Chunk boundaries fall inside tags and attribute values
+    chunks = [page[i:i + 97] for i in range(0, len(page), 97)]
+    assert list(iter_hrefs(chunks)) == expected and len(expected) == 250
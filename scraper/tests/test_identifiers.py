@@ -0,0 +1,40 @@
+from ..base_classes import Doi
+from ..base_classes.identifiers import canonicalize_doi, canonicalize_dois, dedupe_by_doi
+
+
+def test_spellings_of_a_doi_are_canonicalized():
+    spellings = [
+        '10.1016/S0896-6273(04)00043-1',
+        'doi:10.1016/s0896-6273(04)00043-1',
+        'https://doi.org/10.1016%2FS0896-6273%2804%2900043-1',
+        'http://dx.doi.org/10.1016%252FS0896-6273%252804%252900043-1',
+        'https://www.sciencedirect.com/science/article/pii/x?doi=10.1016/S0896-6273(04)00043-1&via=ihub',
+        'info:doi/10.1016/S0896-6273(04)00043-1',
+        '(Neuron, doi:10.1016/S0896-6273(04)00043-1).',
+    ]
+    assert set(canonicalize_dois(spellings)) == {'10.1016/s0896-6273(04)00043-1'}
+    assert canonicalize_doi('10.1002/(SICI)1097-4636(199706)35:4<431::AID-JBM4>3.0.CO;2-G') == \
+        '10.1002/(sici)1097-4636(199706)35:4<431::aid-jbm4>3.0.co;2-g'
+    assert canonicalize_dois(['https://arxiv.org/abs/1006.3140', '', None]) == [None, None, None]
+
+
+def test_links_are_deduped_by_doi():
+    links = [
+        'https://doi.org/10.1207%2Fs15516709cog0000_59',
+        '//arxiv.org/abs/quant-ph/0005025',
+        'https://doi.org/10.1207/S15516709COG0000_59',
+        '//arxiv.org/abs/quant-ph/0005025',
+        'https://doi.org/10.1038%2F440611a',
+    ]
+    seen = set()
+    assert [doi for _, doi in dedupe_by_doi(links, seen)] == ['10.1207/s15516709cog0000_59', None, '10.1038/440611a']
+    # Another page linking the same DOI adds nothing
+    assert list(dedupe_by_doi(['doi:10.1038/440611A'], seen)) == []
+
+
+def test_doi_validation_finds_encoded_dois_locally(stub_server):
+    assert Doi.validate('https://doi.org/10.1000%2F42') == '10.1000/42'
+    # The ID keeps the DOI's case; only matching is case-insensitive
+    assert Doi.validate('https://doi.org/10.1016%2FS0896-6273%2804%2900043-1') == '10.1016/S0896-6273(04)00043-1'
+    assert Doi.validate('https://www.cs.ox.ac.uk/people/jamie.vicary/Introduction.pdf') is None
+    assert stub_server.requests == {('doi', 200): 2}
@@ -0,0 +1,194 @@
+import json
+import multiprocessing
+import os
+import signal
+from ..base_classes import Document
+from ..library.batch import PapisBatch
+from ..library.existence import ExistenceIndex
+from ..pipeline.journal import JobJournal, JournaledPipeline, ADDED, ADDING, DUPLICATE, FAILED, INVALID, JOB_KEY
+
+
+class FakePipeline(JournaledPipeline):
+    """
+    Logs every step to a file and "adds" to a JSON Lines library, optionally killing itself once at a given step
+    """
+
+    def __init__(self, journal, tmp_path, crash_at=None):
+        super().__init__(journal)
+        self.tmp_path = tmp_path
+        self.crash_at = crash_at
+
+    def _step(self, name, key):
+        with open(self.tmp_path / 'steps.log', 'a') as fptr:
+            fptr.write('{} {}\n'.format(name, key))
+        marker = self.tmp_path / 'crashed'
+        if (name, key) == self.crash_at and not marker.exists():
+            marker.touch()
+            os.kill(os.getpid(), signal.SIGKILL)
+
+    def validate(self, key):
+        return Document.from_dict({'doc_id': key, 'doctype': None if key == 'junk' else 'Doi'})
+
+    def download(self, doc):
+        self._step('download', doc.doc_id)
+        return doc.add_files('{}.pdf'.format(doc.doc_id))
+
+    def scrape(self, doc):
+        self._step('scrape', doc.doc_id)
+        return doc.update({'title': doc.doc_id.upper()})
+
+    def add(self, doc, on_commit):
+        with open(self.tmp_path / 'library.jsonl', 'a') as fptr:
+            fptr.write(json.dumps(doc.info) + '\n')
+        self._step('add', doc.doc_id)
+        on_commit()
+        return doc
+
+    def is_added(self, key):
+        return key in {d[JOB_KEY] for d in library(self.tmp_path)}
+
+
+def library(tmp_path):
+    path = tmp_path / 'library.jsonl'
+    return [json.loads(line) for line in open(path)] if path.exists() else []
+
+
+def steps(tmp_path):
+    return (tmp_path / 'steps.log').read_text().splitlines()
+
+
+def run_and_kill(tmp_path, keys, crash_at):
+    def target():
+        with JobJournal(str(tmp_path / 'journal.sqlite')) as journal:
+            FakePipeline(journal, tmp_path, crash_at).run(keys)
+
+    process = multiprocessing.get_context('fork').Process(target=target)
+    process.start()
+    process.join()
+    assert process.exitcode == -signal.SIGKILL
+
+
+def resume(tmp_path):
+    with JobJournal(str(tmp_path / 'journal.sqlite')) as journal:
+        counts = FakePipeline(journal, tmp_path).run()
+        return counts, journal.counts()
+
+
+def test_resume_after_kill_mid_batch(tmp_path):
+    keys = ['a', 'b', 'junk', 'c']
+    run_and_kill(tmp_path, keys, crash_at=('scrape', 'b'))
+    assert steps(tmp_path) == ['download a', 'scrape a', 'add a', 'download b', 'scrape b']
+
+    counts, stages = resume(tmp_path)
+    # The whole chunk, 'junk' included, was validated before the first job was downloaded
+    assert counts == {ADDED: 2}
+    assert stages == {ADDED: 3, INVALID: 1}
+    # 'b' resumes at scraping, without downloading again
+    assert steps(tmp_path)[5:] == ['scrape b', 'add b', 'download c', 'scrape c', 'add c']
+    assert [d['title'] for d in library(tmp_path)] == ['A', 'B', 'C']
+
+
+def test_kill_after_add_does_not_add_twice(tmp_path):
+    run_and_kill(tmp_path, ['a', 'b'], crash_at=('add', 'a'))
+    counts, stages = resume(tmp_path)
+    assert stages == {ADDED: 2}
+    assert [d[JOB_KEY] for d in library(tmp_path)] == ['a', 'b']
+    assert steps(tmp_path).count('add a') == 1
+
+
+def test_failed_stage_is_retried_from_last_completed(tmp_path):
+    class Flaky(FakePipeline):
+        fail = True
+
+        def scrape(self, doc):
+            if Flaky.fail:
+                Flaky.fail = False
+                raise ConnectionError('rate limited')
+            return super().scrape(doc)
+
+    with JobJournal(str(tmp_path / 'journal.sqlite')) as journal:
+        assert Flaky(journal, tmp_path).run(['a']) == {'failed': 1}
+        assert Flaky(journal, tmp_path).run() == {ADDED: 1}
+    assert steps(tmp_path) == ['download a', 'scrape a', 'add a']
+
+
+def test_batched_jobs_are_added_once_committed(tmp_path, papis_library, monkeypatch):
+    write = PapisBatch._write
+
+    def flaky_write(self, lib_dir, files, data):
+        if data['title'] == 'B':
+            raise OSError('disk full')
+        return write(self, lib_dir, files, data)
+
+    monkeypatch.setattr(PapisBatch, '_write', flaky_write)
+    (tmp_path / 'a.pdf').write_bytes(b'%PDF')
+    (tmp_path / 'b.pdf').write_bytes(b'%PDF')
+
+    class Batched(JournaledPipeline):
+        def validate(self, key):
+            return Document.from_dict({'doc_id': key, 'doctype': 'Doi'})
+
+        def download(self, doc):
+            return doc.add_files(str(tmp_path / '{}.pdf'.format(doc.doc_id)))
+
+        def scrape(self, doc):
+            return doc.update({'title': doc.doc_id.upper()})
+
+    with JobJournal(str(tmp_path / 'journal.sqlite')) as journal:
+        pipeline = Batched(journal, batch=PapisBatch(str(papis_library), link=True))
+        assert pipeline.run(['a', 'b']) == {ADDED: 1, FAILED: 1}
+        assert journal.counts() == {ADDED: 1, ADDING: 1}
+        assert journal.unfinished() == ['b']
+
+
+def test_jobs_for_the_same_document_are_added_once(tmp_path, papis_library, monkeypatch):
+    (tmp_path / 'x.pdf').write_bytes(b'%PDF')
+
+    class SameDocument(JournaledPipeline):
+        def validate(self, key):
+            return Document.from_dict({'doc_id': '10.1/x', 'doctype': 'Doi'})
+
+        def download(self, doc):
+            return doc.add_files(str(tmp_path / 'x.pdf'))
+
+        def scrape(self, doc):
+            return doc.update({'title': 'X'})
+
+    keys = ['doi:10.1/x', 'https://doi.org/10.1/x']
+    with JobJournal(str(tmp_path / 'journal.sqlite')) as journal:
+        batch = PapisBatch(str(papis_library), link=True)
+        pipeline = SameDocument(journal, batch=batch, batch_size=1, existing=ExistenceIndex(':memory:'))
+        # The first job is committed before the second is added, which then finds it in the library
+        assert pipeline.run(keys) == {ADDED: 1, DUPLICATE: 1}
+        assert [journal.get(key)[0] for key in keys] == [ADDED, DUPLICATE]
+        assert journal.unfinished() == []
+
+    def broken_write(self, lib_dir, files, data):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(PapisBatch, '_write', broken_write)
+    with JobJournal(str(tmp_path / 'retry.sqlite')) as journal:
+        # Both jobs are staged in one batch, and both failed writes are recorded
+        pipeline = SameDocument(journal, batch=PapisBatch(str(papis_library), link=True))
+        assert pipeline.run(keys) == {FAILED: 2}
+        assert journal.unfinished() == keys
+
+
+def test_arxiv_metadata_is_fetched_in_one_request(tmp_path, stub_server):
+    class Offline(JournaledPipeline):
+        def download(self, doc):
+            assert doc.info['eprint']
+            return doc
+
+        def scrape(self, doc):
+            return doc
+
+        def add(self, doc, on_commit):
+            on_commit()
+            return doc
+
+    ids = ['1006.314{}'.format(i) for i in range(3)]
+    with JobJournal(str(tmp_path / 'journal.sqlite')) as journal:
+        assert Offline(journal).run(ids) == {ADDED: 3}
+        assert all(journal.get(i)[1].info['title'] for i in ids)
+    assert stub_server.requests[('arxiv', 200)] == 1
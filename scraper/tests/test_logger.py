@@ -0,0 +1,67 @@
+import json
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from ..logger import JsonLinesSink, configure_logging, configure_worker, stop_logging, worker_initargs
+
+
+def test_json_lines_sink_streams_records(tmp_path):
+    path = tmp_path / 'refs.jsonl'
+    records = ({'source_url': 'https://example.org/{}'.format(i), 'href': 'https://doi.org/10.1000/{}'.format(i)} for i in range(3))
+    with JsonLinesSink(str(path)) as sink:
+        sink.write(next(records))
+        # Flushed as soon as it is written
+        assert json.loads(path.read_text()) == {'source_url': 'https://example.org/0', 'href': 'https://doi.org/10.1000/0'}
+        assert sink.write_all(records) == 2
+    assert [json.loads(line)['href'] for line in path.read_text().splitlines()] == [
+        'https://doi.org/10.1000/{}'.format(i) for i in range(3)
+    ]
+
+
+def test_queued_structured_logging_with_sampling(tmp_path):
+    path = tmp_path / 'scraper.log'
+    configure_logging('INFO', str(path), structured=True, levels={'noisy': 'ERROR'}, sample_burst=3)
+    try:
+        def work(worker):
+            for i in range(10):
+                logging.getLogger().warning('Exception thrown during Crossref lookup of DOI %s', '10.1000/{}'.format(i))
+            logging.getLogger().info('Worker %d done', worker, extra={'worker': worker})
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logging.getLogger('noisy').warning('Not written')
+    finally:
+        stop_logging()
+        logging.getLogger('noisy').setLevel(logging.NOTSET)
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    lookups = [r for r in records if r['message'].startswith('Exception thrown during Crossref lookup')]
+    assert len(lookups) == 3
+    assert sorted(r['worker'] for r in records if 'worker' in r) == [0, 1, 2, 3]
+    assert not any(r['logger'] == 'noisy' for r in records)
+    assert logging.getLogger().handlers == [h for h in logging.getLogger().handlers if not hasattr(h, 'queue')]
+
+
+def _log_from_worker(i):
+    logging.getLogger().warning('Worker record %d', i)
+    return i
+
+
+def test_worker_processes_log_through_parent(tmp_path):
+    path = tmp_path / 'scraper.log'
+    configure_logging('INFO', str(path), structured=True)
+    try:
+        with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('fork')) as pool:
+            assert list(pool.map(_log_from_worker, range(3))) == [0, 1, 2]
+        with ProcessPoolExecutor(
+            1, mp_context=multiprocessing.get_context('spawn'), initializer=configure_worker, initargs=worker_initargs()
+        ) as pool:
+            assert list(pool.map(_log_from_worker, range(3, 5))) == [3, 4]
+        logging.getLogger().warning('Parent record')
+    finally:
+        stop_logging()
+    messages = sorted(json.loads(line)['message'] for line in path.read_text().splitlines())
+    assert messages == ['Parent record'] + ['Worker record {}'.format(i) for i in range(5)]
@@ -0,0 +1,56 @@
+import urllib.request
+import pytest
+from .. import metrics
+from ..base_classes import Document, UrlDoc
+from ..metrics import Registry, Histogram, Gauge
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = Histogram('demo_seconds', 'Latency', ['stage'], buckets=(0.1, 1), registry=registry)
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, stage='download')
+    assert registry.render().splitlines()[2:] == [
+        'demo_seconds_bucket{stage="download",le="0.1"} 2.0',
+        'demo_seconds_bucket{stage="download",le="1.0"} 3.0',
+        'demo_seconds_bucket{stage="download",le="+Inf"} 4.0',
+        'demo_seconds_sum{stage="download"} 3.65',
+        'demo_seconds_count{stage="download"} 4.0',
+    ]
+    with pytest.raises(ValueError):
+        latency.observe(1)
+
+
+def test_track_counts_outcomes():
+    before = metrics.stage_total.value(stage='test', doctype='Doi', outcome='error')
+    with pytest.raises(KeyError):
+        with metrics.track('test', 'Doi'):
+            assert metrics.in_progress.value(stage='test') == 1
+            raise KeyError
+    assert metrics.in_progress.value(stage='test') == 0
+    assert metrics.stage_total.value(stage='test', doctype='Doi', outcome='error') == before + 1
+    assert metrics.stage_seconds.count(stage='test', doctype='Doi') >= 1
+
+
+def test_http_endpoint_and_file_dump(tmp_path):
+    registry = Registry()
+    Gauge('demo_queue_depth', 'Jobs waiting', registry=registry).set(7)
+    server = metrics.start_http_server(0, '127.0.0.1', registry=registry)
+    try:
+        url = 'http://127.0.0.1:{}/metrics'.format(server.server_address[1])
+        assert 'demo_queue_depth 7.0' in urllib.request.urlopen(url).read().decode()
+    finally:
+        server.shutdown()
+    metrics.dump(str(tmp_path / 'scraper.prom'), registry)
+    assert (tmp_path / 'scraper.prom').read_text() == registry.render()
+
+
+def test_download_bytes_of_a_single_path(tmp_path, monkeypatch):
+    pdf = tmp_path / 'paper.pdf'
+    pdf.write_bytes(b'%PDF-1.4\n%')
+    # UrlDoc.download returns one path rather than a list
+    monkeypatch.setattr(UrlDoc, 'download', classmethod(lambda cls, doc, **kwargs: str(pdf)))
+    doc = Document.from_dict({'doc_id': 'https://example.org/paper.pdf', 'doctype': 'UrlDoc'})
+    before = metrics.download_bytes.value(doctype='UrlDoc')
+    assert doc.download().files == [str(pdf)]
+    assert metrics.download_bytes.value(doctype='UrlDoc') == before + 10
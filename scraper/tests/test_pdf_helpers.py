@@ -0,0 +1,85 @@
+import pytest
+from pdfminer.pdfparser import PDFSyntaxError
+from ..utils import pdf_helpers
+from ..utils.pdf_helpers import analyze_pdf, get_validated_doi_from_pdf
+from ..utils.string_helpers import get_title_as_filename
+from ..stubs import make_pdf
+
+paper = make_pdf(
+    [
+        (24, 'Closed Categories'),
+        (12, 'S. Eilenberg and G. M. Kelly'),
+        (10, 'doi:10.1007/978-3-642-99902-4_22'),
+    ],
+    [
+        (10, 'Some results.'),
+        (14, 'References'),
+        (10, 'Mac Lane, Categories for the working mathematician, arXiv:1006.3140'),
+    ],
+    info={'Author': 'Eilenberg'},
+)
+
+
+def test_analysis_extracts_everything_in_one_pass():
+    analysis = analyze_pdf(paper)
+    assert analysis.title == 'Closed Categories'
+    assert analysis.metadata['Author'] == 'Eilenberg'
+    assert 'Eilenberg and G. M. Kelly' in analysis.first_page
+    assert analysis.doi == '10.1007/978-3-642-99902-4_22'
+    assert analysis.arxiv_id == '1006.3140'
+    assert analysis.references.startswith('Mac Lane')
+
+
+def test_callers_share_cached_analysis(tmp_path, monkeypatch):
+    path = tmp_path / 'paper.pdf'
+    path.write_bytes(paper)
+    pdf_helpers._cache.clear()
+    calls = []
+    analyze = pdf_helpers._analyze
+    monkeypatch.setattr(pdf_helpers, '_analyze', lambda *args: calls.append(args) or analyze(*args))
+    assert get_title_as_filename(str(path)) == 'Closed_Categories.pdf'
+    assert get_validated_doi_from_pdf(str(path)) == '10.1007/978-3-642-99902-4_22'
+    assert len(calls) == 1
+
+
+def test_title_falls_back_to_string():
+    assert get_title_as_filename('hi there') == 'hi_there.pdf'
+
+
+def test_only_the_page_window_is_laid_out():
+    book = make_pdf(
+        [(24, 'A Long Book'), (10, 'doi:10.1000/first')],
+        *[[(10, 'doi:10.1000/middle{}'.format(i))] for i in range(20)],
+        [(14, 'Bibliography'), (10, 'arXiv:1010.4840')],
+    )
+    analysis = analyze_pdf(book)
+    assert analysis.page_count == 22
+    assert analysis.dois == ['10.1000/first', '10.1000/middle0']
+    assert analysis.arxiv_id == '1010.4840'
+    assert analyze_pdf(book, first_pages=1, last_pages=0).dois == ['10.1000/first']
+
+
+def test_files_are_cached_without_hashing(tmp_path, monkeypatch):
+    path = tmp_path / 'paper.pdf'
+    path.write_bytes(paper)
+    pdf_helpers._cache.clear()
+    monkeypatch.setattr(pdf_helpers, '_hash', lambda buffer: pytest.fail('hashed a file'))
+    assert analyze_pdf(str(path)).sha256 is None
+    assert analyze_pdf(str(path)) is analyze_pdf(str(path))
+    path.write_bytes(make_pdf([(24, 'Another Title')]))
+    assert analyze_pdf(str(path)).title == 'Another Title'
+
+
+def test_content_hash_is_optional(tmp_path):
+    first, copy = tmp_path / 'first.pdf', tmp_path / 'copy.pdf'
+    first.write_bytes(paper)
+    copy.write_bytes(paper)
+    analysis = analyze_pdf(str(first), content_hash=True)
+    assert analysis.sha256 and analyze_pdf(str(copy), content_hash=True) is analysis
+
+
+def test_empty_file_is_not_mapped(tmp_path):
+    path = tmp_path / 'empty.pdf'
+    path.write_bytes(b'')
+    with pytest.raises(PDFSyntaxError):
+        analyze_pdf(str(path))
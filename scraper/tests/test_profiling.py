@@ -0,0 +1,44 @@
+import os
+import pstats
+import time
+from .. import metrics, profiling
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampling_profile_is_split_by_stage(tmp_path):
+    profiling.start('sample')
+    with metrics.track('pdf_parse'):
+        busy(0.2)
+    written = profiling.stop(str(tmp_path / 'profile'))
+    assert written == [str(tmp_path / 'profile.collapsed'), str(tmp_path / 'profile-summary.txt')]
+    stacks = dict(line.rsplit(' ', 1) for line in open(tmp_path / 'profile.collapsed').read().splitlines())
+    assert any(s.startswith('pdf_parse;') and s.endswith('test_profiling.py:busy') for s in stacks)
+    assert '== pdf_parse' in (tmp_path / 'profile-summary.txt').read_text()
+
+
+def test_cprofile_mode_writes_one_profile_per_stage(tmp_path):
+    profiling.start('cprofile')
+    with metrics.track('scrape'):
+        with metrics.track('validate'):
+            busy(0.01)
+    profiling.stop(str(tmp_path / 'profile'))
+    assert sorted(os.listdir(tmp_path)) == [
+        'profile-no-stage.pstats', 'profile-scrape.pstats', 'profile-summary.txt', 'profile-validate.pstats'
+    ]
+    functions = {name for _, _, name in pstats.Stats(str(tmp_path / 'profile-validate.pstats')).stats}
+    assert 'busy' in functions
+
+
+def test_profile_flags_are_removed_from_argv(monkeypatch):
+    started = []
+    monkeypatch.setattr(profiling, 'start', started.append)
+    monkeypatch.setattr(profiling.atexit, 'register', lambda *args: None)
+    argv = ['scihubget.py', '--profile=cprofile', '10.1016/j.entcs.2012.08.017', '--profile-out=/tmp/p']
+    profiling.from_argv(argv)
+    assert argv == ['scihubget.py', '10.1016/j.entcs.2012.08.017']
+    assert started == ['cprofile']
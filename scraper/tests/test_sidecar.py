@@ -0,0 +1,27 @@
+import yaml
+from ..base_classes import Document
+from ..base_classes.sidecar import Sidecar, LazyInfo, BULKY_FIELDS
+from ..library.batch import PapisBatch
+from ..stubs import fake_work
+
+
+def test_slim_info_is_written_without_bulky_fields(tmp_path, papis_library, stub_server):
+    sidecar = Sidecar(str(tmp_path / 'sidecar.sqlite'))
+    doc = Document('doi:10.1000/42').update({'doi': '10.1000/42'}).get_info(sidecar=sidecar)
+    assert isinstance(doc.info, LazyInfo)
+    assert 'reference' not in doc.info and doc.info['citations']
+    assert not BULKY_FIELDS & set(doc.info)
+    # Bulky fields are still there on demand
+    assert doc.info['link'] == fake_work('10.1000/42')['link']
+    assert doc.info.full()['issued'] == fake_work('10.1000/42')['issued']
+
+    library = papis_library
+    with PapisBatch(str(library)) as batch:
+        doc.add_to_library(batch=batch)
+    (info_file,) = library.glob('*/info.yaml')
+    written = yaml.safe_load(info_file.read_text())
+    assert written['title'] == doc.info['title'] and 'link' not in written and 'reference' not in written
+
+    # A restored document (e.g. from the job journal) finds its bulky fields by ID
+    restored = Document.from_dict(doc.to_dict(), sidecar=Sidecar(str(tmp_path / 'sidecar.sqlite')))
+    assert restored.info == doc.info and restored.info['link'] == doc.info['link']
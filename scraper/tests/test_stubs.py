@@ -0,0 +1,58 @@
+import time
+import requests
+from crossref.restful import Works
+from papis.arxiv import get_data
+from .. import endpoints
+from ..base_classes import Document, Doi, Arxiv
+from ..stubs import StubServer, fake_work
+from ..utils.pdf_helpers import analyze_pdf
+
+
+def test_clients_reach_stubbed_services(stub_server):
+    work = Works().doi('10.1000/42')
+    assert work['DOI'] == '10.1000/42' and work['title']
+    (entry,) = get_data(id_list='1006.3140')
+    assert entry['url'] == 'http://arxiv.org/abs/1006.3140v1'
+    pdf = requests.get('https://sci-hub.se/10.1000/42').content
+    assert analyze_pdf(pdf).doi.startswith('10.1000/')
+    assert stub_server.requests == {('crossref', 200): 1, ('arxiv', 200): 1, ('pdf', 200): 1}
+
+
+def test_recorded_fixtures_are_replayed(tmp_path):
+    (tmp_path / 'crossref').mkdir()
+    (tmp_path / 'crossref' / '10.1000_42').write_text('{"message": {"DOI": "10.1000/42", "title": ["Recorded"]}}')
+    with StubServer(fixtures=str(tmp_path)) as server, endpoints.using(crossref=server.endpoints['crossref']):
+        assert Works().doi('10.1000/42')['title'] == ['Recorded']
+
+
+def test_fault_injection():
+    services = {'crossref': {'error_rate': 1.0}, 'pdf': {'rate_limit': 2}, 'arxiv': {'latency': 0.2}}
+    with StubServer(services=services) as server:
+        assert requests.get(server.endpoints['crossref'] + '/works/10.1000/1').status_code in (500, 503)
+        statuses = [requests.get(server.endpoints['pdf'] + '/x.pdf').status_code for _ in range(4)]
+        assert statuses[:2] == [200, 200] and 429 in statuses[2:]
+        start = time.perf_counter()
+        requests.get(server.endpoints['arxiv'] + '/query?id_list=1006.3140')
+        assert time.perf_counter() - start >= 0.2
+
+
+def test_fractional_rate_limit_allows_one_request():
+    with StubServer(services={'arxiv': {'rate_limit': 0.3}}) as server:
+        url = server.endpoints['arxiv'] + '/query?id_list=1006.3140'
+        assert [requests.get(url).status_code for _ in range(2)] == [200, 429]
+
+
+def test_endpoints_are_restored():
+    original = requests.Session.request
+    with StubServer() as server, endpoints.using(**server.endpoints):
+        assert requests.Session.request is not original
+    assert requests.Session.request is original
+
+
+def test_ids_are_validated_and_scraped_against_stubs(stub_server):
+    assert Document('doi:10.1000/42').doctype is Doi
+    assert Document('1006.3140').doctype is Arxiv
+    assert Document('not an id').doctype not in (Doi, Arxiv)
+    doc = Document('doi:10.1000/42').update({'doi': '10.1000/42'}).get_info()
+    assert doc.info['title'] == fake_work('10.1000/42')['title'][0]
+    assert stub_server.requests[('doi', 200)] == 2 and stub_server.requests[('arxiv_abs', 200)] == 1
@@ -0,0 +1,53 @@
+import json
+import pytest
+from .. import tracing
+from ..base_classes import Document, Doi
+
+
+@pytest.fixture
+def exporter():
+    exporter = tracing.MemoryExporter()
+    tracing.configure(exporter)
+    yield exporter
+    tracing.configure(None)
+
+
+def test_document_spans_nest_and_carry_doc_id(exporter, monkeypatch):
+    def download(cls, doc, **kwargs):
+        with tracing.span('scidownl.download'):
+            return []
+
+    monkeypatch.setattr(Doi, 'download', classmethod(download))
+    doc = Document.from_dict({'doc_id': '10.1007/BF01220868', 'doctype': 'Doi'})
+    doc.download()
+    inner, outer = exporter.spans
+    assert (inner.name, outer.name) == ('scidownl.download', 'Document.download')
+    assert inner.parent_id == outer.span_id and inner.trace_id == outer.trace_id
+    assert outer.attributes == {'doc_id': '10.1007/BF01220868', 'doctype': 'Doi'}
+
+
+def test_errors_are_recorded(exporter):
+    with pytest.raises(ValueError):
+        with tracing.span('parse'):
+            raise ValueError('bad xref table')
+    assert exporter.spans[0].error == 'ValueError: bad xref table'
+
+
+def test_exporters_write_jsonl_and_otlp(tmp_path):
+    for name, exporter in [('jsonl', tracing.JsonLinesExporter), ('otlp', tracing.OtlpJsonExporter)]:
+        tracing.configure(exporter(str(tmp_path / name)))
+        with tracing.span('Document.get_info', doc_id='1006.3140'):
+            with tracing.span('crossref.works.doi'):
+                pass
+        tracing.configure(None)
+    spans = [json.loads(line) for line in open(tmp_path / 'jsonl')]
+    assert [s['name'] for s in spans] == ['crossref.works.doi', 'Document.get_info']
+    assert spans[0]['parent_id'] == spans[1]['span_id']
+    (request,) = [json.loads(line) for line in open(tmp_path / 'otlp')]
+    otlp_spans = request['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert otlp_spans[1]['attributes'] == [{'key': 'doc_id', 'value': {'stringValue': '1006.3140'}}]
+    assert otlp_spans[0]['parentSpanId'] == otlp_spans[1]['spanId']
+
+
+def test_spans_are_free_when_tracing_is_off():
+    assert tracing.span('anything', doc_id='x') is tracing.span('else')
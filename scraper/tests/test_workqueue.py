@@ -0,0 +1,127 @@
+import multiprocessing
+import time
+from ..base_classes import Document
+from ..library.batch import PapisBatch
+from ..pipeline.workqueue import WorkQueue, QueueWorker, LibraryWriter, DONE, FAILED, LEASED, WRITTEN
+
+
+class FakeWorker(QueueWorker):
+    def __init__(self, queue, log, delay=0.02, **kwargs):
+        super().__init__(queue, **kwargs)
+        self.log = log
+        self.delay = delay
+
+    def process(self, key):
+        time.sleep(self.delay)
+        with open(self.log, 'a') as fptr:
+            fptr.write('{} {}\n'.format(key, self.worker_id))
+        return Document.from_dict({'doc_id': key, 'doctype': 'Doi', 'info': {'title': key}})
+
+
+def test_workers_share_queue_without_duplicating_jobs(tmp_path):
+    path, log = str(tmp_path / 'queue.sqlite'), str(tmp_path / 'jobs.log')
+    keys = ['10.1000/{}'.format(i) for i in range(24)]
+    with WorkQueue(path) as queue:
+        assert queue.put(keys) == 24
+        assert queue.put(keys[:4]) == 0
+
+    def work(name):
+        with WorkQueue(path) as queue:
+            FakeWorker(queue, log, worker_id=name).run()
+
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=work, args=('worker{}'.format(i),)) for i in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+
+    processed = [line.split() for line in open(log)]
+    assert sorted(key for key, _ in processed) == sorted(keys)
+    assert len({worker for _, worker in processed}) > 1
+    with WorkQueue(path) as queue:
+        assert queue.counts() == {DONE: 24}
+        assert [doc.info['title'] for _, doc in queue.results()] == keys
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    with WorkQueue(str(tmp_path / 'queue.sqlite'), lease_seconds=0.2) as queue:
+        queue.put(['10.1000/1'])
+        assert queue.lease('dead') == ['10.1000/1']
+        assert queue.lease('alive') == []
+        time.sleep(0.3)
+        assert queue.lease('alive') == ['10.1000/1']
+        assert not queue.complete('10.1000/1', 'dead', None)
+        assert queue.complete('10.1000/1', 'alive', Document.from_dict({'doc_id': '10.1000/1'}))
+
+
+def test_heartbeat_keeps_lease_and_attempts_are_bounded(tmp_path):
+    path = str(tmp_path / 'queue.sqlite')
+    with WorkQueue(path, lease_seconds=0.2, max_attempts=2) as queue, WorkQueue(path, lease_seconds=0.2) as other:
+        queue.put(['10.1000/1', '10.1000/2'])
+
+        class Slow(FakeWorker):
+            def process(self, key):
+                time.sleep(0.5)
+                assert other.lease('other') == ['10.1000/2']
+                return super().process(key)
+
+        assert Slow(queue, str(tmp_path / 'jobs.log'), worker_id='slow').run_job(queue.lease('slow')[0]) == DONE
+        assert queue.counts() == {DONE: 1, LEASED: 1}
+        # '10.1000/2' was abandoned by "other"; it is leased once more, then given up on
+        time.sleep(0.3)
+        assert queue.lease('third') == ['10.1000/2']
+        time.sleep(0.3)
+        assert queue.lease('fourth') == []
+        assert queue.counts()['failed'] == 1
+
+
+def test_writer_adds_results_once(tmp_path):
+    added = []
+
+    class Writer(LibraryWriter):
+        def add(self, doc, batch):
+            added.append(doc.doc_id)
+
+    with WorkQueue(str(tmp_path / 'queue.sqlite')) as queue:
+        queue.put(['10.1000/1', '10.1000/2'])
+        FakeWorker(queue, str(tmp_path / 'jobs.log')).run()
+        assert Writer(queue, batch_size=1).run() == 2
+        assert Writer(queue).run() == 0
+        assert added == ['10.1000/1', '10.1000/2']
+        assert queue.counts() == {WRITTEN: 2}
+
+
+def test_writer_retries_then_fails_unwritten_documents(tmp_path, papis_library, monkeypatch):
+    write = PapisBatch._write
+
+    def flaky_write(self, lib_dir, files, data):
+        if data['title'] == '10.1000/2':
+            raise OSError('disk full')
+        return write(self, lib_dir, files, data)
+
+    monkeypatch.setattr(PapisBatch, '_write', flaky_write)
+    with WorkQueue(str(tmp_path / 'queue.sqlite')) as queue:
+        queue.put(['10.1000/1', '10.1000/2'])
+        FakeWorker(queue, str(tmp_path / 'jobs.log')).run()
+        writer = LibraryWriter(queue, library=str(papis_library))
+        assert writer.write() == 1
+        assert queue.counts() == {WRITTEN: 1, DONE: 1}
+        assert writer.run() == 0
+        assert queue.counts() == {WRITTEN: 1, FAILED: 1}
+
+
+def test_worker_fetches_arxiv_metadata_per_lease(tmp_path, stub_server):
+    class Offline(QueueWorker):
+        def process(self, key):
+            doc = self._prefetched.pop(key)
+            assert doc.info['eprint']
+            return doc
+
+    ids = ['1006.314{}'.format(i) for i in range(4)]
+    with WorkQueue(str(tmp_path / 'queue.sqlite')) as queue:
+        queue.put(ids)
+        assert Offline(queue, lease_size=2).run() == {DONE: 4}
+        assert all(doc.info['title'] for _, doc in queue.results())
+    assert stub_server.requests[('arxiv', 200)] == 2
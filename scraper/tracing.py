@@ -0,0 +1,247 @@
+"""Lightweight tracing of the document pipeline
+
+`span` opens a timed span, nested under whichever span is current in the calling context, so a document's
+download, lookups, PDF parsing and Papis add show up as one tree per document.  Finished spans are handed to an
+exporter, which writes either one JSON object per span (JSON Lines) or OTLP/JSON export requests, the format
+read by the OpenTelemetry collector's file receiver.
+
+Tracing is off until an exporter is configured, with `configure` or by setting SCRAPER_TRACE_FILE (and optionally
+SCRAPER_TRACE_FORMAT=otlp) in the environment.  While it is off, `span` returns a shared no-op object, so
+instrumented code pays for one function call and a global lookup.
+
+>>> exporter = MemoryExporter()
+>>> configure(exporter)
+>>> with span('download', doc_id='1006.3140'):
+...     with span('scihub'):
+...         pass
+>>> [(s.name, s.parent_id is None) for s in exporter.spans]
+[('scihub', False), ('download', True)]
+>>> configure(None)
+"""
+
+from __future__ import annotations
+import atexit
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Optional, Any, Dict, List
+
+logger = logging.getLogger()
+
+_current = contextvars.ContextVar("scraper_span", default=None)
+_exporter = None
+
+
+class Span:
+    """
+    A timed operation with attributes.  Use via `span`, as a context manager.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]) -> None:
+        parent = _current.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else "{:032x}".format(random.getrandbits(128))
+        self.span_id = "{:016x}".format(random.getrandbits(64))
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.error = "{}: {}".format(exc_type.__name__, exc)
+        _current.reset(self._token)
+        if (exporter := _exporter) is not None:
+            exporter.export(self)
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_ns / 1e9,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> _NoopSpan:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attributes):
+    """span.
+    Returns a context manager which records a span named `name`, or a no-op if tracing is off
+
+    :param name: Name of the operation (e.g. "Document.download", "crossref.doi")
+    :param attributes: Attributes to attach (e.g. doc_id)
+    """
+    if _exporter is None:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def current_span():
+    return _current.get() or _NOOP
+
+
+class MemoryExporter:
+    """
+    Keeps finished spans in a list (for tests and interactive use)
+    """
+
+    def __init__(self) -> None:
+        self.spans = []
+
+    def export(self, finished: Span) -> None:
+        self.spans.append(finished)
+
+    def shutdown(self) -> None:
+        pass
+
+
+class JsonLinesExporter:
+    """
+    Appends each finished span to a file as one JSON object per line
+    """
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fptr = open(path, "a")
+        self._lock = threading.Lock()
+
+    def export(self, finished: Span) -> None:
+        line = json.dumps(finished.to_dict(), default=str) + "\n"
+        with self._lock:
+            self._fptr.write(line)
+            self._fptr.flush()
+
+    def shutdown(self) -> None:
+        self._fptr.close()
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpJsonExporter:
+    """
+    Writes spans as OTLP/JSON ExportTraceServiceRequest objects, one per line, batching `batch_size` spans per line.
+    The output can be loaded by an OpenTelemetry collector's "otlpjsonfile" receiver.
+    """
+
+    def __init__(self, path: str, service_name: str = "citation-scraper", batch_size: int = 256) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self._fptr = open(path, "a")
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _convert(finished: Span) -> dict:
+        converted = {
+            "traceId": finished.trace_id,
+            "spanId": finished.span_id,
+            "name": finished.name,
+            "kind": 1,
+            "startTimeUnixNano": str(finished.start_ns),
+            "endTimeUnixNano": str(finished.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in finished.attributes.items()],
+            "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+        }
+        if finished.parent_id:
+            converted["parentSpanId"] = finished.parent_id
+        return converted
+
+    def export(self, finished: Span) -> None:
+        with self._lock:
+            self._pending.append(self._convert(finished))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]
+                    },
+                    "scopeSpans": [{"scope": {"name": "scraper"}, "spans": self._pending}],
+                }
+            ]
+        }
+        self._fptr.write(json.dumps(request) + "\n")
+        self._fptr.flush()
+        self._pending = []
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._flush()
+            self._fptr.close()
+
+
+EXPORTERS = {"jsonl": JsonLinesExporter, "otlp": OtlpJsonExporter}
+
+
+def configure(exporter=None) -> None:
+    """configure.
+    Sets the exporter which receives finished spans.  Passing None turns tracing off (and shuts the old exporter down).
+    """
+    global _exporter
+    old, _exporter = _exporter, exporter
+    if old is not None and old is not exporter:
+        old.shutdown()
+
+
+def _shutdown() -> None:
+    configure(None)
+
+
+atexit.register(_shutdown)
+
+if os.environ.get("SCRAPER_TRACE_FILE"):
+    configure(
+        EXPORTERS[os.environ.get("SCRAPER_TRACE_FORMAT", "jsonl")](os.environ["SCRAPER_TRACE_FILE"])
+    )
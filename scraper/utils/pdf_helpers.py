@@ -1,4 +1,302 @@
+"""Single-pass PDF analysis shared by title, DOI, ArXiv ID and reference extraction
+
+`analyze_pdf` opens and lays out a PDF once, and caches the result, so asking for the title, DOI and references of
+the same file only parses it a single time.  Files are cached by device, inode, size and mtime, so a cache lookup
+doesn't read the file; contents passed as bytes (or, on request, files) are cached by the SHA-256 of their contents.
+
+Only a bounded window of pages is laid out (by default the first 2 and the last one), plus the document
+information dictionary and XMP metadata.  Files are memory-mapped and the page tree is descended directly
+to the wanted pages, so the cost of an analysis does not grow with the length of the document.
+"""
+
+from __future__ import annotations
 import doi
+import hashlib
+import io
+import logging
+import mmap
+import os
+import re
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Union, BinaryIO, List, Tuple
+from papis.arxiv import find_arxivid_in_text
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTTextContainer, LTTextLine, LTChar
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+from pdfminer.psparser import LIT
+from pdfminer.utils import decode_text
+from scraper import metrics, tracing
+
+logger = logging.getLogger()
+
+PdfSource = Union[str, bytes, BinaryIO]
+
+reference_heading_regex = re.compile(
+    r"^\s*(?:\d+\.?\s*)?(references|bibliography|works cited|literature cited)\s*$",
+    re.I | re.M,
+)
+
+_cache = OrderedDict()
+CACHE_SIZE = 256
+
+FIRST_PAGES = 2
+LAST_PAGES = 1
+
+LITERAL_PAGES = LIT("Pages")
+INHERITABLE_ATTRS = {"Resources", "MediaBox", "CropBox", "Rotate"}
+
+
+class PdfAnalysis(NamedTuple):
+    """
+    Everything the scraper needs to know about a PDF, extracted in one pass
+
+    Fields
+    ======
+    sha256: Optional[str]
+        Hex digest of the file contents, if it was computed (see `analyze_pdf`)
+
+    title: Optional[str]
+        Title inferred from the largest text on the first page, falling back to the metadata title
+
+    metadata: dict
+        Decoded document information dictionary (Title, Author, ...)
+
+    first_page: str
+        Laid-out text of the first page
+
+    page_count: int
+        Number of pages in the document (only some of which were laid out)
+
+    dois, arxiv_ids: List[str]
+        Candidate identifiers, in order of appearance (metadata first, then page text)
+
+    references: Optional[str]
+        Text following the last "References"/"Bibliography" heading within the page window, if any
+    """
+
+    sha256: Optional[str]
+    title: Optional[str]
+    metadata: dict
+    first_page: str
+    page_count: int
+    dois: List[str]
+    arxiv_ids: List[str]
+    references: Optional[str]
+
+    @property
+    def doi(self) -> Optional[str]:
+        return self.dois[0] if self.dois else None
+
+    @property
+    def arxiv_id(self) -> Optional[str]:
+        return self.arxiv_ids[0] if self.arxiv_ids else None
+
+
+def _open(source: PdfSource):
+    """
+    Returns a seekable buffer over the PDF, memory-mapping it when it is a real file
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if isinstance(source, str):
+        with open(source, "rb") as fptr:
+            if os.fstat(fptr.fileno()).st_size == 0:
+                # Empty files can't be memory-mapped
+                return io.BytesIO()
+            return mmap.mmap(fptr.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return io.BytesIO(source.read())
+
+
+def _file_key(source: PdfSource) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Returns the (device, inode, size, mtime) of a path or real file, or None for other sources
+    """
+    try:
+        stat = os.stat(source) if isinstance(source, str) else os.fstat(source.fileno())
+    except (AttributeError, OSError, ValueError, TypeError, io.UnsupportedOperation):
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _hash(buffer) -> str:
+    if isinstance(buffer, io.BytesIO):
+        with buffer.getbuffer() as view:
+            return hashlib.sha256(view).hexdigest()
+    return hashlib.sha256(buffer).hexdigest()
+
+
+def _decode(value) -> Optional[str]:
+    value = resolve1(value)
+    if isinstance(value, bytes):
+        return decode_text(value)
+    return value if isinstance(value, str) else None
+
+
+def _get_metadata(document: PDFDocument) -> dict:
+    metadata = {}
+    for info in document.info:
+        metadata.update(
+            {key: val for key, raw in info.items() if (val := _decode(raw)) is not None}
+        )
+    if (stream := resolve1(document.catalog.get("Metadata"))) is not None:
+        try:
+            metadata["XMP"] = stream.get_data().decode("utf-8", errors="ignore")
+        except Exception as e:
+            logger.debug("Failed to read XMP metadata.  Exception: %s", e)
+    return metadata
+
+
+def _get_title_from_layout(layout) -> Optional[str]:
+    """
+    Joins the text lines set in the largest font on the page (the same heuristic pdftitle uses)
+    """
+    lines = []
+    for element in layout:
+        if not isinstance(element, LTTextContainer):
+            continue
+        for line in element:
+            if not isinstance(line, LTTextLine):
+                continue
+            sizes = [round(c.size, 1) for c in line if isinstance(c, LTChar)]
+            if sizes and (text := line.get_text().strip()):
+                lines.append((max(sizes), text))
+    if not lines:
+        return None
+    largest = max(size for size, _ in lines)
+    return " ".join(text for size, text in lines if size == largest) or None
+
+
+def _find_all(finder, texts) -> List[str]:
+    found = []
+    for text in texts:
+        for line in text.splitlines():
+            if (match := finder(line)) and match not in found:
+                found.append(match)
+    return found
+
+
+def _get_references(text: str) -> Optional[str]:
+    headings = list(reference_heading_regex.finditer(text))
+    return (text[headings[-1].end() :].strip() or None) if headings else None
+
+
+def _get_page(document: PDFDocument, index: int) -> PDFPage:
+    """
+    Descends the page tree straight to the page at `index`, using each node's /Count to skip whole subtrees
+    """
+    ref = document.catalog["Pages"]
+    attrs = {}
+    while True:
+        node = resolve1(ref)
+        attrs = {k: v for k, v in attrs.items() if k not in node} | dict(node)
+        if node.get("Type") is not LITERAL_PAGES:
+            return PDFPage(document, getattr(ref, "objid", None), attrs, None)
+        for kid in resolve1(node["Kids"]):
+            kid_node = resolve1(kid)
+            count = resolve1(kid_node.get("Count", 1)) if kid_node.get("Type") is LITERAL_PAGES else 1
+            if index < count:
+                ref = kid
+                break
+            index -= count
+        else:
+            raise IndexError("Page tree is shorter than its /Count")
+        attrs = {k: v for k, v in attrs.items() if k in INHERITABLE_ATTRS}
+
+
+def _get_window(document: PDFDocument, first_pages: int, last_pages: int) -> Tuple[int, List[PDFPage]]:
+    try:
+        count = resolve1(resolve1(document.catalog["Pages"])["Count"])
+        indices = sorted({*range(min(first_pages, count)), *range(max(count - last_pages, 0), count)})
+        return count, [_get_page(document, i) for i in indices]
+    except Exception as e:
+        # Malformed page trees: fall back to enumerating every page object
+        logger.debug("Falling back to full page enumeration.  Exception: %s", e)
+        pages = list(PDFPage.create_pages(document))
+        count = len(pages)
+        keep = sorted({*range(min(first_pages, count)), *range(max(count - last_pages, 0), count)})
+        return count, [pages[i] for i in keep]
+
+
+def _analyze(buffer, sha256: Optional[str], first_pages: int, last_pages: int) -> PdfAnalysis:
+    document = PDFDocument(PDFParser(buffer))
+    metadata = _get_metadata(document)
+    resource_manager = PDFResourceManager()
+    device = PDFPageAggregator(resource_manager, laparams=LAParams())
+    interpreter = PDFPageInterpreter(resource_manager, device)
+    title, pages = None, []
+    page_count, window = _get_window(document, first_pages, last_pages)
+    for page in window:
+        interpreter.process_page(page)
+        layout = device.get_result()
+        if not pages:
+            title = _get_title_from_layout(layout)
+        pages.append(
+            "".join(el.get_text() for el in layout if isinstance(el, LTTextContainer))
+        )
+    texts = [str(val) for val in metadata.values()] + pages
+    return PdfAnalysis(
+        sha256=sha256,
+        title=title or metadata.get("Title") or None,
+        metadata=metadata,
+        first_page=pages[0] if pages else "",
+        page_count=page_count,
+        dois=_find_all(doi.find_doi_in_text, texts),
+        arxiv_ids=_find_all(find_arxivid_in_text, texts),
+        references=_get_references("\n".join(pages)),
+    )
+
+
+def analyze_pdf(
+    source: PdfSource, first_pages: int = FIRST_PAGES, last_pages: int = LAST_PAGES, content_hash: bool = False
+) -> PdfAnalysis:
+    """analyze_pdf.
+    Parses a PDF once and extracts its title, metadata, first-page text, DOI / ArXiv ID candidates and reference section.
+    Results are cached, so repeated calls for the same file are free.
+
+    :param source: Path of the PDF, its contents as bytes, or a binary file object
+    :kw first_pages: (Optional) Number of leading pages to lay out (default = FIRST_PAGES)
+    :kw last_pages: (Optional) Number of trailing pages to lay out (default = LAST_PAGES).  Raise this to capture long reference sections.
+    :kw content_hash: (Optional) Whether to cache files by the SHA-256 of their contents rather than by inode, size and
+        mtime, so copies of a file under other names share an analysis (default = False).  Reads the whole file.
+    """
+    buffer = _open(source)
+    try:
+        file_key = None if content_hash else _file_key(source)
+        sha256 = None if file_key else _hash(buffer)
+        key = (file_key or sha256, first_pages, last_pages)
+        if (cached := _cache.get(key)) is not None:
+            _cache.move_to_end(key)
+            metrics.pdf_cache.inc(result="hit")
+            return cached
+        metrics.pdf_cache.inc(result="miss")
+        with metrics.track("pdf_parse"), tracing.span("pdf.analyze", sha256=sha256):
+            analysis = _cache[key] = _analyze(buffer, sha256, first_pages, last_pages)
+    finally:
+        buffer.close()
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return analysis
+
 
 def get_validated_doi_from_pdf(fpath):
-    return doi.pdf_to_doi(fpath)
+    return analyze_pdf(fpath).doi
+
+
+def get_arxivid_from_pdf(fpath):
+    return analyze_pdf(fpath).arxiv_id
+
+
+def get_references_from_pdf(fpath):
+    """get_references_from_pdf.
+    Returns the raw text of a PDF's reference section (suitable for `scraper.apis.refextract.search_for_refs`), or None if no such section is found
+
+    :param fpath: Path of the PDF
+    """
+    return analyze_pdf(fpath).references
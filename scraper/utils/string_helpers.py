@@ -1,7 +1,7 @@
 import time, re
-import pdftitle
 import logging
 from ..parsing import validate_and_parse_url
+from .pdf_helpers import analyze_pdf
 
 logger = logging.getLogger()
 
@@ -64,8 +64,9 @@ def clean_string(string, default_replacement='_', replacements={}, **kwargs):
 def get_title_as_filename(file_id, extension='pdf', **kwargs):
     """
     Attempts to create a filename out of the title of the PDF.  Uses f'paper_{datetime}.pdf' as a fallback in case this fails.  If a valid path is not provided, simply returns a sanitized version of the passed string.
+    The title comes from `analyze_pdf`, so the PDF is not parsed again when its DOI or references are also needed.
 
-    :param pdf: File pointer, path, or string to format as a path
+    :param pdf: File pointer, path, PDF contents, or string to format as a path
     :param extension: (Optional) Extension to append to filename (default = 'pdf')
     :param kwargs: Dictionary of characters to replace during path sanitation.  See `sanitize_filename` for details.
 
@@ -83,12 +84,10 @@ def get_title_as_filename(file_id, extension='pdf', **kwargs):
     }}}
     """
     try:
-        name = pdftitle.get_title_from_file(file_id)
-    except TypeError:
-        name = pdftitle.get_title_from_io(file_id)
+        name = analyze_pdf(file_id).title
     except FileNotFoundError:
         return sanitize_filename(file_id)
     except Exception as e:
-        logger.warning('Failed to get title of PDF file "%s".  Exception: %s', file_id[:100], e)
-        name = f'paper_{get_datetime_string()}.pdf'
-    return sanitize_filename(name, extension=extension)
+        logger.warning('Failed to get title of PDF file "%s".  Exception: %s', str(file_id)[:100], e)
+        name = None
+    return sanitize_filename(name or f'paper_{get_datetime_string()}.pdf', extension=extension)